@@ -0,0 +1,93 @@
+"""
+Замер стоимости обработки одного события state_changed сущностью (fill_by_ha_state).
+
+Сравниваются прежняя реализация (полная глубокая копия атрибутов HA) и текущая (только атрибуты
+из ATTRIBUTES_SCHEMA). Выводится время на событие и объем памяти, удерживаемой сущностью после события.
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_fill_by_ha_state.py [--events N]
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from devices.base_entity import BaseEntity  # noqa: E402
+from devices.light import LightEntity  # noqa: E402
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "devices" / "lights" / "ha_states_light.json"
+
+
+def legacy_fill_by_ha_state(self, ha_entity_state):
+    """Прежняя реализация BaseEntity.fill_by_ha_state"""
+    self.state = ha_entity_state.get("state")
+    self.attributes = copy.deepcopy(ha_entity_state.get("attributes", {}))
+    self.is_filled_by_state = True
+    self._attributes_version += 1
+
+
+def make_events(count):
+    """События группы светильников с "болтливыми" атрибутами, как у медиаплееров и счетчиков"""
+    with open(DATA_PATH, encoding="utf-8") as file:
+        base_state = json.load(file)[0]
+    base_state["attributes"]["effect_list"] = [f"effect_{i}" for i in range(40)]
+    base_state["attributes"]["power_history"] = [{"ts": i, "value": i * 1.5} for i in range(20)]
+    events = []
+    for i in range(count):
+        state = json.loads(json.dumps(base_state))
+        state["state"] = "on"
+        state["attributes"]["brightness"] = i % 256
+        events.append(state)
+    return events
+
+
+def measure(entity, events):
+    started = time.perf_counter()
+    for state in events:
+        entity.fill_by_ha_state(state)
+    elapsed = time.perf_counter() - started
+
+    # Память, удерживаемая сущностью после события: событие разбирается из json (как кадр websocket)
+    # и после обработки отбрасывается, а все, на что ссылается сущность, сохраняется - так в замер
+    # попадают и объекты события, которые сущность не дает освободить
+    frames = [json.dumps(state) for state in events[:1000]]
+    holders = []
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for frame in frames:
+        entity.fill_by_ha_state(json.loads(frame))
+        holders.append(dict(vars(entity)))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / len(events) * 1e6, (after - before) / len(holders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    entity = LightEntity({"entity_id": "light.liustra_sp", "name": "Люстра"})
+
+    current_fill = BaseEntity.fill_by_ha_state
+    BaseEntity.fill_by_ha_state = legacy_fill_by_ha_state
+    try:
+        legacy_us, legacy_bytes = measure(entity, events)
+    finally:
+        BaseEntity.fill_by_ha_state = current_fill
+    current_us, current_bytes = measure(entity, events)
+
+    print(f"{'':12}{'мкс/событие':>14}{'байт/событие':>16}")
+    print(f"{'deepcopy':12}{legacy_us:14.2f}{legacy_bytes:16.0f}")
+    print(f"{'schema':12}{current_us:14.2f}{current_bytes:16.0f}")
+    print(f"Ускорение: {legacy_us / current_us:.1f}x, памяти меньше в {legacy_bytes / max(current_bytes, 1):.1f} раз")
+
+
+if __name__ == "__main__":
+    main()
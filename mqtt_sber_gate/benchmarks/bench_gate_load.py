@@ -0,0 +1,182 @@
+"""
+Нагрузочный тест шлюза целиком: настоящий sber-gate.py в отдельном процессе, подключенный
+к заменителям HA (websocket) и брокера MQTT Сбера (tests/fakes), без доступа к сети.
+
+HA создает --entities светильников и меняет их яркость с частотой --rate событий в секунду
+в течение --duration секунд. Параллельно брокер от имени Сбера отправляет --commands команд
+в секунду для отдельной группы сущностей (не участвующих в событиях). Замеряются:
+- запуск - от старта процесса до подписки на топики Сбера и на изменения всех сущностей HA;
+- событие -> /up/status - от изменения состояния в HA до публикации состояния сущности в Сбер;
+- команда -> HA - от команды Сбера до вызова call_service в HA;
+- команда -> /up/status - полный круг: команда, call_service, событие HA, публикация состояния.
+Для задержек выводятся p50/p90/p99/max в мс, для шлюза - пиковый RSS процесса.
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_gate_load.py [--entities N] [--rate M] [--duration S] [--commands C]
+"""
+
+import argparse
+import json
+import math
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "tests"))
+
+from fakes.fake_ha import FakeHomeAssistant  # noqa: E402
+from fakes.fake_mqtt_broker import FakeMqttBroker  # noqa: E402
+from fakes.gate_process import GateProcess, SBER_LOGIN, SBER_PASSWORD, SBER_ROOT_TOPIC, wait_until  # noqa: E402
+
+
+def percentile(sorted_values, q):
+    """Точный перцентиль (по ближайшему рангу)"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))]
+
+
+class LatencyProbe:
+    """Сопоставляет изменения в HA и команды Сбера с публикациями шлюза"""
+
+    def __init__(self, ha, broker):
+        self._lock = threading.Lock()
+        self.event_pending = {}    # entity_id -> время первого неопубликованного изменения
+        self.command_pending = {}  # entity_id -> время отправки команды, до call_service
+        self.command_called = {}   # entity_id -> время отправки команды, до публикации состояния
+        self.event_ms = []
+        self.command_ha_ms = []
+        self.command_round_trip_ms = []
+        self.status_messages = 0
+        self.command_entities = set()
+        ha.on_state_changed = self.on_state_changed
+        ha.on_service_call = self.on_service_call
+        broker.on_publish = self.on_publish
+
+    def on_state_changed(self, entity_id, new_state):
+        if entity_id in self.command_entities:
+            return
+        with self._lock:
+            self.event_pending.setdefault(entity_id, time.perf_counter())
+
+    def send_command(self, broker, entity_id, on):
+        with self._lock:
+            self.command_pending[entity_id] = time.perf_counter()
+        broker.publish(SBER_ROOT_TOPIC + "/down/commands", json.dumps({"devices": {entity_id: {"states": [
+            {"key": "on_off", "value": {"type": "BOOL", "bool_value": on}}]}}}))
+
+    def on_service_call(self, domain, service, entity_id, service_data):
+        now = time.perf_counter()
+        with self._lock:
+            sent = self.command_pending.pop(entity_id, None)
+            if sent is not None:
+                self.command_ha_ms.append((now - sent) * 1000)
+                self.command_called[entity_id] = sent
+
+    def on_publish(self, topic, payload):
+        if not topic.endswith("/up/status"):
+            return
+        now = time.perf_counter()
+        entity_ids = json.loads(payload).get("devices", {}).keys()
+        with self._lock:
+            self.status_messages += 1
+            for entity_id in entity_ids:
+                changed = self.event_pending.pop(entity_id, None)
+                if changed is not None:
+                    self.event_ms.append((now - changed) * 1000)
+                sent = self.command_called.pop(entity_id, None)
+                if sent is not None:
+                    self.command_round_trip_ms.append((now - sent) * 1000)
+
+    def pending(self):
+        with self._lock:
+            return len(self.event_pending) + len(self.command_pending) + len(self.command_called)
+
+
+def send_commands(probe, broker, entity_ids, rate, duration):
+    started = time.monotonic()
+    count = 0
+    while time.monotonic() - started < duration:
+        delay = started + count / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        probe.send_command(broker, entity_ids[count % len(entity_ids)], count // len(entity_ids) % 2 == 0)
+        count += 1
+    return count
+
+
+def print_latency(title, values):
+    values = sorted(values)
+    if not values:
+        print(f"  {title:24}{'нет данных':>10}")
+        return
+    p50, p90, p99 = (percentile(values, q) for q in (50, 90, 99))
+    print(f"  {title:24}{len(values):8}{p50:10.2f}{p90:10.2f}{p99:10.2f}{values[-1]:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200, help="Событий HA в секунду")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность нагрузки, секунды")
+    parser.add_argument("--commands", type=float, default=5, help="Команд Сбера в секунду")
+    parser.add_argument("--runtime", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--subscription", choices=("entities", "all"), default="entities", help="ha-event_subscription")
+    parser.add_argument("--window-ms", type=int, help="state_publish_window_ms")
+    args = parser.parse_args()
+
+    ha = FakeHomeAssistant(args.entities)
+    broker = FakeMqttBroker(SBER_LOGIN, SBER_PASSWORD)
+    probe = LatencyProbe(ha, broker)
+    # Команды отправляются для последних сущностей, события генерируются для остальных
+    command_count = max(1, min(args.entities // 10, 50)) if args.commands > 0 else 0
+    command_entities = ha.entity_ids[len(ha.entity_ids) - command_count:]
+    probe.command_entities = set(command_entities)
+    event_entities = ha.entity_ids[:len(ha.entity_ids) - command_count]
+    options = {"runtime_mode": args.runtime, "ha-event_subscription": args.subscription, "log_level": "WARNING"}
+    if args.window_ms is not None:
+        options["state_publish_window_ms"] = args.window_ms
+
+    ha.start()
+    broker.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        gate = GateProcess(workdir, ha, broker, options)
+        gate.start()
+        try:
+            startup = gate.wait_ready()
+            if startup is None:
+                print("Шлюз не запустился, журнал:\n" + gate.log()[-5000:])
+                return
+            print(f"сущностей: {args.entities}, событий/с: {args.rate:g}, команд/с: {args.commands:g}, "
+                  f"режим: {args.runtime}, подписка: {args.subscription}")
+            print(f"запуск: {startup * 1000:.0f} мс")
+
+            commands_sent = []
+            commands = threading.Thread(target=lambda: commands_sent.append(
+                send_commands(probe, broker, command_entities, args.commands, args.duration) if command_count else 0))
+            started = time.monotonic()
+            commands.start()
+            events = ha.generate_events(args.rate, args.duration, event_entities)
+            commands.join()
+            elapsed = time.monotonic() - started
+            drained = wait_until(lambda: probe.pending() == 0, 10)
+
+            print(f"событий HA: {events} ({events / elapsed:.0f}/с), команд Сбера: {commands_sent[0]}, "
+                  f"публикаций /up/status: {probe.status_messages}"
+                  + ("" if drained else f", без ответа: {probe.pending()}"))
+            rss = gate.peak_rss_mb()
+            if rss is not None:
+                print(f"пиковый RSS шлюза: {rss:.1f} МБ")
+            print(f"  {'задержка':24}{'кол-во':>8}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+            print_latency("событие -> /up/status", probe.event_ms)
+            print_latency("команда -> HA", probe.command_ha_ms)
+            print_latency("команда -> /up/status", probe.command_round_trip_ms)
+        finally:
+            gate.stop()
+            ha.stop()
+            broker.stop()
+
+
+if __name__ == "__main__":
+    main()
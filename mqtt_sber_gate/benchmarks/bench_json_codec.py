@@ -0,0 +1,92 @@
+"""
+Замер скорости кодирования и разбора json для каждого установленного бэкенда json_codec.
+
+Полезные нагрузки строятся из записанных данных (tests/data/devices):
+- states - документ /up/status со состояниями всех сущностей из states.json;
+- config - документ /up/config с описаниями устройств (по образцу light_sber.json);
+- ha_event - кадры state_changed от HA (только разбор).
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_json_codec.py [--rounds N]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from json_codec import available_backends, create_codec  # noqa: E402
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "devices"
+
+
+def load(name):
+    with open(DATA_PATH / name, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def make_payloads():
+    states = load("states.json")
+    device_config = load("light_sber.json")
+
+    devices_states = {}
+    devices_config = []
+    for state in states:
+        entity_id = state["entity_id"]
+        devices_states[entity_id] = {"states": [
+            {"key": "online", "value": {"type": "BOOL", "bool_value": True}},
+            {"key": "on_off", "value": {"type": "BOOL", "bool_value": state["state"] == "on"}},
+            {"key": "light_brightness", "value": {"type": "INTEGER", "integer_value": "500"}},
+        ]}
+        config = dict(device_config, id=entity_id, description=state["attributes"].get("friendly_name", entity_id))
+        devices_config.append(config)
+
+    ha_events = [json.dumps({
+        "id": 1,
+        "type": "event",
+        "event": {"event_type": "state_changed", "data": {"entity_id": state["entity_id"], "old_state": state, "new_state": state}},
+    }) for state in states]
+
+    return {
+        "states": {"devices": devices_states},
+        "config": {"devices": devices_config},
+    }, ha_events
+
+
+def measure(func, items, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - started) / (rounds * len(items)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads, ha_events = make_payloads()
+    reference = create_codec("json")
+    for name, payload in payloads.items():
+        print(f"{name}: {len(reference.dumps(payload))} байт")
+    print(f"ha_event: {len(ha_events)} кадров, средний размер {sum(map(len, ha_events)) / len(ha_events):.0f} байт")
+    print()
+
+    print(f"{'бэкенд':10}{'states dumps':>14}{'states loads':>14}{'config dumps':>14}{'config loads':>14}{'ha_event loads':>16}  (мкс)")
+    for name in available_backends():
+        codec = create_codec(name)
+        row = []
+        for payload in payloads.values():
+            encoded = codec.dumps(payload)
+            assert codec.loads(encoded) == reference.loads(reference.dumps(payload))
+            row.append(measure(codec.dumps, [payload], args.rounds))
+            row.append(measure(codec.loads, [encoded], args.rounds))
+        event_us = measure(codec.loads, ha_events, max(1, args.rounds // 10))
+        print(f"{name:10}" + "".join(f"{value:14.1f}" for value in row) + f"{event_us:16.2f}")
+
+
+if __name__ == "__main__":
+    main()
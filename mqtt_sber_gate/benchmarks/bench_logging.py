@@ -0,0 +1,86 @@
+"""
+Замер пропускной способности журналирования в горячем пути обработки событий HA.
+
+Для каждого события пишутся те же сообщения, что и при обработке state_changed:
+отладочное сообщение о кадре websocket и информационное о публикации состояния.
+Сравниваются:
+- sync - синхронная запись в файл, сообщения собираются f-строками (как было раньше);
+- queue - QueueLogging: очередь и поток записи, %-форматирование, прореживание (log_sample_rate);
+- queue-nosample - QueueLogging без прореживания.
+Для каждого варианта замер выполняется при уровне журнала INFO и DEBUG. Событий в секунду
+считается по рабочему потоку; drain - время записи оставшейся очереди после последнего события.
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_logging.py [--events N]
+"""
+
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from log_queue import QueueLogging, DEFAULT_SAMPLE_RATE  # noqa: E402
+
+FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+NEW_STATE = {"entity_id": "light.room", "state": "on", "attributes": {"brightness": 128, "color_mode": "hs", "hs_color": [30.0, 70.0]}}
+
+
+def events_eager(log, count):
+    for i in range(count):
+        entity_id = f"light.room_{i % 50}"
+        log.debug(f"WebSocket: Received message state_changed for {entity_id}: {NEW_STATE}")
+        log.info(f"(_process_event) Publishing device {entity_id}")
+
+
+def events_lazy(log, count):
+    for i in range(count):
+        entity_id = f"light.room_{i % 50}"
+        log.debug("WebSocket: Received message %s for %s: %s", "state_changed", entity_id, NEW_STATE)
+        log.info("(_process_event) Publishing device %s", entity_id)
+
+
+def run(variant, level, count, log_dir):
+    log = logging.getLogger(f"bench.{variant}.{logging.getLevelName(level)}")
+    log.propagate = False
+    log.setLevel(level)
+    handler = logging.FileHandler(Path(log_dir) / f"{variant}.log", mode="w")
+    handler.setFormatter(logging.Formatter(FORMAT))
+
+    logs = None
+    if variant == "sync":
+        log.addHandler(handler)
+        produce = events_eager
+    else:
+        logs = QueueLogging([handler], queue_size=count * 2 + 1, sample_rate=DEFAULT_SAMPLE_RATE if variant == "queue" else 0)
+        logs.start(log)
+        produce = events_lazy
+
+    started = time.perf_counter()
+    produce(log, count)
+    produced = time.perf_counter() - started
+    if logs is not None:
+        logs.stop()
+    drained = time.perf_counter() - started - produced
+    log.removeHandler(handler)
+    handler.close()
+    return count / produced, drained * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'вариант':16}{'уровень':>8}{'событий/с':>14}{'drain, мс':>12}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for level in (logging.INFO, logging.DEBUG):
+            for variant in ("sync", "queue", "queue-nosample"):
+                rate, drain_ms = run(variant, level, args.events, log_dir)
+                print(f"{variant:16}{logging.getLevelName(level):>8}{rate:14.0f}{drain_ms:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Замер стоимости метрик в горячем пути и выдачи /metrics.
+
+- inc/observe - стоимость одного увеличения счетчика и наблюдения гистограммы;
+- on_message - обработка кадра state_changed в WebSocketHandler (с метриками);
+- render - формирование ответа /metrics для набора метрик, как у запущенного шлюза.
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_metrics.py [--rounds N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from metrics import MetricsRegistry  # noqa: E402
+from web_socket_handler import WebSocketHandler  # noqa: E402
+
+OPTIONS = {
+    'ha-api_url': "http://ha:8123",
+    'ha-api_token': "token",
+    'sber-http_api_endpoint': "",
+    'sber-mqtt_login': "user",
+    'sber-mqtt_password': "password",
+    'sber-mqtt_broker': "broker",
+    'ha-event_subscription': "all",
+}
+
+
+class Entity:
+    def process_state_change(self, old_state, new_state):
+        pass
+
+
+class DevicesDb:
+    def __init__(self):
+        self.entities_store = self
+        self.DB = {}
+        self.entity = Entity()
+
+    def get(self, entity_id):
+        return self.entity
+
+
+class Publisher:
+    def mark_dirty(self, entity_id):
+        pass
+
+
+def measure_ns(func, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - started) / rounds * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "События")
+    labeled = registry.counter("labeled_total", "События", ("result",)).labels("processed")
+    histogram = registry.histogram("latency_milliseconds", "Задержка")
+    print(f"counter.inc:        {measure_ns(counter.inc, args.rounds):8.0f} нс")
+    print(f"labels(...).inc:    {measure_ns(labeled.inc, args.rounds):8.0f} нс")
+    print(f"histogram.observe:  {measure_ns(lambda: histogram.observe(3.7), args.rounds):8.0f} нс")
+
+    state = {"entity_id": "light.room", "state": "on", "attributes": {"brightness": 128}}
+    message = json.dumps({"id": 1, "type": "event", "event": {
+        "event_type": "state_changed", "data": {"entity_id": "light.room", "old_state": state, "new_state": state}}})
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            handler = WebSocketHandler(DevicesDb(), None, None, OPTIONS, Publisher(), metrics=registry)
+            rounds = args.rounds // 10
+            print(f"on_message:         {measure_ns(lambda: handler.on_message(None, message), rounds) / 1000:8.2f} мкс")
+        finally:
+            os.chdir(cwd)
+
+    for i in range(50):
+        registry.counter(f"extra_{i}_total", "Дополнительный счетчик").inc()
+    print(f"render:             {measure_ns(registry.render, 1000) / 1000:8.1f} мкс, {len(registry.render())} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Воспроизведение трафика HA и Сбера через обработчики шлюза.
+
+Источник трафика:
+- --traffic FILE - запись шлюза (настройка traffic_record, файл traffic.jsonl.gz);
+- --snapshots DIR - снимки реестров HA, которые шлюз сохраняет в своем каталоге (ha_area.json,
+  device_registry.json, entity_registry.json, states_registry.json); к ним добавляются
+  сгенерированные события state_changed и сообщения Сбера;
+- без параметров - то же, но реестры берутся из тестовых данных (tests/data/devices).
+
+Кадры HA передаются в WebSocketHandler.on_message, сообщения Сбера - в обработчики
+SberMqttHandlers (как их вызывает клиент MQTT). База устройств и публикатор состояний настоящие,
+websocket и MQTT заменены заглушками; команды Сбера выполняются сразу, без пула обработчиков.
+После каждого кадра HA публикуются накопленные состояния (StatePublisher.flush).
+
+Для каждой скорости (1x, 10x, max - без пауз) выводятся: записей в секунду, задержки этапов
+(p50/p90/p99, мс) и пиковая память: по tracemalloc (--tracemalloc, замедляет обработку)
+или пиковый RSS процесса.
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_replay.py [--traffic FILE | --snapshots DIR] [--speeds 1,10,max] [--events N]
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from command_dispatcher import CommandDispatcher  # noqa: E402
+from devices_db import CDevicesDB, json_read  # noqa: E402
+from devices.devices_converter import DevicesConverter  # noqa: E402
+from sber_mqtt_handlers import SberMqttHandlers  # noqa: E402
+from state_publisher import StatePublisher  # noqa: E402
+from traffic_recorder import read_traffic, SOURCE_HA, SOURCE_SBER  # noqa: E402
+from web_socket_handler import WebSocketHandler  # noqa: E402
+
+TEST_DATA = Path(__file__).parent.parent / "tests" / "data" / "devices"
+SBER_ROOT_TOPIC = "sberdevices/v1/user"
+OPTIONS = {
+    'ha-api_url': "http://ha:8123",
+    'ha-api_token': "token",
+    'sber-http_api_endpoint': "",
+    'sber-mqtt_login': "user",
+    'sber-mqtt_password': "password",
+    'sber-mqtt_broker': "broker",
+}
+# Домены, сущности которых шлюз передает в Сбер
+EXPOSED_DOMAINS = ("light", "cover")
+# Интервал между сгенерированными событиями HA при скорости 1x
+EVENT_INTERVAL_MS = 2
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += 1
+
+
+class FakeMqttClient:
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+
+    def is_connected(self):
+        return True
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+        self.qos = 0
+
+
+class InlineExecutor:
+    """Выполняет команду Сбера сразу в вызывающем потоке - ее время входит в этап sber_commands"""
+
+    def submit(self, key, func, *args, received_at=None):
+        func(*args)
+        return True
+
+
+def registry_result(data):
+    """Снимок реестра: кадр result целиком или только список"""
+    return data.get("result", []) if isinstance(data, dict) else data
+
+
+def load_registries(snapshots_dir=None):
+    if snapshots_dir is None:
+        paths = (TEST_DATA / "ha_area.json", TEST_DATA / "device_registry.json",
+                 TEST_DATA / "lights" / "ha_entities_light.json", TEST_DATA / "states.json")
+    else:
+        directory = Path(snapshots_dir)
+        paths = (directory / "ha_area.json", directory / "device_registry.json",
+                 directory / "entity_registry.json", directory / "states_registry.json")
+    return [registry_result(json_read(str(path), [])) for path in paths]
+
+
+def synthetic_traffic(areas, devices, entities, states, events):
+    """
+    Трафик подключения к HA с загрузкой реестров, затем события state_changed и сообщения Сбера:
+    запрос конфигурации, запросы состояний (каждое 10-е событие) и команды (каждое 25-е событие)
+    """
+    frame = lambda data: json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    records = [
+        (0, SOURCE_HA, None, frame({"type": "auth_required", "ha_version": "2025.9.0"})),
+        (1, SOURCE_HA, None, frame({"type": "auth_ok", "ha_version": "2025.9.0"})),
+    ]
+    for message_id, result in ((2, areas), (3, devices), (4, entities), (5, states)):
+        records.append((2, SOURCE_HA, None, frame({"id": message_id, "type": "result", "success": True, "result": result})))
+    down = SBER_ROOT_TOPIC + "/down"
+    records.append((3, SOURCE_SBER, down + "/config_request", ""))
+
+    rng = random.Random(1)
+    exposed = [s for s in states if s["entity_id"].split(".")[0] in EXPOSED_DOMAINS]
+    other = [s for s in states if s["entity_id"].split(".")[0] not in EXPOSED_DOMAINS]
+    current = {s["entity_id"]: s for s in states}
+    for i in range(events):
+        t_ms = 10 + i * EVENT_INTERVAL_MS
+        old_state = current[rng.choice(exposed if i % 5 else other)["entity_id"]]
+        new_state = dict(old_state, state="off" if old_state["state"] == "on" else "on",
+                         last_changed=f"2025-09-01T00:00:{i % 60:02d}+00:00")
+        current[new_state["entity_id"]] = new_state
+        records.append((t_ms, SOURCE_HA, None, frame({"id": 1, "type": "event", "event": {
+            "event_type": "state_changed",
+            "data": {"entity_id": new_state["entity_id"], "old_state": old_state, "new_state": new_state}}})))
+        if i % 10 == 9:
+            records.append((t_ms, SOURCE_SBER, down + "/status_request", frame({"devices": []})))
+        if i % 25 == 24:
+            entity_id = rng.choice(exposed)["entity_id"]
+            records.append((t_ms, SOURCE_SBER, down + "/commands", frame({"devices": {entity_id: {"states": [
+                {"key": "on_off", "value": {"type": "BOOL", "bool_value": i % 2 == 0}}]}}})))
+    return records
+
+
+class ReplayGate:
+    """Обработчики шлюза с заглушками вместо соединений"""
+
+    def __init__(self):
+        logger = logging.getLogger("bench_replay")
+        self.devices_db = CDevicesDB("devices.json", logger, "bench")
+        self.mqttc = FakeMqttClient()
+        self.ws = FakeWebSocket()
+        self.publisher = StatePublisher(self.devices_db, self.mqttc, SBER_ROOT_TOPIC)
+        self.ws_handler = WebSocketHandler(self.devices_db, DevicesConverter(self.devices_db, logger), self.mqttc, OPTIONS, self.publisher)
+        self.ws_handler.ws = self.ws
+        self.devices_db.add_exposure_listener(self.ws_handler.on_exposure_changed)
+        self.devices_db.call_when_ready(self.expose_entities)
+        commands = CommandDispatcher(self.ws_handler, None)
+        sber = SberMqttHandlers(self.devices_db, commands, InlineExecutor(), SBER_ROOT_TOPIC)
+        # Обработчики по окончанию топика: в записи шлюза корневой топик содержит логин пользователя
+        self.sber_callbacks = {topic.rsplit("/down/", 1)[1]: callback for topic, callback in sber.callbacks().items()}
+
+    def expose_entities(self):
+        store = self.devices_db.entities_store
+        for domain in EXPOSED_DOMAINS:
+            for entity_id in store.get_by_domain(domain):
+                # Сущности без состояния в get_states в Сбер не передаются - их описание не собрать
+                if store.get(entity_id).is_filled_by_state:
+                    store.enable_entity(entity_id)
+
+    def ha_frame(self, frame):
+        self.ws_handler.on_message(None, frame)
+
+    def sber_stage(self, topic):
+        suffix = topic.rsplit("/down/", 1)[-1] if "/down/" in topic else None
+        return f"sber_{suffix}" if suffix in self.sber_callbacks else None
+
+    def sber_message(self, topic, payload):
+        self.sber_callbacks[topic.rsplit("/down/", 1)[1]](self.mqttc, None, FakeMessage(topic, payload))
+
+
+def percentile(sorted_values, q):
+    """Точный перцентиль (по ближайшему рангу)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux - килобайты, macOS - байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def replay(records, speed, trace_memory):
+    """Воспроизводит записи со скоростью speed (None - без пауз). Возвращает результаты замера"""
+    if trace_memory:
+        tracemalloc.start()
+    gate = ReplayGate()
+    stages = {}
+    started = time.perf_counter()
+    first_ms = records[0][0] if records else 0
+    for t_ms, source, topic, data in records:
+        if speed is not None:
+            delay = started + (t_ms - first_ms) / 1000 / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if source == SOURCE_HA:
+            stage, call, args = "ha_frame", gate.ha_frame, (data,)
+        else:
+            stage = gate.sber_stage(topic)
+            if stage is None:
+                continue
+            call, args = gate.sber_message, (topic, data)
+        frame_started = time.perf_counter()
+        call(*args)
+        stages.setdefault(stage, []).append(time.perf_counter() - frame_started)
+        if source == SOURCE_HA and gate.publisher.pending_count() > 0:
+            publish_started = time.perf_counter()
+            gate.publisher.flush()
+            stages.setdefault("sber_publish", []).append(time.perf_counter() - publish_started)
+    elapsed = time.perf_counter() - started
+    memory_mb = None
+    if trace_memory:
+        memory_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return {
+        "records": len(records),
+        "elapsed": elapsed,
+        "busy": sum(sum(durations) for durations in stages.values()),
+        "stages": {stage: sorted(durations) for stage, durations in stages.items()},
+        "memory_mb": memory_mb,
+        "published": gate.mqttc.published,
+        "ws_sent": gate.ws.sent,
+    }
+
+
+def parse_speeds(text):
+    return [None if speed.strip() == "max" else float(speed) for speed in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", help="Файл записи трафика (traffic.jsonl.gz)")
+    parser.add_argument("--snapshots", help="Каталог со снимками реестров HA")
+    parser.add_argument("--speeds", default="1,10,max", help="Скорости воспроизведения через запятую")
+    parser.add_argument("--events", type=int, default=2000, help="Сколько событий HA генерировать без --traffic")
+    parser.add_argument("--tracemalloc", action="store_true", help="Пиковая память по tracemalloc")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    if args.traffic:
+        records = list(read_traffic(args.traffic))
+    else:
+        records = synthetic_traffic(*load_registries(args.snapshots), args.events)
+    duration = (records[-1][0] - records[0][0]) / 1000 if records else 0
+    print(f"записей: {len(records)}, длительность записи: {duration:.1f} с")
+
+    cwd = os.getcwd()
+    for speed in parse_speeds(args.speeds):
+        # База пишет файлы в текущий каталог
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                result = replay(records, speed, args.tracemalloc)
+            finally:
+                os.chdir(cwd)
+
+        title = "max" if speed is None else f"{speed:g}x"
+        memory = result["memory_mb"] if args.tracemalloc else peak_rss_mb()
+        memory_text = "н/д" if memory is None else f"{memory:.1f} МБ" + ("" if args.tracemalloc else " (RSS процесса)")
+        print(f"\n{title}: {result['records'] / result['elapsed']:.0f} записей/с, {result['elapsed']:.2f} с, "
+              f"занято {result['busy'] / result['elapsed'] * 100:.0f}%, память {memory_text}, "
+              f"публикаций MQTT {result['published']}, кадров в HA {result['ws_sent']}")
+        print(f"  {'этап':22}{'кол-во':>8}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+        for stage, durations in sorted(result["stages"].items()):
+            p50, p90, p99 = (percentile(durations, q) * 1000 for q in (50, 90, 99))
+            print(f"  {stage:22}{len(durations):8}{p50:10.3f}{p90:10.3f}{p99:10.3f}{durations[-1] * 1000:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
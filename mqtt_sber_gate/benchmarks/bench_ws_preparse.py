@@ -0,0 +1,95 @@
+"""
+Замер предварительного разбора кадров websocket HA.
+
+Из записанных состояний (tests/data/devices/states.json) строятся кадры state_changed в формате HA.
+Сравнивается полный json.loads каждого кадра с разбором заголовка (ws_frame.peek_frame)
+и декодированием только кадров сущностей, которые обрабатывает шлюз (по умолчанию - светильники).
+
+Запуск: python mqtt_sber_gate/benchmarks/bench_ws_preparse.py [--rounds N] [--handled DOMAIN ...]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+
+from ws_frame import peek_frame  # noqa: E402
+
+STATES_PATH = Path(__file__).parent.parent / "tests" / "data" / "devices" / "states.json"
+
+
+def make_frames():
+    with open(STATES_PATH, encoding="utf-8") as file:
+        states = json.load(file)
+    frames = []
+    for state in states:
+        frames.append(json.dumps({
+            "id": 1,
+            "type": "event",
+            "event": {
+                "event_type": "state_changed",
+                "data": {"entity_id": state["entity_id"], "old_state": state, "new_state": state},
+                "origin": "LOCAL",
+                "time_fired": state.get("last_updated"),
+                "context": state.get("context"),
+            },
+        }, separators=(",", ":"), ensure_ascii=False))
+    return frames
+
+
+def full_decode(frames, handled):
+    decoded = 0
+    for frame in frames:
+        data = json.loads(frame)
+        if data["event"]["data"]["entity_id"] in handled:
+            decoded += 1
+    return decoded
+
+
+def preparse(frames, handled):
+    decoded = 0
+    for frame in frames:
+        header = peek_frame(frame)
+        if header.entity_id in handled:
+            json.loads(frame)
+            decoded += 1
+    return decoded
+
+
+def measure(func, frames, handled, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = func(frames, handled)
+    return (time.perf_counter() - started) / (rounds * len(frames)) * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--handled", nargs="*", default=["light"], help="домены сущностей, которые обрабатывает шлюз")
+    args = parser.parse_args()
+
+    frames = make_frames()
+    handled = set()
+    for frame in frames:
+        entity_id = json.loads(frame)["event"]["data"]["entity_id"]
+        if entity_id.split(".")[0] in args.handled:
+            handled.add(entity_id)
+
+    full_us, full_count = measure(full_decode, frames, handled, args.rounds)
+    pre_us, pre_count = measure(preparse, frames, handled, args.rounds)
+    assert full_count == pre_count
+
+    size = sum(len(frame) for frame in frames) / len(frames)
+    print(f"Кадров: {len(frames)}, средний размер {size:.0f} байт, обрабатывается {len(handled)} сущностей")
+    print(f"{'':12}{'мкс/кадр':>10}")
+    print(f"{'json.loads':12}{full_us:10.2f}")
+    print(f"{'peek_frame':12}{pre_us:10.2f}")
+    print(f"Ускорение: {full_us / pre_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
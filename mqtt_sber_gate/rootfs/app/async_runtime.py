@@ -0,0 +1,382 @@
+"""
+Асинхронный (asyncio) режим работы шлюза.
+
+В цикле событий работают обмен с брокером MQTT Сбера, прием HTTP соединений, разбор событий HA
+и публикатор состояний. Блокирующие операции выполняются вне цикла, в отдельных ограниченных пулах,
+которые не делят потоки между собой:
+- обработчики сообщений Сбера - один поток, по порядку поступления;
+- HTTP запросы (в том числе запросы интерфейса к облаку Сбера);
+- установка соединений с HA и брокером Сбера и подготовка справочников Сбера.
+Кадры websocket HA читает отдельный поток (websocket-client не умеет неблокирующее чтение кадра).
+
+Между сетевыми подсистемами и обработчиками стоят ограниченные очереди: когда обработчик
+не успевает, чтение из соответствующего сокета приостанавливается.
+"""
+
+import asyncio
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+import websocket
+
+import json_codec
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1000
+# Потоки обработки HTTP запросов
+DEFAULT_HTTP_WORKERS = 8
+# Потоки установки соединений и подготовки справочников (подготовка может занять поток надолго)
+BLOCKING_WORKERS = 3
+HA_PING_INTERVAL = 60
+HA_RECONNECT_DELAY = 5
+MQTT_MISC_INTERVAL = 1
+MQTT_RECONNECT_DELAY = 5
+
+
+class AsyncMqttAdapter:
+    """
+    Обслуживает сокет paho MQTT клиента из цикла asyncio вместо потока loop_start().
+    Схема взята из примера loop_asyncio.py библиотеки paho.
+    """
+
+    def __init__(self, loop, client, executor=None):
+        """
+        Args:
+            loop: Цикл событий
+            client: MQTT клиент paho
+            executor: Пул для блокирующего переподключения к брокеру (None - пул цикла по умолчанию)
+        """
+        self.loop = loop
+        self.client = client
+        self.executor = executor
+        self.connected_once = False
+        self.paused = False
+        self._sock = None
+        self._loop_thread = threading.get_ident()
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def _call_in_loop(self, func, *args):
+        # Публикация может прийти из другого потока (например, из HTTP обработчика),
+        # поэтому из чужого потока регистрация в цикле выполняется только через call_soon_threadsafe.
+        # В потоке цикла вызываем сразу: paho закрывает сокет сразу после on_socket_close.
+        if threading.get_ident() == self._loop_thread:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._watch, sock)
+
+    def on_socket_close(self, client, userdata, sock):
+        # Из чужого потока сокет будет закрыт раньше, чем цикл снимет наблюдение - передаем номер дескриптора
+        self._call_in_loop(self._unwatch, sock.fileno())
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.add_writer, sock, self._write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self.loop.remove_writer, sock.fileno())
+
+    def _watch(self, sock):
+        self._sock = sock
+        if not self.paused:
+            self.loop.add_reader(sock, self._read)
+
+    def _unwatch(self, fd):
+        self._sock = None
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+
+    def pause_reading(self):
+        """Приостанавливает чтение сообщений из сокета брокера (вызывается в цикле событий)"""
+        if not self.paused:
+            self.paused = True
+            if self._sock is not None:
+                self.loop.remove_reader(self._sock)
+
+    def resume_reading(self):
+        if self.paused:
+            self.paused = False
+            if self._sock is not None:
+                self.loop.add_reader(self._sock, self._read)
+
+    def _read(self):
+        self.client.loop_read()
+
+    def _write(self):
+        self.client.loop_write()
+
+    def connect(self, host, port, keepalive=60):
+        """Блокирующее подключение (DNS, TCP, TLS) - вызывается вне цикла событий"""
+        self.client.connect(host, port, keepalive)
+        self.connected_once = True
+
+    async def run(self):
+        """Обслуживание keepalive и переподключение к брокеру"""
+        while True:
+            rc = self.client.loop_misc()
+            if rc != mqtt.MQTT_ERR_SUCCESS and self.connected_once:
+                logger.info(f"MQTT: соединение потеряно (rc: {rc}), переподключение через {MQTT_RECONNECT_DELAY} с")
+                await asyncio.sleep(MQTT_RECONNECT_DELAY)
+                try:
+                    await self.loop.run_in_executor(self.executor, self.client.reconnect)
+                except (OSError, socket.error) as e:
+                    logger.error(f"MQTT: ошибка переподключения: {e}")
+                continue
+            await asyncio.sleep(MQTT_MISC_INTERVAL)
+
+
+class AsyncHaConnection:
+    """
+    Websocket соединение с Home Assistant, обслуживаемое циклом asyncio.
+    Кадры читает отдельный поток: блокирующее чтение не останавливает цикл событий, даже если
+    кадр пришел не целиком. Принятые кадры складываются в ограниченную очередь, которую разбирает
+    задача цикла, вызывающая WebSocketHandler.on_message. При переполнении очереди поток чтения
+    ждет - чтение сокета приостанавливается.
+    """
+
+    def __init__(self, loop, ws_handler, queue_size=DEFAULT_QUEUE_SIZE, executor=None):
+        self.loop = loop
+        self.ws_handler = ws_handler
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.ws = None
+        self._closed = None
+        self._reader = None
+
+    def start_reader(self, ws, closed):
+        self._reader = threading.Thread(target=self._read_frames, args=(ws, closed), name="ha-websocket-reader")
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read_frames(self, ws, closed):
+        """Поток чтения кадров. Завершается при закрытии или ошибке соединения."""
+        try:
+            while True:
+                opcode, frame = ws.recv_data_frame(control_frame=True)
+                if opcode == websocket.ABNF.OPCODE_CLOSE:
+                    break
+                if opcode in (websocket.ABNF.OPCODE_TEXT, websocket.ABNF.OPCODE_BINARY):
+                    data = frame.data
+                    if opcode == websocket.ABNF.OPCODE_TEXT and isinstance(data, bytes):
+                        data = data.decode("utf-8")
+                    # Ждет места в очереди - так чтение приостанавливается, пока обработчик не догонит
+                    asyncio.run_coroutine_threadsafe(self.queue.put(data), self.loop).result()
+        except Exception as e:
+            logger.info(f"WebSocket: соединение прервано ({e})")
+        finally:
+            try:
+                self.loop.call_soon_threadsafe(self._set_closed, closed)
+            except RuntimeError:  # цикл событий уже остановлен
+                pass
+
+    def _set_closed(self, closed=None):
+        closed = closed if closed is not None else self._closed
+        if closed is not None and not closed.done():
+            closed.set_result(True)
+
+    async def consume(self):
+        """Разбор очереди принятых кадров"""
+        while True:
+            message = await self.queue.get()
+            self.ws_handler.on_message(self.ws, message)
+            if not self.ws_handler.running:
+                self._set_closed()
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(HA_PING_INTERVAL)
+            self.ws.ping()
+
+    async def run(self):
+        while self.ws_handler.running:
+            ping_task = None
+            try:
+                logger.info(f"Connecting to WebSocket URL: {self.ws_handler.ws_url}")
+                # Установка соединения (handshake) блокирующая - выполняется вне цикла событий
+                self.ws = await self.loop.run_in_executor(self.executor, websocket.create_connection, self.ws_handler.ws_url)
+                self._closed = self.loop.create_future()
+                self.ws_handler.on_open(self.ws)
+                self.start_reader(self.ws, self._closed)
+                ping_task = asyncio.create_task(self._ping())
+                await self._closed
+                self.ws_handler.on_close(self.ws, None, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket error: {e}. Reconnecting in {HA_RECONNECT_DELAY} seconds...")
+            finally:
+                if ping_task is not None:
+                    ping_task.cancel()
+                if self.ws is not None:
+                    # Закрытие сокета завершает поток чтения
+                    self.ws.shutdown()
+            if self.ws_handler.running:
+                await asyncio.sleep(HA_RECONNECT_DELAY)
+
+
+class AsyncGateRuntime:
+    """Запуск всех подсистем шлюза в одном цикле событий asyncio"""
+
+    def __init__(self, mqttc, ws_handler, state_publisher, webserver_factory, queue_size=DEFAULT_QUEUE_SIZE, metrics=None):
+        """
+        Args:
+            mqttc: MQTT клиент Сбера (paho), еще не подключенный
+            ws_handler (WebSocketHandler): Обработчик сообщений Home Assistant
+            state_publisher (StatePublisher): Публикатор состояний в Сбер
+            webserver_factory: Функция без аргументов, создающая HTTPServer управления
+            queue_size (int): Размер очередей между сетевыми подсистемами и обработчиками
+            metrics (MetricsRegistry): Метрики для /metrics
+        """
+        self.mqttc = mqttc
+        self.ws_handler = ws_handler
+        self.state_publisher = state_publisher
+        self.webserver_factory = webserver_factory
+        self.queue_size = queue_size
+
+        self.mqtt_queue = None
+        self.mqtt_adapter = None
+        self.loop = None
+        self.webserver = None
+
+        # Пулы не делят потоки: медленные HTTP запросы не задерживают команды Сбера и наоборот
+        self.sber_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sber-handler")
+        self.http_executor = ThreadPoolExecutor(max_workers=DEFAULT_HTTP_WORKERS, thread_name_prefix="http")
+        self.blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="gate-blocking")
+
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics.gauge("sber_messages_queued", "Сообщения Сбера, ожидающие обработки",
+                           func=lambda: self.mqtt_queue.qsize() if self.mqtt_queue is not None else 0)
+        self._mqtt_dropped = self.metrics.counter("sber_messages_dropped_total", "Сообщения Сбера, отброшенные из-за переполнения очереди", ("topic",))
+
+    def wrap_mqtt_callback(self, callback):
+        """
+        Оборачивает обработчик сообщений MQTT: сообщение не обрабатывается в момент чтения
+        из сокета, а ставится в ограниченную очередь. Когда очередь заполнена, чтение из сокета
+        брокера приостанавливается до ее разбора. Сообщения, не поместившиеся в очередь (пришедшие
+        одной пачкой с заполнившим ее), записываются в журнал и учитываются в метрике
+        sber_messages_dropped_total; по отброшенной команде Сбер получает фактическое состояние устройств.
+        """
+        def enqueue(client, userdata, msg):
+            try:
+                self.mqtt_queue.put_nowait((callback, client, userdata, msg))
+            except asyncio.QueueFull:
+                self._drop_mqtt_message(msg)
+            if self.mqtt_queue.full() and self.mqtt_adapter is not None:
+                self.mqtt_adapter.pause_reading()
+        return enqueue
+
+    def _drop_mqtt_message(self, msg):
+        topic = msg.topic.rsplit("/", 1)[-1]
+        self._mqtt_dropped.labels(topic).inc()
+        logger.error(f"Очередь сообщений Сбера переполнена, сообщение {msg.topic} отброшено: {msg.payload[:200]!r}")
+        if topic == "commands" and self.state_publisher is not None:
+            try:
+                devices = json_codec.loads(msg.payload).get("devices", {})
+            except ValueError:
+                return
+            for entity_id in devices:
+                self.state_publisher.mark_dirty(entity_id)
+
+    def mqtt_dropped(self):
+        """Количество отброшенных сообщений Сбера по последней части топика"""
+        return {labels[0]: counter.value for labels, counter in self._mqtt_dropped.samples()}
+
+    async def _consume_mqtt(self):
+        """
+        Разбор очереди сообщений Сбера. Обработчики блокирующие (ожидание места в очереди команд,
+        чтение базы), поэтому выполняются в своем потоке по одному - в порядке поступления.
+        """
+        while True:
+            callback, client, userdata, msg = await self.mqtt_queue.get()
+            if self.mqtt_adapter is not None and self.mqtt_adapter.paused:
+                self.mqtt_adapter.resume_reading()
+            try:
+                await self.loop.run_in_executor(self.sber_executor, callback, client, userdata, msg)
+            except Exception as e:
+                logger.error(f"Ошибка обработки сообщения Сбера {msg.topic}: {e}")
+
+    async def _serve_http(self):
+        """
+        Прием HTTP соединений в цикле событий. Обработчики http.server блокирующие,
+        поэтому сам запрос обрабатывается в пуле потоков HTTP.
+        """
+        self.webserver = self.webserver_factory()
+        self.webserver.socket.setblocking(False)
+        ready = asyncio.Event()
+        self.loop.add_reader(self.webserver.socket, ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                try:
+                    request, client_address = self.webserver.get_request()
+                except (BlockingIOError, InterruptedError):
+                    continue
+                request.setblocking(True)
+                self.loop.run_in_executor(self.http_executor, self._process_http_request, request, client_address)
+        finally:
+            self.loop.remove_reader(self.webserver.socket)
+            self.webserver.server_close()
+
+    def _process_http_request(self, request, client_address):
+        try:
+            self.webserver.finish_request(request, client_address)
+        except Exception:
+            self.webserver.handle_error(request, client_address)
+        finally:
+            self.webserver.shutdown_request(request)
+
+    async def _prepare(self, prepare):
+        try:
+            await self.loop.run_in_executor(self.blocking_executor, prepare)
+        except Exception as e:
+            logger.error(f"Ошибка подготовки справочников Сбера: {e}")
+
+    async def run(self, connect_mqtt, prepare):
+        """
+        Args:
+            connect_mqtt: Функция подключения MQTT клиента к брокеру Сбера (блокирующая, выполняется вне цикла)
+            prepare: Блокирующая подготовка (ожидание http_api_endpoint, загрузка категорий).
+                     Выполняется вне цикла параллельно с подключением к HA и запуском HTTP сервера.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.mqtt_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.mqtt_adapter = AsyncMqttAdapter(self.loop, self.mqttc, self.blocking_executor)
+        ha_connection = AsyncHaConnection(self.loop, self.ws_handler, self.queue_size, self.blocking_executor)
+
+        tasks = [
+            asyncio.create_task(self._consume_mqtt()),
+        ]
+
+        try:
+            await self.loop.run_in_executor(self.blocking_executor, connect_mqtt, self.mqtt_adapter)
+            tasks.append(asyncio.create_task(self.mqtt_adapter.run()))
+            tasks.append(asyncio.create_task(self._prepare(prepare)))
+
+            self.state_publisher.attach_loop(self.loop)
+            tasks += [
+                asyncio.create_task(self._serve_http()),
+                asyncio.create_task(ha_connection.consume()),
+                asyncio.create_task(self.state_publisher.run_async()),
+            ]
+            logger.info("Asyncio runtime started")
+            await ha_connection.run()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.state_publisher.flush()
+            self.mqttc.disconnect()
+            for executor in (self.sber_executor, self.http_executor, self.blocking_executor):
+                executor.shutdown(wait=False)
+            logger.info("Asyncio runtime stopped")
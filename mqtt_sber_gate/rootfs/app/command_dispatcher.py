@@ -0,0 +1,73 @@
+"""
+Единая отправка команд Сбера в Home Assistant
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_service_call(domain, service, entity_id, service_data=None):
+    """Формирует сообщение call_service websocket API HA - в том же виде, что и process_cmd сущностей"""
+    command = {
+        "type": "call_service",
+        "domain": domain,
+        "service": service,
+        "target": {
+            "entity_id": entity_id
+        }
+    }
+    if service_data:
+        command["service_data"] = service_data
+    return command
+
+
+class CommandDispatcher:
+    """
+    Отправляет команды call_service в HA через уже открытый websocket.
+    REST API используется только как запасной путь, когда websocket не подключен.
+    """
+
+    def __init__(self, ws_handler, ha_rest):
+        """
+        Args:
+            ws_handler (WebSocketHandler): Обработчик websocket соединения с HA
+            ha_rest (HaRestClient): Клиент REST API HA для запасного пути
+        """
+        self.ws_handler = ws_handler
+        self.ha_rest = ha_rest
+        self.sent_ws = 0
+        self.sent_rest = 0
+
+    def call_service(self, domain, service, entity_id, service_data=None, rollback=None):
+        return self.dispatch(make_service_call(domain, service, entity_id, service_data), rollback)
+
+    def dispatch(self, command, rollback=None):
+        """
+        Отправляет команду call_service.
+        rollback() возвращает сущности состояние до команды, если HA ее не выполнит.
+        Возвращает id сообщения websocket или None, если команда ушла через REST.
+        """
+        if self.ws_handler is not None and self.ws_handler.is_connected():
+            try:
+                command_id = self.ws_handler.send_command(command, rollback=rollback)
+                self.sent_ws += 1
+                return command_id
+            except Exception as e:
+                logger.warning(f"Не удалось отправить команду через websocket ({e}), отправляем через REST API")
+
+        self._send_rest(command)
+        return None
+
+    def _send_rest(self, command):
+        payload = dict(command.get("service_data", {}))
+        payload.update(command.get("target", {}))
+        logger.info("HA REST API REQUEST: %s.%s %s", command['domain'], command['service'], payload)
+        self.sent_rest += 1
+        self.ha_rest.call_service(command["domain"], command["service"], payload)
+
+    def stats(self):
+        return {
+            "sent_ws": self.sent_ws,
+            "sent_rest": self.sent_rest,
+        }
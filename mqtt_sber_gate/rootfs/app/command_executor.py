@@ -0,0 +1,132 @@
+"""
+Выполнение команд Сбера вне сетевого потока MQTT
+"""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+from threading import Thread
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 100
+# Сколько секунд сетевой поток MQTT может ждать места в очереди, прежде чем команда будет отброшена
+DEFAULT_SUBMIT_TIMEOUT = 0.5
+
+
+class CommandExecutor:
+    """
+    Пул обработчиков команд Сбера.
+
+    Каждый обработчик - отдельный поток со своей ограниченной очередью. Команды одной сущности
+    всегда попадают в одну и ту же очередь, поэтому выполняются строго в порядке поступления.
+    Когда очередь заполнена, submit ждет не дольше submit_timeout (тормозя чтение из MQTT),
+    после чего команда отбрасывается. В режиме asyncio submit вызывается из потока обработчиков
+    сообщений Сбера, а не из цикла событий, поэтому ожидание цикл не останавливает.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, submit_timeout=DEFAULT_SUBMIT_TIMEOUT):
+        """
+        Args:
+            workers (int): Количество параллельных обработчиков
+            queue_size (int): Размер очереди каждого обработчика
+            submit_timeout (float): Максимальное ожидание места в очереди, секунд
+        """
+        self.workers = max(1, workers)
+        self.submit_timeout = submit_timeout
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(self.workers)]
+        self._threads = []
+        self._stats_lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.queue_wait_ms = Histogram()
+        self.latency_ms = Histogram()
+
+    def _queue_for(self, entity_id):
+        return self._queues[zlib.crc32(entity_id.encode("utf-8")) % self.workers]
+
+    def submit(self, entity_id, func, *args, received_at=None):
+        """
+        Ставит выполнение func(*args) в очередь обработчика сущности entity_id.
+
+        Args:
+            received_at (float): Время получения команды (time.monotonic()), от него считается задержка.
+        Returns:
+            bool: False, если очередь переполнена и команда отброшена
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        command_queue = self._queue_for(entity_id)
+        try:
+            command_queue.put((received_at, time.monotonic(), entity_id, func, args), timeout=self.submit_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            logger.error(f"Очередь команд переполнена, команда для {entity_id} отброшена")
+            return False
+
+        depth = command_queue.qsize()
+        with self._stats_lock:
+            self.submitted += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def _worker(self, command_queue):
+        while True:
+            item = command_queue.get()
+            if item is None:
+                break
+            received_at, queued_at, entity_id, func, args = item
+            started_at = time.monotonic()
+            self.queue_wait_ms.observe((started_at - queued_at) * 1000)
+            try:
+                func(*args)
+                with self._stats_lock:
+                    self.completed += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed += 1
+                logger.error(f"Ошибка выполнения команды для {entity_id}: {e}")
+            self.latency_ms.observe((time.monotonic() - received_at) * 1000)
+
+    def depth(self):
+        return sum(command_queue.qsize() for command_queue in self._queues)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_depth": self.depth(),
+            "max_queue_depth": self.max_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+    def start(self):
+        """Start worker threads"""
+        for index, command_queue in enumerate(self._queues):
+            thread = Thread(target=self._worker, args=(command_queue,), name=f"command-worker-{index}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Дожидается выполнения поставленных команд и останавливает обработчики"""
+        for command_queue in self._queues:
+            command_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
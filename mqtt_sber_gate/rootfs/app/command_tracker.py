@@ -0,0 +1,214 @@
+"""
+Учет команд call_service, отправленных в HA через websocket
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from threading import Thread
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 1
+
+
+class CommandError(Exception):
+    """HA вернул ошибку выполнения команды"""
+
+
+class CommandTimeout(CommandError):
+    """HA не ответил на команду за отведенное время"""
+
+
+class PendingCommand:
+    """Отправленная команда, ожидающая результата"""
+
+    __slots__ = ("command", "rollback", "sent_at", "deadline", "attempt", "future")
+
+    def __init__(self, command, rollback=None):
+        """
+        Args:
+            command (dict): Сообщение call_service
+            rollback (callable): Возвращает сущности состояние до команды, если команда не выполнена
+        """
+        self.command = command
+        self.rollback = rollback
+        self.sent_at = 0.0
+        self.deadline = 0.0
+        self.attempt = 0
+        self.future = Future()
+
+    @property
+    def service(self):
+        return f"{self.command.get('domain')}.{self.command.get('service')}"
+
+    @property
+    def entity_ids(self):
+        entity_id = self.command.get("target", {}).get("entity_id")
+        if entity_id is None:
+            return []
+        return entity_id if isinstance(entity_id, list) else [entity_id]
+
+    def __str__(self):
+        # Строка для журнала собирается, только если запись действительно выводится
+        return f"{self.service} для {self.entity_ids}"
+
+
+class CommandTracker:
+    """
+    Таблица команд, ожидающих результата, по id сообщения websocket.
+
+    Для каждой команды хранится время отправки и Future, который завершается результатом HA,
+    CommandError или CommandTimeout. Команды без ответа дольше timeout отправляются повторно
+    (не более retries раз), после чего считаются невыполненными и передаются в on_failure.
+    """
+
+    def __init__(self, resend=None, on_failure=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        """
+        Args:
+            resend (callable): resend(pending) - повторная отправка команды, возвращает новый id
+            on_failure (callable): on_failure(pending, reason) - команда не выполнена
+            timeout (float): Время ожидания результата, секунд
+            retries (int): Количество повторных отправок при отсутствии ответа
+        """
+        self.resend = resend
+        self.on_failure = on_failure
+        self.timeout = timeout
+        self.retries = max(0, retries)
+
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.thread = None
+
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.latency_ms = Histogram()
+        self.latency_by_service = {}
+
+    def track(self, command_id, command, pending=None, rollback=None):
+        """Регистрирует отправляемую команду. Вызывается до отправки, чтобы не потерять быстрый ответ."""
+        if pending is None:
+            pending = PendingCommand(command, rollback)
+        now = time.monotonic()
+        pending.sent_at = now
+        pending.deadline = now + self.timeout
+        with self._lock:
+            self.pending[command_id] = pending
+        return pending
+
+    def discard(self, command_id):
+        with self._lock:
+            return self.pending.pop(command_id, None)
+
+    def complete(self, data):
+        """
+        Обрабатывает сообщение result от HA.
+        Возвращает False, если id не относится к отслеживаемым командам.
+        """
+        command_id = data.get("id")
+        with self._lock:
+            pending = self.pending.pop(command_id, None)
+        if pending is None:
+            return False
+
+        latency = (time.monotonic() - pending.sent_at) * 1000
+        self.latency_ms.observe(latency)
+        self._service_histogram(pending.service).observe(latency)
+
+        if data.get("success", False):
+            self.completed += 1
+            logger.debug("WebSocket: команда [%s] %s выполнена за %.1f мс", command_id, pending, latency)
+            pending.future.set_result(data.get("result"))
+        else:
+            self.errors += 1
+            error = data.get("error")
+            logger.error("WebSocket: команда [%s] %s завершилась ошибкой: %s", command_id, pending, error)
+            self._fail(pending, CommandError(error))
+        return True
+
+    def expire(self, now=None):
+        """Повторяет или завершает с ошибкой команды, ответ на которые не пришел вовремя"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            expired = [(command_id, pending) for command_id, pending in self.pending.items() if pending.deadline <= now]
+            for command_id, _ in expired:
+                del self.pending[command_id]
+
+        for command_id, pending in expired:
+            if pending.attempt < self.retries and self.resend is not None:
+                pending.attempt += 1
+                self.retried += 1
+                logger.warning("WebSocket: нет ответа на команду [%s] %s, повторная отправка (%d/%d)", command_id, pending.service, pending.attempt, self.retries)
+                try:
+                    self.resend(pending)
+                    continue
+                except Exception as e:
+                    logger.error(f"WebSocket: не удалось повторно отправить команду {pending.service}: {e}")
+            self.timeouts += 1
+            logger.error("WebSocket: HA не ответил на команду [%s] %s", command_id, pending)
+            self._fail(pending, CommandTimeout(f"no result in {self.timeout} s"))
+
+    def fail_all(self, reason):
+        """Завершает все ожидающие команды с ошибкой - например, при разрыве соединения"""
+        with self._lock:
+            lost = list(self.pending.values())
+            self.pending = {}
+        for pending in lost:
+            self._fail(pending, CommandError(reason))
+        return len(lost)
+
+    def _fail(self, pending, error):
+        pending.future.set_exception(error)
+        if self.on_failure is not None:
+            try:
+                self.on_failure(pending, error)
+            except Exception as e:
+                logger.error(f"Ошибка обработки невыполненной команды {pending.service}: {e}")
+
+    def _service_histogram(self, service):
+        histogram = self.latency_by_service.get(service)
+        if histogram is None:
+            histogram = self.latency_by_service.setdefault(service, Histogram())
+        return histogram
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "completed": self.completed,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retried": self.retried,
+            "latency_ms": self.latency_ms.snapshot(),
+            "latency_by_service_ms": {
+                service: histogram.snapshot() for service, histogram in list(self.latency_by_service.items())
+            },
+        }
+
+    def _run(self):
+        interval = min(1.0, self.timeout / 4)
+        while not self._stop_event.wait(interval):
+            try:
+                self.expire()
+            except Exception as e:
+                logger.error(f"(CommandTracker) Ошибка проверки таймаутов: {e}")
+
+    def start(self):
+        """Start timeout checking thread"""
+        self._stop_event.clear()
+        self.thread = Thread(target=self._run, name="command-tracker")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
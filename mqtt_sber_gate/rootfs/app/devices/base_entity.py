@@ -1,6 +1,6 @@
 # devices/base.py
 from abc import abstractmethod
-import copy
+from types import MappingProxyType
 
 from devices.device_data import DeviceData
 
@@ -39,12 +39,22 @@ class BaseEntity:
 
     #State variables
     state: str
-    attributes: dict = {}
+    # Атрибуты HA, которые нужны классу (ATTRIBUTES_SCHEMA) - только для чтения
+    attributes: MappingProxyType = MappingProxyType({})
+
+    # Атрибуты HA, которые сохраняются в attributes. Наследники дополняют список своими атрибутами.
+    ATTRIBUTES_SCHEMA: tuple[str, ...] = ("friendly_name", "entity_id")
+    # Поля, которые process_cmd меняет до ответа HA - их возвращает state_rollback
+    COMMAND_STATE_FIELDS: tuple[str, ...] = ()
 
     #Filling flags
     is_filled_by_state = False
     linked_device: DeviceData = None
 
+    # Счетчики изменений - из них складывается ключ кеша описания устройства (config_signature)
+    _attributes_version: int = 0
+    _link_version: int = 0
+
     def __init__(self, category, entity_data: dict):
         self.category = category
         if entity_data:
@@ -78,9 +88,30 @@ class BaseEntity:
                 self.area_id = ""
 
     def fill_by_ha_state(self, ha_entity_state):
+        """
+        Заполняет состояние сущности из состояния HA.
+        Атрибуты не копируются целиком: в attributes попадают только атрибуты из ATTRIBUTES_SCHEMA,
+        ссылка на исходный словарь атрибутов HA не сохраняется, чтобы он освобождался после обработки события.
+        """
         self.state = ha_entity_state.get("state")
-        self.attributes = copy.deepcopy(ha_entity_state.get("attributes", {}))
+        ha_attributes = ha_entity_state.get("attributes", {})
+        self.attributes = MappingProxyType({name: ha_attributes[name] for name in self.ATTRIBUTES_SCHEMA if name in ha_attributes})
         self.is_filled_by_state = True
+        self._attributes_version += 1
+
+    def state_rollback(self):
+        """
+        Функция, возвращающая сущности значения COMMAND_STATE_FIELDS - для отмены изменений process_cmd,
+        если команда не выполнена. Состояние, полученное от HA после вызова, не откатывается.
+        """
+        saved = {name: getattr(self, name) for name in self.COMMAND_STATE_FIELDS}
+        version = self._attributes_version
+
+        def rollback():
+            if self._attributes_version == version:
+                for name, value in saved.items():
+                    setattr(self, name, value)
+        return rollback
 
     def is_group_state(self):
         entity_list = self.attributes.get("entity_id")
@@ -94,6 +125,18 @@ class BaseEntity:
     def link_device(self, device_data: DeviceData):
         assert self.device_id == device_data.get("id")
         self.linked_device = device_data
+        self._link_version += 1
+
+    def config_signature(self) -> tuple:
+        """
+        Ключ кеша описания устройства для Сбера (to_sber_state).
+        Меняется, когда меняются данные, от которых зависит описание.
+        """
+        return (self.is_filled_by_state, self._link_version) + self._config_state_signature()
+
+    def _config_state_signature(self) -> tuple:
+        """Часть ключа, зависящая от состояния HA. По умолчанию описание перестраивается при любом обновлении атрибутов."""
+        return (self._attributes_version,)
 
     def to_sber_state(self):
         assert self.is_filled_by_state
@@ -15,6 +15,8 @@ class CurtainEntity(BaseEntity):
     battery_level: int = 0  # Уровень заряда (0-100%)
     # _supported_features = []
 
+    ATTRIBUTES_SCHEMA = BaseEntity.ATTRIBUTES_SCHEMA + ("current_position",)
+
     def __init__(self, entity_data: dict):
         super().__init__(CURTAIN_ENTITY_CATEGORY, entity_data)
         """
@@ -40,7 +42,7 @@ class CurtainEntity(BaseEntity):
         # state_value = ha_state.get("state", "closed")
 
         # Обновление позиции
-        position = ha_state["attributes"].get("current_position")
+        position = self.attributes.get("current_position")
         if position is not None:
             self.current_position = position
         else:
@@ -162,6 +164,10 @@ class CurtainEntity(BaseEntity):
         return features
 
 
+    def _config_state_signature(self) -> tuple:
+        """Список функций шторы не зависит от состояния"""
+        return ()
+
     def to_sber_state(self):
         return super().to_sber_state()
 
@@ -40,6 +40,20 @@ class LightEntity(BaseEntity):
         "coldwhite",
     }
 
+    ATTRIBUTES_SCHEMA = BaseEntity.ATTRIBUTES_SCHEMA + (
+        "supported_features",
+        "supported_color_modes",
+        "color_mode",
+        "brightness",
+        "color_temp",
+        "min_mireds",
+        "max_mireds",
+        "hs_color",
+        "rgb_color",
+        "xy_color",
+    )
+    COMMAND_STATE_FIELDS = ("current_state", "current_color_mode")
+
     def __init__(self, ha_entity_data: dict):
         super().__init__(LIGHT_ENTITY_CATEGORY, ha_entity_data)
         self.current_state = ha_entity_data.get("state", "off") == "on"
@@ -52,31 +66,32 @@ class LightEntity(BaseEntity):
 
     def fill_by_ha_state(self, ha_state):
         super().fill_by_ha_state(ha_state)
+        attributes = self.attributes
 
-        self.max_mireds = ha_state["attributes"].get("max_mireds", 500)
-        self.min_mireds = ha_state["attributes"].get("min_mireds", 153)
+        self.max_mireds = attributes.get("max_mireds", 500)
+        self.min_mireds = attributes.get("min_mireds", 153)
         if self.max_mireds is not None and self.min_mireds is not None:
             self.color_temp_converter.set_ha_limits(self.min_mireds, self.max_mireds)
 
         self.current_state = ha_state.get("state", "off") == "on"
-        ha_brightness = ha_state["attributes"].get("brightness", 0)
+        ha_brightness = attributes.get("brightness", 0)
         ha_brightness = int(ha_brightness) if ha_brightness is not None else 0
 
         self.current_sber_brightness = self.brightness_converter.ha_to_sber(ha_brightness)
 
-        ha_color_temp = ha_state["attributes"].get("color_temp", 0)
+        ha_color_temp = attributes.get("color_temp", 0)
         if ha_color_temp is not None:
             self.current_sber_color_temp = self.color_temp_converter.ha_to_sber(ha_color_temp)
         else:
             self.current_sber_color_temp = None
 
-        self.current_color_mode = ha_state["attributes"].get("color_mode", None)
-        self.supported_features = ha_state["attributes"].get("supported_features", 0)
-        self.supported_color_modes = ha_state["attributes"].get("supported_color_modes", [])
+        self.current_color_mode = attributes.get("color_mode", None)
+        self.supported_features = attributes.get("supported_features", 0)
+        self.supported_color_modes = attributes.get("supported_color_modes", [])
 
-        self.hs_color = ha_state["attributes"].get("hs_color", None)    # [26.767, 32.827]
-        self.rgb_color = ha_state["attributes"].get("rgb_color", None)  # [255, 209, 171]
-        self.xy_color = ha_state["attributes"].get("xy_color", None)    # [0.413, 0.364]
+        self.hs_color = attributes.get("hs_color", None)    # [26.767, 32.827]
+        self.rgb_color = attributes.get("rgb_color", None)  # [255, 209, 171]
+        self.xy_color = attributes.get("xy_color", None)    # [0.413, 0.364]
 
     def create_features_list(self):
         """Формирует список фич, которые поддерживает данный класс"""
@@ -134,6 +149,13 @@ class LightEntity(BaseEntity):
 
         return allowed_values
 
+    def _config_state_signature(self) -> tuple:
+        """Список функций и допустимых значений зависит только от поддерживаемых режимов"""
+        color_modes = self.supported_color_modes
+        if isinstance(color_modes, list):
+            color_modes = tuple(color_modes)
+        return (color_modes, self.supported_features)
+
     def to_sber_state(self):  # Really it is to_sber_entity
         """Формирует состояние для Сбер"""
         res = super().to_sber_state()
@@ -1,11 +1,16 @@
 # devices_db.py
 import copy
-import json
 import logging
 from threading import Lock
 import threading
+import time
 from typing import Dict
 
+import json_codec
+from metrics import MetricsRegistry
+from snapshots import SnapshotService
+from persistence import WriteBehindWriter, atomic_write_json
+
 from devices.curtain import CurtainEntity
 from devices.device_data import DeviceData
 from devices.base_entity import BaseEntity
@@ -17,14 +22,13 @@ VERSION = "0.0.1"
 def json_read(f, defaultValue):
     try:
         with open(f, 'r', encoding='utf-8') as file:
-            return json.load(file)
+            return json_codec.loads(file.read())
     except Exception as e:
         logger.info(f'!!! Неверная конфигурация в файле: {f} ({e})')
         return defaultValue
 
 def json_write(f, d):
-    with open(f, "w", encoding='utf-8') as file:
-        json.dump(d, file, indent=4)
+    atomic_write_json(f, d)
 
 class EntityRedefinitions_Sber:
     entity_id: str
@@ -57,20 +61,46 @@ class EntityRedefinitions_Sber:
         return None
 
 class EntitiesStore:
-    _store: Dict[str, BaseEntity] = {}
-    _entity_to_group_root_map : Dict[str, list[str]] = {} # Отображение сущности в список ее групп
-    _device_data_store = {}
-    _entity_redefinition_info: dict[str, EntityRedefinitions_Sber] = {} # Тут лежит информация о месте, в котором размещается устройство с т.з. сбера. 
+    _store: Dict[str, BaseEntity]
+    _entity_to_group_root_map : Dict[str, list[str]] # Отображение сущности в список ее групп
+    _group_members: Dict[str, Dict[str, None]] # Отображение группы в ее участников
+    _device_data_store: Dict[str, DeviceData]
+    _entity_redefinition_info: dict[str, EntityRedefinitions_Sber] # Тут лежит информация о месте, в котором размещается устройство с т.з. сбера. 
     # Сбер может прислать команду OnMESSAGE: sberdevices/v1/d2ebe7l94jevif0sq1eg/down/change_group_device_request 0 b'{"device_id":"light.spot5_sp","home":"\xd0\x9e\xd0\xb1\xd0\xbe\xd0\xb3\xd0\xb0\xd1\x82\xd0\xb8\xd1\x82\xd0\xb5\xd0\xbb\xd1\x8c\xd0\xbd\xd0\xb0\xd1\x8f","room":"\xd0\xa1\xd0\xbf\xd0\xb0\xd0\xbb\xd1\x8c\xd0\xbd\xd1\x8f"}'
     # и по ней надо поменять атрибуты home и room для устройства. И запомнить их, чтобы в следующий раз уже его размещать в этом месте.
     _deviceConstructorsMap = {
         "light":    lambda ha_state: LightEntity(ha_state),
         "cover":    lambda ha_state: CurtainEntity(ha_state),
     }
-    _enabled_entities: list = []
-
-    def __init__(self, logger):
+    # Включенные сущности. dict используется как упорядоченное множество - порядок нужен для enabled_entities.json
+    _enabled_entities: Dict[str, None]
+    # Индексы: домен / устройство HA / зона -> идентификаторы сущностей
+    _by_domain: Dict[str, Dict[str, None]]
+    _by_device: Dict[str, Dict[str, None]]
+    _by_area: Dict[str, Dict[str, None]]
+
+    def __init__(self, logger, writer=None):
         self.logger = logger
+        # Отложенная запись store_placements.json и enabled_entities.json (без запущенного потока - сразу)
+        self._writer = writer if writer is not None else WriteBehindWriter()
+        self._store = {}
+        self._entity_to_group_root_map = {}
+        self._group_members = {}
+        self._device_data_store = {}
+        self._entity_redefinition_info = {}
+        self._enabled_entities = {}
+        self._by_domain = {}
+        self._by_device = {}
+        self._by_area = {}
+        self._exposure_listeners = []
+
+    def add_exposure_listener(self, callback):
+        """callback(entity_id, enabled) вызывается при включении/выключении сущности"""
+        self._exposure_listeners.append(callback)
+
+    def _notify_exposure(self, entity_id: str, enabled: bool):
+        for callback in self._exposure_listeners:
+            callback(entity_id, enabled)
 
     def _get_entity_groups(self, entity_id: str):
         if entity_id not in self._entity_to_group_root_map:
@@ -79,12 +109,56 @@ class EntitiesStore:
 
 
     def _try_to_register_entity_groups(self, entity_id: str, ha_state: dict):
+        """Перестраивает состав группы по состоянию HA: участники, исключенные из группы, удаляются из индекса"""
         attributes = ha_state.get("attributes", {})
         entity_id_list = attributes.get("entity_id", [])
-        for sub_entity_id in entity_id_list:
-            sub_entity_groups = self._get_entity_groups(sub_entity_id)
-            if entity_id not in sub_entity_groups:
-                sub_entity_groups.append(entity_id)
+        members = dict.fromkeys(entity_id_list)
+        previous = self._group_members.get(entity_id, {})
+        if list(members) == list(previous):
+            return
+        for sub_entity_id in previous:
+            groups = self._entity_to_group_root_map.get(sub_entity_id)
+            if groups is not None and entity_id in groups:
+                groups.remove(entity_id)
+                if not groups:
+                    del self._entity_to_group_root_map[sub_entity_id]
+        if members:
+            self._group_members[entity_id] = members
+        else:
+            self._group_members.pop(entity_id, None)
+        for sub_entity_id in members:
+            self._get_entity_groups(sub_entity_id).append(entity_id)
+
+    @staticmethod
+    def _index_add(index: dict, key, entity_id: str):
+        if key:
+            index.setdefault(key, {})[entity_id] = None
+
+    @staticmethod
+    def _index_remove(index: dict, key, entity_id: str):
+        entities = index.get(key)
+        if entities is not None:
+            entities.pop(entity_id, None)
+            if not entities:
+                del index[key]
+
+    @staticmethod
+    def _entity_area(entity: BaseEntity):
+        if entity.area_id:
+            return entity.area_id
+        if entity.linked_device is not None:
+            return entity.linked_device.get("area_id")
+        return None
+
+    def _index_entity(self, entity: BaseEntity):
+        self._index_add(self._by_domain, entity.entity_id.split(".")[0], entity.entity_id)
+        self._index_add(self._by_device, entity.device_id, entity.entity_id)
+        self._index_add(self._by_area, self._entity_area(entity), entity.entity_id)
+
+    def _unindex_entity(self, entity: BaseEntity):
+        self._index_remove(self._by_domain, entity.entity_id.split(".")[0], entity.entity_id)
+        self._index_remove(self._by_device, entity.device_id, entity.entity_id)
+        self._index_remove(self._by_area, self._entity_area(entity), entity.entity_id)
 
     def get_keys(self):
         """
@@ -95,16 +169,25 @@ class EntitiesStore:
     def upsert_device_data(self, data: DeviceData):
         id = data.get("id", None)
         self._device_data_store[id] = data
+        # Сущности, добавленные раньше своего устройства, привязываются к нему сейчас
+        for entity_id in list(self._by_device.get(id, ())):
+            entity = self._store[entity_id]
+            self._unindex_entity(entity)
+            entity.link_device(data)
+            self._index_entity(entity)
 
     def upsert(self, entity: BaseEntity):
-        if entity.entity_id in self._store:
+        previous = self._store.get(entity.entity_id)
+        if previous is not None:
             self.logger.info(f"Обновление устройства: {entity.entity_id}")
+            self._unindex_entity(previous)
         else:
             self.logger.info(f"Добавление устройства: {entity.entity_id}")
         self._store[entity.entity_id] = entity
         if entity.linked_device is None:
             if entity.device_id in self._device_data_store:
                 entity.link_device(self._device_data_store[entity.device_id])
+        self._index_entity(entity)
 
     def get(self, id: str) -> BaseEntity:
         if id in self._store:
@@ -139,8 +222,8 @@ class EntitiesStore:
             if entity is not None:
                 redirections[entity_id] = entity.to_json()
 
-        json_write("store_placements.json", redirections)
-        json_write("enabled_entities.json", self._enabled_entities)
+        self._writer.schedule("store_placements.json", redirections)
+        self._writer.schedule("enabled_entities.json", list(self._enabled_entities))
 
     def load(self, f):
         loaded_redirections = json_read("store_placements.json", {})
@@ -150,7 +233,7 @@ class EntitiesStore:
                 entity_placement = EntityRedefinitions_Sber.from_json(redirection)
                 if entity_placement is not None:
                     self._entity_redefinition_info[entity_placement.entity_id] = entity_placement
-        self._enabled_entities = json_read("enabled_entities.json", [])
+        self._enabled_entities = dict.fromkeys(json_read("enabled_entities.json", []))
 
     def get_redefinition_data(self, entity_id: str, default_home: str, default_room: str) -> EntityRedefinitions_Sber:
         if entity_id in self._entity_redefinition_info:
@@ -177,14 +260,36 @@ class EntitiesStore:
 
     def enable_entity(self, entity_id: str):
         if entity_id not in self._enabled_entities:
-            self._enabled_entities.append(entity_id)
+            self._enabled_entities[entity_id] = None
+            self._notify_exposure(entity_id, True)
 
     def disable_entity(self, entity_id: str):
         if entity_id in self._enabled_entities:
-            self._enabled_entities.remove(entity_id)
+            del self._enabled_entities[entity_id]
+            self._notify_exposure(entity_id, False)
 
     def is_entity_enabled(self, entity_id: str) -> bool:
         return entity_id in self._enabled_entities
+
+    def get_enabled_keys(self) -> list[str]:
+        """Идентификаторы включенных сущностей, зарегистрированных в хранилище"""
+        return [entity_id for entity_id in self._enabled_entities if entity_id in self._store]
+
+    def get_by_domain(self, domain: str) -> list[str]:
+        return list(self._by_domain.get(domain, ()))
+
+    def get_by_device(self, device_id: str) -> list[str]:
+        return list(self._by_device.get(device_id, ()))
+
+    def get_by_area(self, area_id: str) -> list[str]:
+        return list(self._by_area.get(area_id, ()))
+
+    def get_entity_groups(self, entity_id: str) -> list[str]:
+        """Группы, в которые входит сущность"""
+        return list(self._entity_to_group_root_map.get(entity_id, ()))
+
+    def get_group_members(self, group_id: str) -> list[str]:
+        return list(self._group_members.get(group_id, ()))
     
     def to_web_entity(self, entity_id: str) -> dict:
         """ Преобразование сущности в формат для отображения в веб-интерфейсе """
@@ -221,13 +326,24 @@ class CDevicesDB:
     _dbReadyEvent = threading.Event()
     _db_is_ready = False
     
-    def __init__(self, fDB, logger, version):
+    def __init__(self, fDB, logger, version, snapshots=None, writer=None, metrics=None):
         self.fDB = fDB
         self.DB = json_read(fDB, {})
         self.logger = logger
-        self._entities_store = EntitiesStore(logger)
+        # Отладочные снимки списков устройств и состояний (без записи на диск в горячем пути)
+        self.snapshots = snapshots if snapshots is not None else SnapshotService()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._config_build_ms = self.metrics.histogram("sber_config_build_milliseconds", "Время сборки документа /up/config, когда он изменился")
+        self._states_build_ms = self.metrics.histogram("sber_states_build_milliseconds", "Время сборки документа /up/status")
+        self.metrics.counter("sber_config_builds_total", "Сколько раз документ /up/config изменился", func=lambda: self.config_version)
+        self.metrics.counter("sber_config_fragments_total", "Описания сущностей для /up/config: взяты из кеша или собраны заново", ("result",),
+                             func=lambda: {("hit",): self.config_cache_hits, ("miss",): self.config_cache_misses})
+        self._entities_store = EntitiesStore(logger, writer)
         self._entities_store.load(fDB)
         self._categories = {}
+        self._ready_callbacks = []
+        # Счетчики изменений состояний устройств базы - откат команды не затирает более новое состояние
+        self._states_versions = {}
         VERSION = version
         
         known_categories = ["light", "climate"]
@@ -241,6 +357,26 @@ class CDevicesDB:
                 self._entities_store.upsert(device_instance)
 
         self.mqtt_json_devices_list = '{}'
+        # Кеш документа /up/config: id сущности -> (сущность, ключ, описание)
+        self._config_fragments = {}
+        self._config_document_keys = None
+        self.config_version = 0
+        self.config_cache_hits = 0
+        self.config_cache_misses = 0
+        self._root_device_config = {
+            "id": "root",
+            "name": "Вумный контроллер",
+            'hw_version':VERSION,
+            'sw_version':VERSION,
+            'model': {
+                'id': 'ID_root_hub',
+                'manufacturer': 'Janch',
+                'model': 'VHub',
+                'description': "HA MQTT SberGate HUB",
+                'category': 'hub',
+                'features': ['online']
+            }
+        }
         self.mqtt_json_states_list = '{}'
         self.http_json_devices_list = '{}'
 
@@ -260,8 +396,34 @@ class CDevicesDB:
         return self._categories
     
     def setReady(self):
-        self._db_is_ready = True
+        with self.lock:
+            self._db_is_ready = True
+            ready_callbacks = self._ready_callbacks
+            self._ready_callbacks = []
         self._dbReadyEvent.set()
+        for callback in ready_callbacks:
+            callback()
+
+    def add_exposure_listener(self, callback):
+        """callback(entity_id, enabled) вызывается при включении/выключении сущности или устройства старого формата"""
+        self._entities_store.add_exposure_listener(callback)
+
+    def exposed_entity_ids(self):
+        """Идентификаторы всех сущностей, переданных в Сбер"""
+        with self.lock:
+            legacy_ids = [k for k, v in self.DB.items() if v.get('enabled', False)]
+        return legacy_ids + self._entities_store.get_enabled_keys()
+
+    def call_when_ready(self, callback):
+        """
+        Вызывает callback, когда база будет готова (сразу, если уже готова).
+        В отличие от waitReady не блокирует вызывающий поток.
+        """
+        with self.lock:
+            if not self._db_is_ready:
+                self._ready_callbacks.append(callback)
+                return
+        callback()
 
     def waitReady(self):
         if not self._db_is_ready:
@@ -287,14 +449,21 @@ class CDevicesDB:
         logger.info("База устройств очищена!")
 
     def dev_del(self, id):
-        self.DB.pop(id, None)
+        device = self.DB.pop(id, None)
+        if device is not None and device.get('enabled', False):
+            self._entities_store._notify_exposure(id, False)
         # self.save_DB()
         logger.info(f"Устройство удалено: {id}")
 
     def dev_inBase(self, id):
         return id in self.DB
 
-    def change_state(self, id, key, value):
+    def change_state(self, id, key, value, command=False):
+        """
+        Args:
+            command (bool): Состояние изменено командой Сбера до ответа HA. Такое изменение не отменяет
+                            откат (states_rollback), в отличие от состояний, пришедших из HA
+        """
         if id not in self.DB:
             logger.info(f"Device id={id} не найден")
             return
@@ -303,7 +472,25 @@ class CDevicesDB:
             self.DB[id]['States'] = {}
 
         self.DB[id]['States'][key] = value
-        logger.debug(f"Состояние изменено: {id}.{key} = {value}")
+        if not command:
+            self._touch_states(id)
+        logger.debug("Состояние изменено: %s.%s = %s", id, key, value)
+
+    def _touch_states(self, id):
+        self._states_versions[id] = self._states_versions.get(id, 0) + 1
+
+    def states_rollback(self, id):
+        """
+        Функция, возвращающая устройству текущие состояния - для отмены изменений, если команда не выполнена.
+        Если после вызова устройство получило состояние из HA, откат не выполняется.
+        """
+        saved = dict(self.get_states(id))
+        version = self._states_versions.get(id, 0)
+
+        def rollback():
+            if id in self.DB and self._states_versions.get(id, 0) == version:
+                self.DB[id]['States'] = dict(saved)
+        return rollback
 
     def get_states(self, id):
         return self.DB.get(id, {}).get('States', {})
@@ -314,8 +501,12 @@ class CDevicesDB:
     def update_only(self, id, d):
         with self.lock:
             if id in self.DB:
+                was_enabled = self.DB[id].get('enabled', False)
                 for k, v in d.items():
                     self.DB[id][k] = v
+                self._touch_states(id)
+                if self.DB[id].get('enabled', False) != was_enabled:
+                    self._entities_store._notify_exposure(id, self.DB[id].get('enabled', False))
                 self.save_DB()
 
     def upsert(self, id, d):
@@ -336,8 +527,12 @@ class CDevicesDB:
         if id not in self.DB:
             self.DB[id] = copy.deepcopy(defaults)
 
+        was_enabled = self.DB[id].get('enabled', False)
         for k, v in d.items():
             self.DB[id][k] = v
+        self._touch_states(id)
+        if self.DB[id].get('enabled', False) != was_enabled:
+            self._entities_store._notify_exposure(id, self.DB[id].get('enabled', False))
 
         if not self.DB[id]['name']:
             self.DB[id]['name'] = self.DB[id]['friendly_name']
@@ -353,111 +548,135 @@ class CDevicesDB:
     #     self._deviceStore.save(self.fDB)
 
 
+    def _apply_redefinition(self, entity_id, d):
+        """Применяет переопределения имени и размещения, сделанные в Сбере, и убирает пустые поля"""
+        entity_redefinition = self.entities_store.get_redefinition_data(entity_id, None, None)
+        if entity_redefinition is not None:
+            if entity_redefinition.home is not None:
+                d['home'] = entity_redefinition.home
+            if entity_redefinition.room is not None:
+                d['room'] = entity_redefinition.room
+            if entity_redefinition.entity_name is not None:
+                d['name'] = entity_redefinition.entity_name
+        return {k: v for k, v in d.items() if v}
+
+    def _entity_config_fragment(self, entity_id, entity):
+        """
+        Описание сущности для /up/config. Берется из кеша и перестраивается, только если изменились
+        данные сущности (config_signature) или переопределения имени и размещения.
+        Возвращает (описание, признак перестроения).
+        """
+        entity_redefinition = self.entities_store.get_redefinition_data(entity_id, None, None)
+        signature = (entity.config_signature(), entity_redefinition.home, entity_redefinition.room, entity_redefinition.entity_name)
+        cached = self._config_fragments.get(entity_id)
+        if cached is not None and cached[0] is entity and cached[1] == signature:
+            self.config_cache_hits += 1
+            return cached[2], False
+
+        self.config_cache_misses += 1
+        fragment = self._apply_redefinition(entity_id, entity.to_sber_state())
+        self._config_fragments[entity_id] = (entity, signature, fragment)
+        return fragment, True
+
+    def _legacy_devices_config(self, entitiesList):
+        """Описания устройств старого формата (self.DB) - не кешируются, их состояние меняется на месте"""
+        legacy_devices = {}
+        for k,v in self.DB.items():
+            if entitiesList is not None and k not in entitiesList:
+                continue
+            if not v.get('enabled',False):
+                continue
+
+            d={'id': k, 'name': v.get('name',''), 'default_name': v.get('default_name','')}
+
+            d['room']=v.get('room','')
+            d['hw_version']=v.get('hw_version','')
+            d['sw_version']=v.get('sw_version','')
+            dev_cat=v.get('category','relay')
+            # Справочник категорий загружается параллельно с HA и может быть еще пуст
+            c=self.categories.get(dev_cat, [])
+            f=[]
+            for ft in c:
+                if ft.get('required',False):
+                    f.append(ft['name'])
+                else:
+                    for st in self.get_states(k):
+                        if ft['name'] == st:
+                            f.append(ft['name'])
+
+            d['model']={'id': 'ID_'+dev_cat, 'manufacturer': 'Janch', 'model': 'Model_'+dev_cat, 'category': dev_cat, 'features': f}
+            d['model_id']=''
+            legacy_devices[k] = self._apply_redefinition(k, d)
+        return legacy_devices
+
     def do_mqtt_json_devices_list(self, entitiesList = None):
+        """
+        Формирует документ /up/config. Описания сущностей берутся из кеша, документ целиком
+        пересобирается, только если изменилось хотя бы одно описание или состав включенных сущностей.
+        При каждом изменении документа увеличивается config_version.
+        """
         if not self._db_is_ready:
             return None
-        
-        # Реализация как в оригинале...
-        device_list = {}
-        device_list['devices']=[]
-        device_list['devices'].append(
-            {
-                "id": "root", 
-                "name": "Вумный контроллер", 
-                'hw_version':VERSION, 
-                'sw_version':VERSION,
-                'model': {
-                    'id': 'ID_root_hub', 
-                    'manufacturer': 'Janch', 
-                    'model': 'VHub', 
-                    'description': "HA MQTT SberGate HUB", 
-                    'category': 'hub', 
-                    'features': ['online']
-                }
-             })
-        
-        known_entities_dict = {}
 
+        started = time.perf_counter()
         with self.lock:
-            default_home = None
-            default_room = None
-            for k,v in self.DB.items():
-                if entitiesList is not None and k not in entitiesList:
-                    continue
-
-                entity = None
-                default_home = v.get("home", None)
-                default_room = v.get("room", None)
-
-#                entity = self.entities_store.get(k)
-#                if entity is None:
-                if not v.get('enabled',False):
-                    continue
-
-                d={'id': k, 'name': v.get('name',''), 'default_name': v.get('default_name','')}
-
-                d['room']=v.get('room','')
-                d['hw_version']=v.get('hw_version','')
-                d['sw_version']=v.get('sw_version','')
-                dev_cat=v.get('category','relay')
-                c=self.categories.get(dev_cat)
-                f=[]
-                for ft in c:
-                    if ft.get('required',False):
-                        f.append(ft['name'])
-                    else:
-                        for st in self.get_states(k):
-                            if ft['name'] == st:
-                                f.append(ft['name'])
-
-                d['model']={'id': 'ID_'+dev_cat, 'manufacturer': 'Janch', 'model': 'Model_'+dev_cat, 'category': dev_cat, 'features': f}
-                d['model_id']=''
-                known_entities_dict[k] = d
- 
-            for k, entity in self._entities_store._store.items():
-                d = entity.to_sber_state()
-                if self._entities_store.is_entity_enabled(k):
-                    known_entities_dict[k] = d
-
-            for k, d in known_entities_dict.items():
-                if 'room' in d:
-                    default_room = d["room"]
-                if 'home' in d:
-                    default_home = d["home"]
-
-
-                entity_redefinition = self.entities_store.get_redefinition_data(k, default_home, default_room)
-                if d is not None:
-                    if entity_redefinition is not None:
-                        if entity_redefinition.home is not None:
-                            d['home'] = entity_redefinition.home
-                        if entity_redefinition.room is not None:
-                            d['room'] = entity_redefinition.room
-                        if entity_redefinition.entity_name is not None:
-                            d['name'] = entity_redefinition.entity_name
-
-                    # device_groups = self._entities_store._entity_to_group_root_map.get(k, None)
-                    # if device_groups is not None:
-                    #     d["groups"] = device_groups
-                    filtered = {k: v for k, v in d.items() if v}
-                    device_list['devices'].append(filtered)
-
-        self.mqtt_json_devices_list=json.dumps(device_list)
-#        logger.debug('New Devices List for MQTT ')
-        json_write("new_devices_list.json", self.mqtt_json_devices_list)
-        logger.debug('Sent new Devices List for MQTT ') #+self.mqtt_json_devices_list)
+            known_entities_dict = self._legacy_devices_config(entitiesList)
+            has_legacy_devices = len(known_entities_dict) > 0
+
+            rebuilt = False
+            enabled_keys = self._entities_store.get_enabled_keys()
+            for k in enabled_keys:
+                fragment, fragment_rebuilt = self._entity_config_fragment(k, self._entities_store.get(k))
+                known_entities_dict[k] = fragment
+                rebuilt = rebuilt or fragment_rebuilt
+
+            enabled_keys = tuple(enabled_keys)
+            if not has_legacy_devices and not rebuilt and enabled_keys == self._config_document_keys:
+                return self.mqtt_json_devices_list
+
+            device_list = {'devices': [self._root_device_config] + list(known_entities_dict.values())}
+            devices_list = json_codec.dumps(device_list)
+            self._config_document_keys = None if has_legacy_devices else enabled_keys
+            if devices_list == self.mqtt_json_devices_list:
+                return self.mqtt_json_devices_list
+
+            self.mqtt_json_devices_list = devices_list
+            self.config_version += 1
+            self._config_build_ms.observe((time.perf_counter() - started) * 1000)
+
+        self.snapshots.capture("new_devices_list.json", self.mqtt_json_devices_list)
+        logger.debug(f'New Devices List for MQTT, version {self.config_version}')
         return self.mqtt_json_devices_list
 
+    def config_stats(self):
+        return {
+            "version": self.config_version,
+            "cached_entities": len(self._config_fragments),
+            "hits": self.config_cache_hits,
+            "misses": self.config_cache_misses,
+        }
 
     def do_mqtt_json_states_list(self, dl):
+        states_list = self.build_mqtt_json_states_list(dl)
+        if states_list is None:
+            return None
+        self.snapshots.capture("new_states_list.json", states_list)
+        return states_list
+
+    def build_mqtt_json_states_list(self, dl):
+        """
+        Формирует json со состояниями сущностей из списка dl (пустой список - все сущности).
+        В отличие от do_mqtt_json_states_list ничего не пишет на диск - используется в горячем пути публикации.
+        """
         if not self._db_is_ready:
             return None
+        started = time.perf_counter()
         DStat={}
         DStat['devices']={}
         if len(dl) == 0:
             assert self.entities_store is not None
             old_fashion_list = list(self.DB.keys())
-            new_fashion_list = list(self.entities_store.get_keys())
+            new_fashion_list = self.entities_store.get_enabled_keys()
             dl= old_fashion_list + new_fashion_list
 
         with self.lock:
@@ -472,7 +691,7 @@ class CDevicesDB:
                                 device_category='relay'
                                 self.DB[id]['category']=device_category
                             DStat['devices'][id]={}
-                            features=self.categories.get(device_category)
+                            features=self.categories.get(device_category, [])
                             if self.DB[id].get('States',None) is None:
                                 self.DB[id]['States']={}
                             r=[]
@@ -487,19 +706,19 @@ class CDevicesDB:
                                     if ft['name'] == 'button_event':
                                         self.DB[id]['States']['button_event']=''
                             DStat['devices'][id]['states']=r
-                else:
+                elif self._entities_store.is_entity_enabled(id):
                     entityState = entity.to_sber_current_state()
-                    if entityState is not None and self._entities_store.is_entity_enabled(id):
+                    if entityState is not None:
                         DStat['devices']  |= entityState
 
         if (len(DStat['devices']) == 0):
             DStat['devices']={"root": {"states": [{"key": "online", "value": {"type": "BOOL", "bool_value": True}}]}}
-        self.mqtt_json_states_list=json.dumps(DStat)
-        json_write("new_states_list.json", self.mqtt_json_states_list)
+        self.mqtt_json_states_list=json_codec.dumps(DStat)
+        self._states_build_ms.observe((time.perf_counter() - started) * 1000)
         if len(dl) == 1:
-            self.logger.debug(f"(do_mqtt_json_states_list) Отправка состояний для {dl} в Sber {self.mqtt_json_states_list}")
+            self.logger.debug("(build_mqtt_json_states_list) Отправка состояний для %s в Sber %s", dl, self.mqtt_json_states_list)
         else:
-            self.logger.debug(f"(do_mqtt_json_states_list) Отправка состояний для {dl} в Sber 'new_states_list.json'")
+            self.logger.debug("(build_mqtt_json_states_list) Отправка состояний для %d сущностей в Sber", len(dl))
         return self.mqtt_json_states_list
 
     def do_http_json_devices_list(self):
@@ -525,8 +744,8 @@ class CDevicesDB:
                 r['sw_version']=v.get('sw_version','')
                 x.append(r)
                 Dev['devices'].append(r)
-        self.http_json_devices_list=json.dumps({'devices':x})
-        json_write("http_devices_list.json", self.http_json_devices_list)
+        self.http_json_devices_list=json_codec.dumps({'devices':x})
+        self.snapshots.capture("http_devices_list.json", self.http_json_devices_list)
         self.logger.debug("Sent http device list ('http_devices_list.json')")
         return self.http_json_devices_list
 
@@ -538,7 +757,7 @@ class CDevicesDB:
             if web_entity is not None:
                 current_db |= {k: web_entity}
 
-        return json.dumps({'devices':current_db})
+        return json_codec.dumps({'devices':current_db})
     
     def DefaultValue(self,feature):
         t=feature['data_type']
@@ -568,7 +787,7 @@ class CDevicesDB:
             r={'key':feature['name'],'value':{'type': 'INTEGER', 'integer_value': int(State)}}
         if feature['data_type'] == 'ENUM':
             r={'key':feature['name'],'value':{'type': 'ENUM', 'enum_value': State}}
-        logger.debug(id+': '+str(r))
+        logger.debug("%s: %s", id, r)
         return r
     
     def upsert_device_data(self, device_data):
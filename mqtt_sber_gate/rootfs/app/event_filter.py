@@ -0,0 +1,144 @@
+"""
+Фильтр событий HA по идентификатору сущности и классу устройства
+"""
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Сущности, события которых не обрабатываются, если список не задан в настройках
+DEFAULT_IGNORE_RULES = [
+    "sensor.archer_ax58*",
+    "sensor.datchik_kachestva_vozdukha*",
+    "sensor.yandex_pogoda*",
+    "sensor.datchik_osveshchennosti_i_prisutstviia_osveshchennost*",
+    "sun.sun*",
+    "device_tracker*",
+    "person*",
+]
+
+REGEX_PREFIX = "re:"
+DEVICE_CLASS_PREFIX = "device_class:"
+
+
+class RuleSet:
+    """
+    Набор правил, скомпилированный в структуры для быстрой проверки:
+      light.kitchen          - точный идентификатор (множество)
+      sensor.*               - все сущности домена (множество доменов)
+      sensor.archer*         - префикс идентификатора (префиксное дерево)
+      re:^sensor\\..*_power$  - регулярное выражение
+      device_class:power     - класс устройства из атрибутов состояния (множество)
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._exact = {}
+        self._domains = {}
+        self._prefix_trie = {}
+        self._regexes = []
+        self._device_classes = {}
+
+        for rule in self.rules:
+            if rule.startswith(REGEX_PREFIX):
+                self._regexes.append((re.compile(rule[len(REGEX_PREFIX):]), rule))
+            elif rule.startswith(DEVICE_CLASS_PREFIX):
+                self._device_classes[rule[len(DEVICE_CLASS_PREFIX):]] = rule
+            elif rule.endswith(".*") and rule.count(".") == 1:
+                self._domains[rule[:-2]] = rule
+            elif rule.endswith("*"):
+                self._add_prefix(rule[:-1], rule)
+            else:
+                self._exact[rule] = rule
+
+    def _add_prefix(self, prefix, rule):
+        node = self._prefix_trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[""] = rule
+
+    def _match_prefix(self, entity_id):
+        node = self._prefix_trie
+        rule = node.get("")
+        for char in entity_id:
+            if rule is not None:
+                return rule
+            node = node.get(char)
+            if node is None:
+                return None
+            rule = node.get("")
+        return rule
+
+    def match(self, entity_id, device_class=None):
+        """Возвращает правило, под которое попадает сущность, или None"""
+        rule = self._exact.get(entity_id)
+        if rule is not None:
+            return rule
+        rule = self._domains.get(entity_id.split(".", 1)[0])
+        if rule is not None:
+            return rule
+        if self._prefix_trie:
+            rule = self._match_prefix(entity_id)
+            if rule is not None:
+                return rule
+        for regex, rule in self._regexes:
+            if regex.search(entity_id):
+                return rule
+        if device_class is not None:
+            return self._device_classes.get(device_class)
+        return None
+
+    @property
+    def uses_device_class(self):
+        return len(self._device_classes) > 0
+
+
+class EventFilter:
+    """
+    Правила игнорирования событий HA. Правила allow имеют приоритет над ignore.
+    Считает обработанные события и отброшенные события по каждому правилу.
+    """
+
+    def __init__(self, ignore_rules=DEFAULT_IGNORE_RULES, allow_rules=()):
+        self.ignore = RuleSet(ignore_rules)
+        self.allow = RuleSet(allow_rules)
+        self.processed = 0
+        self.dropped = {rule: 0 for rule in self.ignore.rules}
+
+    def match(self, entity_id, device_class=None):
+        """Возвращает правило ignore, по которому событие должно быть отброшено, или None"""
+        rule = self.ignore.match(entity_id, device_class)
+        if rule is None:
+            return None
+        if self.allow.match(entity_id, device_class) is not None:
+            return None
+        return rule
+
+    def accept(self, entity_id, device_class=None):
+        """Проверяет событие и учитывает его в счетчиках. True - событие нужно обработать."""
+        rule = self.match(entity_id, device_class)
+        if rule is not None:
+            self.dropped[rule] += 1
+            return False
+        self.processed += 1
+        return True
+
+    def accept_id(self, entity_id):
+        """
+        Проверка до разбора json (entity_id из заголовка кадра): False, если событие точно будет
+        отброшено по идентификатору сущности. Правила по классу устройства проверяются уже после разбора (accept).
+        """
+        if self.allow.uses_device_class:
+            return True
+        rule = self.match(entity_id)
+        if rule is not None:
+            self.dropped[rule] += 1
+            return False
+        return True
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "dropped": dict(self.dropped),
+        }
@@ -0,0 +1,144 @@
+"""
+Клиент REST API Home Assistant с пулом постоянных соединений
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF_FACTOR = 0.2
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HaRestClient:
+    """
+    Общий клиент для вызовов REST API Home Assistant.
+    Держит соединения открытыми (keep-alive) и переиспользует их между командами,
+    заголовки авторизации формируются один раз при создании сессии.
+    Команды обычно идут через websocket, поэтому сессия (и библиотека requests)
+    создается только при первом запросе.
+    """
+
+    def __init__(self, options):
+        """
+        Args:
+            options (dict): Настройки. Используются ha-api_url, ha-api_token и необязательные
+                ha-rest_pool_size, ha-rest_timeout, ha-rest_retries
+        """
+        self.base_url = options['ha-api_url']
+        self.timeout = options.get('ha-rest_timeout', DEFAULT_TIMEOUT)
+        self.pool_size = options.get('ha-rest_pool_size', DEFAULT_POOL_SIZE)
+        self.retries = options.get('ha-rest_retries', DEFAULT_RETRIES)
+        self.ha_api_token = options['ha-api_token']
+        self.adapter = None
+        self.session = None
+        self._session_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.requests_count = 0
+        self.errors_count = 0
+
+    def _get_session(self):
+        if self.session is not None:
+            return self.session
+        with self._session_lock:
+            if self.session is None:
+                self.session = self._create_session()
+        return self.session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retries = self.retries
+        # Повторяем только то, что безопасно повторить: ошибки установки соединения
+        # (запрос до HA не дошел) и ответы о временной недоступности HA.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            allowed_methods=frozenset({"GET", "POST"}),
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry, pool_block=False)
+
+        session = requests.Session()
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+        session.headers.update({
+            'Authorization': 'Bearer ' + self.ha_api_token,
+            'content-type': 'application/json'
+        })
+        return session
+
+    def post(self, url, payload):
+        """
+        Отправляет POST запрос в HA.
+
+        Args:
+            url (str): Путь относительно ha-api_url, например /api/services/light/turn_on
+            payload (dict): Тело запроса
+
+        Returns:
+            requests.Response или None, если запрос не удалось выполнить
+        """
+        import requests
+
+        session = self._get_session()
+        full_url = self.base_url + url
+        logger.debug("HA REST API POST: %s, payload: %s", full_url, payload)
+        with self._stats_lock:
+            self.requests_count += 1
+        try:
+            response = session.post(full_url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            with self._stats_lock:
+                self.errors_count += 1
+            logger.error(f"Ошибка запроса к HA {full_url}: {e}")
+            return None
+        if response.status_code >= 400:
+            with self._stats_lock:
+                self.errors_count += 1
+            logger.info(f"ОШИБКА! Запрос к HA {full_url} завершился с ошибкой: {response.status_code}")
+        return response
+
+    def call_service(self, domain, service, service_data):
+        """Вызов сервиса HA: POST /api/services/<domain>/<service>"""
+        return self.post('/api/services/' + domain + '/' + service, service_data)
+
+    def stats(self):
+        """
+        Статистика использования пула: сколько соединений было открыто и сколько запросов
+        ушло по уже открытым соединениям.
+        """
+        connections_opened = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools if self.adapter is not None else {}
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections_opened += pool.num_connections
+            pool_requests += pool.num_requests
+
+        reused = max(0, pool_requests - connections_opened)
+        return {
+            "requests": self.requests_count,
+            "errors": self.errors_count,
+            "connections_opened": connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / pool_requests, 3) if pool_requests > 0 else 0.0,
+        }
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
@@ -0,0 +1,108 @@
+"""
+Подписка на изменения состояний только тех сущностей HA, которые переданы в Сбер
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Режимы подписки на события HA
+SUBSCRIPTION_ENTITIES = "entities"  # subscribe_trigger на каждую переданную в Сбер сущность
+SUBSCRIPTION_ALL = "all"            # subscribe_events state_changed - все события HA
+
+
+def make_state_trigger(entity_id):
+    """Сообщение subscribe_trigger: триггер state без from/to срабатывает на любое изменение состояния и атрибутов"""
+    return {
+        "type": "subscribe_trigger",
+        "trigger": {
+            "platform": "state",
+            "entity_id": entity_id,
+        }
+    }
+
+
+class EntitySubscriptions:
+    """
+    Подписки subscribe_trigger на отдельные сущности HA.
+
+    На каждую сущность - своя подписка, поэтому при включении/выключении сущности в Сбере
+    достаточно добавить или снять одну подписку. События остальных сущностей HA не отправляет вовсе.
+    """
+
+    def __init__(self, send_request):
+        """
+        Args:
+            send_request (callable): send_request(message) - отправляет сообщение в HA и возвращает его id
+        """
+        self.send_request = send_request
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # entity_id -> id подписки
+        self._entities = {}       # id подписки -> entity_id
+        self.events = 0
+
+    def subscribe(self, entity_id):
+        with self._lock:
+            if entity_id in self._subscriptions:
+                return
+            subscription_id = self.send_request(make_state_trigger(entity_id))
+            self._subscriptions[entity_id] = subscription_id
+            self._entities[subscription_id] = entity_id
+        logger.debug(f"WebSocket: подписка [{subscription_id}] на {entity_id}")
+
+    def unsubscribe(self, entity_id):
+        with self._lock:
+            subscription_id = self._subscriptions.pop(entity_id, None)
+            if subscription_id is None:
+                return
+            del self._entities[subscription_id]
+            self.send_request({"type": "unsubscribe_events", "subscription": subscription_id})
+        logger.debug(f"WebSocket: подписка [{subscription_id}] на {entity_id} снята")
+
+    def sync(self, entity_ids):
+        """Приводит набор подписок к списку entity_ids: подписывается на новые сущности и отписывается от лишних"""
+        wanted = set(entity_ids)
+        with self._lock:
+            current = set(self._subscriptions)
+        for entity_id in current - wanted:
+            self.unsubscribe(entity_id)
+        for entity_id in wanted - current:
+            self.subscribe(entity_id)
+        logger.info(f"WebSocket: подписки на {len(wanted)} сущностей (добавлено {len(wanted - current)}, снято {len(current - wanted)})")
+
+    def reset(self):
+        """Соединение закрыто - подписки HA пропали вместе с ним"""
+        with self._lock:
+            self._subscriptions = {}
+            self._entities = {}
+
+    def is_subscription(self, message_id):
+        return message_id in self._entities
+
+    def handle_result(self, data):
+        """Результат подписки. Возвращает False, если id не относится к подпискам."""
+        entity_id = self._entities.get(data.get("id"))
+        if entity_id is None:
+            return False
+        if not data.get("success", False):
+            logger.error(f"WebSocket: не удалось подписаться на {entity_id}: {data.get('error')}")
+            with self._lock:
+                if self._subscriptions.get(entity_id) == data.get("id"):
+                    del self._subscriptions[entity_id]
+                    del self._entities[data.get("id")]
+        return True
+
+    def parse_event(self, event):
+        """Возвращает (entity_id, old_state, new_state) из события триггера или None"""
+        trigger = event.get("variables", {}).get("trigger")
+        if trigger is None:
+            return None
+        self.events += 1
+        return trigger.get("entity_id"), trigger.get("from_state"), trigger.get("to_state")
+
+    def stats(self):
+        return {
+            "subscriptions": len(self._subscriptions),
+            "events": self.events,
+        }
@@ -1,13 +1,14 @@
 # http_server.py
 from http.server import BaseHTTPRequestHandler, HTTPServer
-import json
+import json_codec
 import os
 import re
 import logging
 import sys
+import time
 from typing import Dict, Any
+from urllib.parse import parse_qs
 
-import requests
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +21,11 @@ ext_mime_types = {
     ".json": "application/json",
     ".ico": "image/vnd.microsoft.icon",
     ".log": "application/octet-stream",
+    ".gz": "application/gzip",
     "default": "text/plain"
 }
 
 static_request = {
-    '/SberGate.log': 'SberGate.log',
     '/': '../app/ui2/index.html',
     '/ui2/main.js': '../app/ui2/main.js',
     '/ui2/main.css': '../app/ui2/main.css',
@@ -37,12 +38,65 @@ static_request = {
     '/static/js/runtime-main.ccc7405a.js': '../app/ui/static/js/runtime-main.ccc7405a.js'
 }
 
+# Файлы, которые не кешируются в памяти (журнал постоянно меняется)
+UNCACHED_STATIC_EXTENSIONS = ('.log',)
+# Таймаут запросов к облаку Сбера, проксируемых из интерфейса
+PROXY_TIMEOUT = 10
+
+# GET /api/v2/snapshots/<имя> - последний снимок, POST /api/v2/snapshots - запись снимков на диск
+SNAPSHOTS_API = '/api/v2/snapshots/'
+# GET /api/v2/logs - сегменты журнала, /api/v2/logs/<сегмент> - скачивание (с Range),
+# /api/v2/logs/tail?offset=&file_id=&limit=&wait= - новые строки текущего файла журнала
+LOGS_API = '/api/v2/logs/'
+LOG_FILE = 'SberGate.log'
+# Файлы отдаются частями, без чтения целиком в память
+STREAM_CHUNK_SIZE = 64 * 1024
+# Максимальное время ожидания новых строк в /api/v2/logs/tail
+MAX_TAIL_WAIT = 30
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def parse_byte_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байт.
+    Возвращает (начало, конец включительно) или None, если заголовка нет или он не поддерживается
+    (тогда отдается весь файл). ValueError - диапазон за пределами файла (ответ 416).
+    """
+    if not header:
+        return None
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header)
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = size - 1 if last == '' else min(int(last), size - 1)
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
 class MyServer(BaseHTTPRequestHandler):
-    def __init__(self, *args, devices_db, mqttc, sber_root_topic, options, **kwargs):
+    def __init__(self, *args, devices_db, mqttc, sber_root_topic, options, stats_providers=None, snapshots=None, static_cache=None, sber_api=None, log_storage=None, metrics=None, **kwargs):
         # Сохраняем зависимости как атрибуты
         self.devices_db = devices_db
         self.mqttc = mqttc
         self.sber_root_topic = sber_root_topic
+        # Имя подсистемы -> функция без аргументов, возвращающая словарь со статистикой
+        self.stats_providers = stats_providers if stats_providers is not None else {}
+        self.snapshots = snapshots
+        # Кеш статических файлов интерфейса (StaticAssetCache), общий для всех запросов
+        self.static_cache = static_cache
+        # Клиент API облака Сбера с кешем ответов (SberApiClient). Если не задан - прямой запрос
+        self.sber_api = sber_api
+        # Журнал с сегментами (LogStorage). Если не задан - отдается только текущий файл журнала
+        self.log_storage = log_storage
+        # Метрики шлюза (MetricsRegistry) для /metrics, сюда же пишутся счетчики запросов
+        self.metrics = metrics
+        self.response_code = None
          
         self.sber_api_endpoint = options['sber-http_api_endpoint']
         self.ha_api_token = options['ha-api_token']
@@ -73,11 +127,33 @@ class MyServer(BaseHTTPRequestHandler):
 #            '/api/v1/categories/relay/features': api_categories_relay_features,
 
             '/api/v1/devices': self.handle_api_devices,
-            '/api/v2/devices': self.handle_api2_devices
+            '/api/v2/devices': self.handle_api2_devices,
+            '/api/v2/stats': self.handle_api2_stats,
+            '/api/v2/snapshots': self.handle_api2_snapshots,
+            '/api/v2/logs': self.handle_api2_logs,
+            '/SberGate.log': self.handle_log_file,
+            '/metrics': self.handle_metrics
 
         }
         super().__init__(*args, **kwargs)
 
+    def log_request(self, code='-', size='-'):
+        self.response_code = code
+        super().log_request(code, size)
+
+    def handle_one_request(self):
+        started = time.perf_counter()
+        super().handle_one_request()
+        if self.metrics is not None and self.response_code is not None:
+            code = str(getattr(self.response_code, 'value', self.response_code))
+            self.metrics.counter("http_requests_total", "Запросы к HTTP серверу интерфейса", ("method", "code")).labels(self.command, code).inc()
+            self.metrics.histogram("http_request_milliseconds", "Время обработки запросов HTTP сервера интерфейса").observe((time.perf_counter() - started) * 1000)
+            self.response_code = None
+
+    def handle_metrics(self):
+        data = self.metrics.render() if self.metrics is not None else ""
+        self.send_data(data, METRICS_CONTENT_TYPE)
+
     def do_DELETE(self):
         self.send_response(200)
         self.send_header("Content-type", "application/json")
@@ -101,7 +177,11 @@ class MyServer(BaseHTTPRequestHandler):
         #     handler = getattr(self, f"handle_{self.path}", self.default_handler)
         #     handler()
         sf=static_request.get(self.path, None)
-        if sf is None:
+        if self.path.startswith(SNAPSHOTS_API):
+            self.handle_api2_snapshot(self.path[len(SNAPSHOTS_API):])
+        elif self.path.startswith(LOGS_API):
+            self.handle_api2_log(self.path[len(LOGS_API):])
+        elif sf is None:
             self.path_dict.get(self.path, self.handle_api_default )()
         else:
             self.static_answer(sf)
@@ -109,7 +189,7 @@ class MyServer(BaseHTTPRequestHandler):
     def do_PUT(self):
         self.send_data('{}',"application/json")
         logger.info('PUT: '+self.path)
-        data=json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        data=json_codec.loads(self.rfile.read(int(self.headers['Content-Length'])))
         api='/api/v1/devices/'
         if self.path[:len(api)] == api:
             dev=self.path[len(api):]
@@ -122,16 +202,17 @@ class MyServer(BaseHTTPRequestHandler):
     def do_POST(self):
         self.send_data('{}',"application/json")
         logger.info('POST: '+self.path)
-        d=json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        d=json_codec.loads(self.rfile.read(int(self.headers['Content-Length'])))
         dict={
             '/api/v1/devices': self.handle_api_devices_post,
             '/api/v2/devices': self.handle_api2_devices_post,
-            '/api/v2/command': self.handle_api2_command_post
+            '/api/v2/command': self.handle_api2_command_post,
+            '/api/v2/snapshots': self.handle_api2_snapshots_post
         }
         dict.get(self.path, self.handle_api_default_post )(d)
 
     def handle_api_status(self):
-        self.send_data(self,json.dumps(self.AgentStatus),"application/json")
+        self.send_data(self,json_codec.dumps(self.AgentStatus),"application/json")
 
     def handle_api_objects(self):
         d='{"objects": [{"id": "__false","description": "Always false fake object","readonly": false},{"id": "__true","description": "Always true fake object","readonly": false}]}'
@@ -161,7 +242,7 @@ class MyServer(BaseHTTPRequestHandler):
         logger.info('Запрос категорий')
         #   d='{"categories": ["light","socket","relay","led_strip","hub","ipc","sensor_pir","sensor_door","sensor_temp","scenario_button","hvac_ac","hvac_fan","hvac_humidifier","hvac_air_purifier","hvac_heater","hvac_radiator","hvac_boiler","hvac_underfloor_heating","window_blind","curtain","gate","kettle","sensor_water_leak","valve"]}'
         resCategories = self.devices_db.categories
-        d=json.dumps(resCategories)
+        d=json_codec.dumps(resCategories)
         self.send_data(self,d,"application/json")
 
     def static_answer(self,file):
@@ -171,9 +252,112 @@ class MyServer(BaseHTTPRequestHandler):
             f=file.replace('/','\\')
         else:
             f=file
+        if self.static_cache is not None and e not in UNCACHED_STATIC_EXTENSIONS:
+            self.send_cached_file(f)
+            return
         logger.info('Отправка файла: '+f+'; MIME:'+m)
         self.send_file(f)
 
+    def send_cached_file(self, file_path):
+        asset = self.static_cache.get(self.path, file_path)
+        if asset is None:
+            self.send_error(404, "Not Found")
+            return
+        if asset.not_modified(self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')):
+            self.send_response(304)
+            self.send_header("ETag", asset.etag)
+            self.send_header("Cache-Control", asset.cache_control)
+            self.end_headers()
+            return
+        encoding, body = asset.select_encoding(self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        self.send_header("Content-type", asset.mime_type)
+        self.send_header("Content-Length", str(len(body)))
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        if asset.encodings:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", asset.etag)
+        self.send_header("Last-Modified", asset.last_modified)
+        self.send_header("Cache-Control", asset.cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file_stream(self, file_path, mime_type):
+        """Отдает файл частями, поддерживает запрос диапазона байт (Range)"""
+        try:
+            file = open(file_path, 'rb')
+        except OSError:
+            self.send_error(404, "Not Found")
+            return
+        with file:
+            # Журнал дописывается во время отправки - отдаем размер на момент запроса
+            size = os.fstat(file.fileno()).st_size
+            try:
+                byte_range = parse_byte_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range is None:
+                start, end = 0, size - 1
+                self.send_response(200)
+            else:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            remaining = end - start + 1
+            self.send_header("Content-type", mime_type)
+            self.send_header("Content-Length", str(remaining))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            file.seek(start)
+            while remaining > 0:
+                chunk = file.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def handle_log_file(self):
+        log_file = self.log_storage.log_file if self.log_storage is not None else LOG_FILE
+        self.send_file_stream(log_file, ext_mime_types['.log'])
+
+    def handle_api2_logs(self):
+        if self.log_storage is None:
+            self.send_data(json_codec.dumps({}), "application/json")
+            return
+        self.send_data(json_codec.dumps({"stats": self.log_storage.stats(), "segments": self.log_storage.segments()}), "application/json")
+
+    def handle_api2_log(self, name):
+        name, _, query = name.partition('?')
+        if self.log_storage is None:
+            self.send_error(404, "Not Found")
+        elif name == 'tail':
+            self.handle_api2_log_tail(parse_qs(query))
+        else:
+            path = self.log_storage.segment_path(name)
+            if path is None:
+                self.send_error(404, f"Log {name} not found")
+                return
+            p, e = os.path.splitext(path)
+            self.send_file_stream(path, ext_mime_types.get(e, ext_mime_types['default']))
+
+    def handle_api2_log_tail(self, params):
+        try:
+            offset = int(params['offset'][0]) if 'offset' in params else None
+            limit = int(params['limit'][0]) if 'limit' in params else None
+            wait = min(float(params['wait'][0]), MAX_TAIL_WAIT) if 'wait' in params else 0
+        except ValueError:
+            self.send_error(400, "Bad Request")
+            return
+        kwargs = {'limit': limit} if limit is not None else {}
+        file_id = params['file_id'][0] if 'file_id' in params else None
+        self.send_data(json_codec.dumps(self.log_storage.tail(offset, wait=wait, file_id=file_id, **kwargs)), "application/json")
+
     def handle_api_default(self):
         #Проверка на запрос features
         get_feature=re.findall(r'/api/v1/categories/(.+)/features',self.path)
@@ -181,16 +365,32 @@ class MyServer(BaseHTTPRequestHandler):
         #      logger.info('Запрошен: ' + get_feature[0])
             #Получаем список опций для категории в формате Сбер API для возврата по запросу
             resFeatures={'features':self.devices_db.categories.get(get_feature[0],[])}
-        #      logger.info('Ответ: ' + json.dumps(resFeatures))
-            self.send_data(self,json.dumps(resFeatures),"application/json")
+        #      logger.info('Ответ: ' + json_codec.dumps(resFeatures))
+            self.send_data(self,json_codec.dumps(resFeatures),"application/json")
         else:
         #Иначе прокси
             hds =  {'Authorization': 'Bearer '+self.ha_api_token, 'content-type': 'application/json'}
             api='/api/v1/'
             if self.path[:len(api)] == api:
                 logger.info('PROXY '+api+': '+self.path)
+                if self.sber_api is not None:
+                    response = self.sber_api.get(self.path[len(api):])
+                    if response is None:
+                        self.send_error(504, "Sber API is unavailable")
+                    elif response.status_code == 200:
+                        self.send_data(response.text,"application/json")
+                    else:
+                        logger.info('ОШИБКА! Запрос: '+self.path+' завершился с ошибкой: '+str(response.status_code))
+                    return
+                import requests
+
                 url=self.sber_api_endpoint+'/v1/mqtt-gate/' + self.path[len(api):]
-                req_v1=requests.get(url, headers=hds, auth=(self.sber_user, self.sber_pass))
+                try:
+                    req_v1=requests.get(url, headers=hds, auth=(self.sber_user, self.sber_pass), timeout=PROXY_TIMEOUT)
+                except requests.RequestException as e:
+                    logger.info('ОШИБКА! Запрос: '+url+' завершился с ошибкой: '+str(e))
+                    self.send_error(504, "Sber API is unavailable")
+                    return
                 if req_v1.status_code == 200:
         #         logger.info(req_v1.text)
                     self.send_data(req_v1.text,"application/json")
@@ -265,6 +465,36 @@ class MyServer(BaseHTTPRequestHandler):
     def handle_api2_devices(self):
         self.send_data(self.devices_db.do_http_json_devices_list_2(), "application/json")
 
+    def handle_api2_stats(self):
+        stats = {}
+        for name, provider in self.stats_providers.items():
+            try:
+                stats[name] = provider()
+            except Exception as e:
+                stats[name] = {"error": str(e)}
+        self.send_data(json_codec.dumps(stats), "application/json")
+
+    def handle_api2_snapshots(self):
+        if self.snapshots is None:
+            self.send_data(json_codec.dumps({}), "application/json")
+            return
+        self.send_data(json_codec.dumps({"stats": self.snapshots.stats(), "snapshots": self.snapshots.index()}), "application/json")
+
+    def handle_api2_snapshot(self, name):
+        snapshot = self.snapshots.latest(name) if self.snapshots is not None else None
+        if snapshot is None:
+            self.send_error(404, f"Snapshot {name} not found")
+            return
+        # Списки устройств и состояний хранятся уже сериализованными
+        data = snapshot.data if isinstance(snapshot.data, str) else json_codec.dumps(snapshot.data)
+        self.send_data(data, "application/json")
+
+    def handle_api2_snapshots_post(self, d):
+        # Ответ уже отправлен в do_POST, здесь только запись снимков на диск
+        if self.snapshots is not None:
+            written = self.snapshots.flush(d.get('names'))
+            logger.info(f'Записаны снимки: {written}')
+
     def handle_api_devices_post(self,d):
         logger.info('SberAgent добавляет новое устройство: '+str(d))
         cat=d.get('category','')
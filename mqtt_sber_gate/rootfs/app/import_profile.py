@@ -0,0 +1,143 @@
+"""
+Профилирование импорта модулей при запуске (аналог python -X importtime).
+
+ImportProfiler встает первым в sys.meta_path и замеряет выполнение каждого импортируемого
+модуля: полное время (вместе с вложенными импортами) и собственное время модуля.
+Включается переменной окружения SBER_GATE_PROFILE_IMPORTS=1 или настройкой startup_profile.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "SBER_GATE_PROFILE_IMPORTS"
+DEFAULT_TOP = 15
+
+
+class ImportRecord:
+    __slots__ = ("name", "depth", "cumulative", "self_time")
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.cumulative = 0.0
+        self.self_time = 0.0
+
+
+class _ProfilingLoader:
+    """Обертка загрузчика: замеряет exec_module, остальное передает исходному загрузчику"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Модуль во время выполнения видит исходный загрузчик (нужен, например, для чтения ресурсов)
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._profiler._exec(module.__name__, self._loader, module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.installed = False
+        self._records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install(self):
+        if not self.installed:
+            sys.meta_path.insert(0, self)
+            self.installed = True
+        return self
+
+    def uninstall(self):
+        if self.installed:
+            sys.meta_path.remove(self)
+            self.installed = False
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _ProfilingLoader(spec.loader, self)
+            return spec
+        return None
+
+    def _exec(self, name, loader, module):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        record = ImportRecord(name, len(stack))
+        stack.append(record)
+        started = self.clock()
+        try:
+            loader.exec_module(module)
+        finally:
+            elapsed = self.clock() - started
+            stack.pop()
+            record.cumulative = elapsed
+            record.self_time += elapsed
+            if stack:
+                stack[-1].self_time -= elapsed
+            with self._lock:
+                self._records.append(record)
+
+    def top(self, n=DEFAULT_TOP, key="cumulative"):
+        """Самые долгие импорты: key - cumulative (с вложенными импортами) или self_time"""
+        with self._lock:
+            records = list(self._records)
+        records.sort(key=lambda r: getattr(r, key), reverse=True)
+        return records[:n]
+
+    def stats(self, n=DEFAULT_TOP):
+        with self._lock:
+            records = list(self._records)
+        return {
+            "modules": len(records),
+            "total_ms": round(sum(r.cumulative for r in records if r.depth == 0) * 1000, 1),
+            "top": [
+                {"module": r.name, "cumulative_ms": round(r.cumulative * 1000, 2), "self_ms": round(r.self_time * 1000, 2)}
+                for r in self.top(n)
+            ],
+        }
+
+    def log_summary(self, n=DEFAULT_TOP):
+        stats = self.stats(n)
+        logger.info(f"Импорт модулей: {stats['modules']} модулей за {stats['total_ms']} мс")
+        for item in stats["top"]:
+            logger.info(f"Импорт {item['module']}: {item['cumulative_ms']} мс (собственное время {item['self_ms']} мс)")
+
+
+def profiling_enabled(options_file):
+    if os.environ.get(ENV_VAR, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        import json
+        with open(options_file, "r", encoding="utf-8") as file:
+            return bool(json.load(file).get("startup_profile", False))
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def install_if_enabled(options_file="options.json"):
+    """Устанавливает профилировщик, если профилирование запуска включено. Возвращает его или None"""
+    if not profiling_enabled(options_file):
+        return None
+    return ImportProfiler().install()
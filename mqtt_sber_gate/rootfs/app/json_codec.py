@@ -0,0 +1,134 @@
+"""
+Единый кодек json для горячих путей шлюза.
+
+Бэкенд выбирается при запуске (set_backend): orjson, ujson или стандартный json.
+Если выбранная библиотека не установлена, используется стандартный json.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKEND_AUTO = "auto"
+BACKEND_ORJSON = "orjson"
+BACKEND_UJSON = "ujson"
+BACKEND_STDLIB = "json"
+
+# Порядок выбора бэкенда в режиме auto
+AUTO_ORDER = (BACKEND_ORJSON, BACKEND_UJSON, BACKEND_STDLIB)
+
+# Ошибка разбора у всех бэкендов - наследник ValueError (json.JSONDecodeError, orjson.JSONDecodeError, ujson.JSONDecodeError)
+JSONDecodeError = ValueError
+
+
+class StdlibCodec:
+    name = BACKEND_STDLIB
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def dumps_pretty(self, obj):
+        return json.dumps(obj, indent=4)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = BACKEND_ORJSON
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+        self._pretty_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj, option=self._options).decode("utf-8")
+
+    def dumps_pretty(self, obj):
+        return self._orjson.dumps(obj, option=self._pretty_options).decode("utf-8")
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class UjsonCodec:
+    name = BACKEND_UJSON
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj):
+        return self._ujson.dumps(obj)
+
+    def dumps_pretty(self, obj):
+        return self._ujson.dumps(obj, indent=4)
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+
+_CODECS = {
+    BACKEND_ORJSON: OrjsonCodec,
+    BACKEND_UJSON: UjsonCodec,
+    BACKEND_STDLIB: StdlibCodec,
+}
+
+
+def create_codec(name):
+    """Создает кодек по имени бэкенда. ImportError, если библиотека не установлена."""
+    return _CODECS[name]()
+
+
+def available_backends():
+    """Бэкенды, библиотеки которых установлены"""
+    result = []
+    for name in AUTO_ORDER:
+        try:
+            create_codec(name)
+            result.append(name)
+        except ImportError:
+            pass
+    return result
+
+
+_codec = StdlibCodec()
+
+
+def set_backend(name=BACKEND_AUTO):
+    """
+    Выбирает бэкенд для всего приложения. Возвращает имя выбранного бэкенда.
+    auto - первый установленный из orjson, ujson, json.
+    """
+    global _codec
+    candidates = AUTO_ORDER if name == BACKEND_AUTO else (name, BACKEND_STDLIB)
+    for candidate in candidates:
+        if candidate not in _CODECS:
+            logger.error(f"Неизвестный бэкенд json: {candidate}")
+            continue
+        try:
+            _codec = create_codec(candidate)
+            break
+        except ImportError:
+            logger.warning(f"Бэкенд json {candidate} не установлен")
+    logger.info(f"Бэкенд json: {_codec.name}")
+    return _codec.name
+
+
+def backend():
+    return _codec.name
+
+
+def dumps(obj):
+    return _codec.dumps(obj)
+
+
+def dumps_pretty(obj):
+    return _codec.dumps_pretty(obj)
+
+
+def loads(data):
+    return _codec.loads(data)
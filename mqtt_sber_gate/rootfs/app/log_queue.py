@@ -0,0 +1,159 @@
+"""
+Журналирование без блокировки рабочих потоков.
+
+Потоки MQTT, websocket и обработчики команд только ставят записи в очередь (QueueHandler),
+форматирование и запись в файл и консоль выполняет отдельный поток (QueueListener).
+Частые однотипные сообщения (сообщения MQTT, события HA) прореживаются SamplingFilter.
+"""
+
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+# Сколько сообщений одного шаблона в секунду записывается в журнал (0 - без ограничения)
+DEFAULT_SAMPLE_RATE = 20
+# Больше шаблонов не отслеживается: сообщения, собранные через f-строки, уникальны
+MAX_SAMPLED_TEMPLATES = 2048
+SAMPLE_WINDOW = 1.0
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает не больше rate записей одного шаблона (логгер + строка формата) за секунду.
+    Предупреждения и ошибки пропускаются всегда. Число отброшенных записей добавляется
+    к первой записи шаблона в следующем окне.
+    """
+
+    def __init__(self, rate=DEFAULT_SAMPLE_RATE, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.clock = clock
+        # (логгер, шаблон) -> [начало окна, записано в окне, отброшено в окне]
+        self._windows = {}
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno >= logging.WARNING or not isinstance(record.msg, str):
+            return True
+        key = (record.name, record.msg)
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= SAMPLE_WINDOW:
+                skipped = window[2] if window is not None else 0
+                if window is None and len(self._windows) >= MAX_SAMPLED_TEMPLATES:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.rate:
+                window[1] += 1
+                skipped = 0
+            else:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+        if skipped:
+            record.msg = f"{record.msg} (пропущено похожих сообщений: {skipped})"
+        return True
+
+    def _prune(self, now):
+        expired = [key for key, window in self._windows.items() if now - window[0] >= SAMPLE_WINDOW]
+        for key in expired:
+            del self._windows[key]
+        if len(self._windows) >= MAX_SAMPLED_TEMPLATES:
+            self._windows.clear()
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Ставит записи в ограниченную очередь. При переполнении запись отбрасывается, поток не ждет"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Сообщение форматируется в потоке записи журнала. Очередь не покидает процесс,
+        # поэтому запись передается как есть (аргументы не должны изменяться после вызова логгера)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Ждем места в очереди, чтобы при остановке записи из заполненной очереди не потерялись
+        self.queue.put(self._sentinel)
+
+
+class QueueLogging:
+    def __init__(self, handlers, queue_size=DEFAULT_QUEUE_SIZE, sample_rate=DEFAULT_SAMPLE_RATE):
+        """
+        Args:
+            handlers (list): Обработчики (файл, консоль), которые вызываются в потоке записи журнала
+            queue_size (int): Размер очереди записей
+            sample_rate (int): Ограничение SamplingFilter, записей одного шаблона в секунду
+        """
+        self.handlers = list(handlers)
+        self.queue = queue.Queue(queue_size)
+        self.handler = LogQueueHandler(self.queue)
+        self.sampler = SamplingFilter(sample_rate)
+        self.handler.addFilter(self.sampler)
+        self.listener = LogQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._logger = None
+
+    def start(self, target=None):
+        """Подключает очередь к логгеру target (по умолчанию корневому) и запускает поток записи"""
+        self._logger = target if target is not None else logging.getLogger()
+        for handler in self.handlers:
+            self._logger.removeHandler(handler)
+        self._logger.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self):
+        """Записывает оставшиеся записи и возвращает обработчики логгеру для синхронной записи"""
+        if self._logger is None:
+            return
+        self._logger.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            self._logger.addHandler(handler)
+        self._logger = None
+
+    def set_sample_rate(self, rate):
+        self.sampler.rate = rate
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.sampler.suppressed,
+            "sample_rate": self.sampler.rate,
+        }
+
+
+def parse_level_rules(rules):
+    """Правила вида "<логгер>=<уровень>", например "web_socket_handler=DEBUG". Возвращает список (логгер, уровень)"""
+    parsed = []
+    for rule in rules:
+        name, sep, level_name = str(rule).partition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if not sep or not name.strip() or not isinstance(level, int):
+            logger.error(f"Неверное правило уровня журнала: {rule}")
+            continue
+        parsed.append((name.strip(), level))
+    return parsed
+
+
+def apply_log_levels(rules):
+    for name, level in parse_level_rules(rules):
+        logging.getLogger(name).setLevel(level)
+        logger.info(f"Уровень журнала {name}: {logging.getLevelName(level)}")
@@ -0,0 +1,149 @@
+"""
+Хранение журнала шлюза: текущий файл SberGate.log и сжатые сегменты SberGate.log.1.gz ... .N.gz.
+
+Когда текущий файл достигает max_bytes, он сжимается в сегмент .1.gz, старые сегменты сдвигаются,
+а самый старый удаляется - на диске занято не больше max_bytes * (backups + 1) (сегменты сжаты,
+поэтому на практике намного меньше). Ротация выполняется в потоке записи журнала (log_queue).
+LogStorage читает журнал для HTTP сервера: список сегментов и чтение новых строк (tail -f).
+"""
+
+import gzip
+import logging
+import logging.handlers
+import os
+import re
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 7
+DEFAULT_BACKUPS = 3
+# Сколько байт журнала отдается за один запрос tail
+DEFAULT_TAIL_LIMIT = 64 * 1024
+MAX_TAIL_LIMIT = 1024 * 1024
+TAIL_POLL_INTERVAL = 0.25
+
+
+def gzip_rotator(source, dest):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler, сжимающий сегменты журнала в gzip"""
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS, encoding='utf-8'):
+        super().__init__(filename, mode='a', maxBytes=max_bytes, backupCount=backups, encoding=encoding)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = gzip_rotator
+
+
+class LogStorage:
+    def __init__(self, log_file, clock=time.monotonic, sleep=time.sleep):
+        self.log_file = log_file
+        self.directory = os.path.dirname(os.path.abspath(log_file))
+        self.base_name = os.path.basename(log_file)
+        self._segment_re = re.compile(re.escape(self.base_name) + r'\.(\d+)\.gz')
+        self.clock = clock
+        self.sleep = sleep
+
+    def segments(self):
+        """Текущий файл и сжатые сегменты, от новых к старым: [{"name", "size", "modified"}]"""
+        names = []
+        for name in os.listdir(self.directory):
+            match = self._segment_re.fullmatch(name)
+            if match:
+                names.append((int(match.group(1)), name))
+        names.sort()
+        result = []
+        for name in [self.base_name] + [name for _, name in names]:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            result.append({"name": name, "size": st.st_size, "modified": int(st.st_mtime)})
+        return result
+
+    def segment_path(self, name):
+        """Путь к сегменту по имени или None (только текущий файл и сегменты, без произвольных путей)"""
+        if name != self.base_name and not self._segment_re.fullmatch(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def tail(self, offset=None, limit=DEFAULT_TAIL_LIMIT, wait=0, file_id=None):
+        """
+        Новые строки текущего файла журнала начиная с offset.
+
+        Args:
+            offset (int): Позиция, возвращенная предыдущим вызовом. None - последние limit байт журнала
+            limit (int): Максимум байт в ответе
+            wait (float): Сколько секунд ждать новых строк, если их пока нет
+            file_id (str): Идентификатор файла, возвращенный вместе с offset. Если файл с тех пор
+                           заменен (ротация), чтение начинается с начала нового файла
+
+        Returns:
+            dict: {"offset": позиция для следующего запроса, "file_id": идентификатор файла для offset,
+                   "start": позиция начала data, "data": строки журнала,
+                   "reset": True, если файл был ротирован и чтение начато сначала}
+        """
+        limit = max(1, min(limit, MAX_TAIL_LIMIT))
+        deadline = self.clock() + max(0, wait)
+        while True:
+            current_id, size = self._stat()
+            # После ротации новый файл может успеть вырасти больше offset - поэтому сравнивается и сам файл
+            reset = offset is not None and (offset > size or (file_id is not None and file_id != current_id))
+            if offset is None:
+                start = max(0, size - limit)
+            elif reset:
+                start = 0
+            else:
+                start = offset
+            if start < size or self.clock() >= deadline:
+                break
+            self.sleep(TAIL_POLL_INTERVAL)
+
+        data = b''
+        if start < size:
+            with open(self.log_file, 'rb') as log:
+                # Файл мог быть ротирован после stat - тогда он будет прочитан в следующем запросе
+                if self._file_id(os.fstat(log.fileno())) == current_id:
+                    log.seek(start)
+                    data = log.read(min(limit, size - start))
+        if offset is None and start > 0:
+            # Первая строка обрезана - начинаем со следующей
+            newline = data.find(b'\n')
+            start, data = (start + newline + 1, data[newline + 1:]) if newline >= 0 else (size, b'')
+        if len(data) == limit and start + len(data) < size:
+            # Отдаем только целые строки, остаток придет в следующем запросе
+            newline = data.rfind(b'\n')
+            if newline >= 0:
+                data = data[:newline + 1]
+        return {
+            "offset": start + len(data),
+            "file_id": current_id,
+            "start": start,
+            "data": data.decode('utf-8', errors='replace'),
+            "reset": reset,
+        }
+
+    @staticmethod
+    def _file_id(st):
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def _stat(self):
+        """Идентификатор и размер текущего файла журнала"""
+        try:
+            st = os.stat(self.log_file)
+        except OSError:
+            return None, 0
+        return self._file_id(st), st.st_size
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            "segments": len(segments),
+            "size": sum(s["size"] for s in segments),
+        }
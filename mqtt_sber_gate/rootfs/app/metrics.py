@@ -0,0 +1,202 @@
+"""
+Простые метрики для горячих путей шлюза и их выдача в формате Prometheus (/metrics)
+"""
+
+import bisect
+import threading
+
+# Границы корзин гистограммы задержек в миллисекундах
+DEFAULT_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами. Наблюдение - один bisect и увеличение счетчика,
+    поэтому ее можно вызывать в горячем пути. Процентили оцениваются по верхней границе корзины.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # последняя корзина - +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """Оценка процентиля: верхняя граница корзины, в которую попало percent% наблюдений"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = self.count * percent / 100.0
+            accumulated = 0
+            for index, bucket_count in enumerate(self._counts):
+                accumulated += bucket_count
+                if accumulated >= rank and bucket_count > 0:
+                    if index < len(self.buckets):
+                        return min(float(self.buckets[index]), self.max)
+                    return self.max
+            return self.max
+
+    def cumulative_counts(self):
+        """Накопленные счетчики по корзинам: [(граница, количество <= границы), ...], последняя граница - inf"""
+        with self._lock:
+            result = []
+            accumulated = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), self._counts):
+                accumulated += bucket_count
+                result.append((bound, accumulated))
+            return result
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 3) if self.count > 0 else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": {
+                ("+Inf" if bound == float("inf") else str(bound)): accumulated
+                for bound, accumulated in self.cumulative_counts()
+            },
+        }
+
+
+class Counter:
+    """Монотонный счетчик. inc - одно увеличение под блокировкой"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Текущее значение (глубина очереди, число соединений)"""
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class MetricFamily:
+    """
+    Метрика с именем и описанием. Без меток - один экземпляр, с метками - по экземпляру
+    на каждый набор значений меток (labels). func - значения берутся из функции при выдаче:
+    без меток функция возвращает значение, с метками - словарь {(значения меток): значение}.
+    """
+
+    def __init__(self, name, kind, help_text, factory, labelnames=(), func=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+        self._single = factory() if not self.labelnames and func is None else None
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def samples(self):
+        if self.func is not None:
+            value = self.func()
+            return list(value.items()) if self.labelnames else [((), value)]
+        if self._single is not None:
+            return [((), self._single)]
+        with self._lock:
+            return list(self._children.items())
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class MetricsRegistry:
+    """Набор метрик шлюза. render() - текст в формате Prometheus (text exposition 0.0.4)"""
+
+    def __init__(self, prefix="sber_gate"):
+        self.prefix = prefix
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, kind, help_text, factory, labelnames=(), func=None):
+        full_name = f"{self.prefix}_{name}" if self.prefix else name
+        with self._lock:
+            family = self._families.get(full_name)
+            if family is None:
+                family = self._families[full_name] = MetricFamily(full_name, kind, help_text, factory, labelnames, func)
+        # Метрика без меток возвращается сама: в горячем пути вызывается counter.inc() без поиска
+        return family._single if family._single is not None else family
+
+    def counter(self, name, help_text, labelnames=(), func=None):
+        """Счетчик. func - счетчики, которые уже ведет компонент (читаются при выдаче)"""
+        return self._register(name, "counter", help_text, Counter, labelnames, func)
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        return self._register(name, "gauge", help_text, Gauge, labelnames, func)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS_MS, func=None):
+        """Гистограмма задержек в миллисекундах. func - гистограммы, которые уже ведет компонент"""
+        return self._register(name, "histogram", help_text, lambda: Histogram(buckets), labelnames, func)
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            try:
+                samples = family.samples()
+            except Exception:
+                continue
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, metric in samples:
+                if family.kind == "histogram":
+                    for bound, accumulated in metric.cumulative_counts():
+                        labels = _format_labels(family.labelnames, values, ("le", _format_value(float(bound))))
+                        lines.append(f"{family.name}_bucket{labels} {accumulated}")
+                    labels = _format_labels(family.labelnames, values)
+                    lines.append(f"{family.name}_sum{labels} {_format_value(round(metric.sum, 3))}")
+                    lines.append(f"{family.name}_count{labels} {metric.count}")
+                else:
+                    value = metric if family.func is not None else metric.value
+                    lines.append(f"{family.name}{_format_labels(family.labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
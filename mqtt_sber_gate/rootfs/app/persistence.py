@@ -0,0 +1,126 @@
+"""
+Отложенная атомарная запись файлов настроек (размещение и включенные сущности).
+
+Изменения, сделанные подряд (например, включение сотни сущностей из интерфейса), объединяются:
+файл записывается один раз, когда изменения затихли на delay секунд, но не позже max_delay
+секунд после первого незаписанного изменения. Запись атомарная: временный файл + os.replace.
+"""
+
+import logging
+import os
+import threading
+import time
+from threading import Thread
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELAY = 1.0
+DEFAULT_MAX_DELAY = 5.0
+
+
+def atomic_write_json(path, data):
+    """Записывает json во временный файл рядом с path и заменяет им path"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(json_codec.dumps_pretty(data))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class WriteBehindWriter:
+    def __init__(self, delay=DEFAULT_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max(delay, max_delay)
+        # Путь -> последние данные для записи (старые данные того же файла заменяются)
+        self._pending = {}
+        self._first_change = None
+        self._last_change = None
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self.scheduled = 0
+        self.writes = 0
+        self.write_errors = 0
+
+    def schedule(self, path, data):
+        """Ставит запись в очередь. data не должны изменяться после передачи"""
+        with self._condition:
+            now = time.monotonic()
+            self._pending[path] = data
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+            self.scheduled += 1
+            running = self._running
+            self._condition.notify()
+        if not running:
+            # Без фонового потока (тесты, утилиты) запись выполняется сразу
+            self.flush()
+
+    def flush(self):
+        """Записывает все отложенные файлы. Возвращает число записанных файлов"""
+        with self._condition:
+            pending = self._pending
+            self._pending = {}
+            self._first_change = None
+            self._last_change = None
+        # Запись под отдельной блокировкой: flush при остановке не должен пересечься с фоновой записью
+        with self._write_lock:
+            for path, data in pending.items():
+                try:
+                    atomic_write_json(path, data)
+                    self.writes += 1
+                except Exception as e:
+                    self.write_errors += 1
+                    logger.error(f"Не удалось записать {path}: {e}")
+        return len(pending)
+
+    def stats(self):
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "scheduled": self.scheduled,
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+            "pending": pending,
+        }
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = Thread(target=self._run, name="WriteBehind")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _due_in(self, now):
+        """Секунд до записи накопленных изменений (None - записывать нечего)"""
+        if self._first_change is None:
+            return None
+        return min(self._last_change + self.delay, self._first_change + self.max_delay) - now
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    due_in = self._due_in(time.monotonic())
+                    if due_in is not None and due_in <= 0:
+                        break
+                    self._condition.wait(due_in)
+                if not self._running:
+                    return
+            self.flush()
@@ -1,27 +1,48 @@
 ﻿#!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-import asyncio
+import atexit
 import os
+import signal
 import sys
 import ssl
 import time
-import json
 import logging
 
+import import_profile
+
+# Профилирование импорта (настройка startup_profile) включается до импорта модулей шлюза
+ImportProfiler = import_profile.install_if_enabled('options.json')
+
+import json_codec
+
 from devices.devices_converter import DevicesConverter
 from devices_db import CDevicesDB, json_read, json_write
-from http_server import MyServer
+from http_server import MyServer, ext_mime_types, static_request, UNCACHED_STATIC_EXTENSIONS
+from static_cache import StaticAssetCache
+from ha_rest_client import HaRestClient
+from sber_api_client import SberApiClient
+from startup import StartupOrchestrator, PHASE_SBER_MQTT, PHASE_SBER_ENDPOINT, PHASE_SBER_DICTIONARIES, PHASE_HTTP_SERVER, PHASE_HA_REGISTRIES
+from sber_catalog import SberCatalog, DEFAULT_WORKERS as DEFAULT_CATALOG_WORKERS
+from command_dispatcher import CommandDispatcher
+from sber_mqtt_handlers import SberMqttHandlers
+from command_executor import CommandExecutor, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE as DEFAULT_COMMAND_QUEUE_SIZE
+from state_publisher import StatePublisher, DEFAULT_WINDOW_MS
+from persistence import WriteBehindWriter, DEFAULT_DELAY as DEFAULT_PERSIST_DELAY
+from metrics import MetricsRegistry
+from traffic_recorder import TrafficRecorder, DEFAULT_FILE as TRAFFIC_FILE, DEFAULT_MAX_BYTES as TRAFFIC_MAX_BYTES
+from log_storage import CompressingRotatingFileHandler, LogStorage, DEFAULT_BACKUPS as DEFAULT_LOG_BACKUPS
+from log_queue import QueueLogging, apply_log_levels, DEFAULT_SAMPLE_RATE as DEFAULT_LOG_SAMPLE_RATE
+from snapshots import SnapshotService, DEFAULT_INTERVAL as DEFAULT_SNAPSHOT_INTERVAL, DEFAULT_HISTORY as DEFAULT_SNAPSHOT_HISTORY
 import paho
 import random
-import requests
-from web_socket_handler import WebSocketHandler, async_publish
+from web_socket_handler import WebSocketHandler
 import websocket
 import threading
 # deprecated import pkg_resources
 import paho.mqtt.client as mqtt
 from datetime import datetime
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 
 import importlib.metadata
 
@@ -49,11 +70,6 @@ LOG_FILE_MAX_SIZE = 1024*1024*7
 # log_level = 3
 HA_AREA = {}
 
-# Проверка размера файла логов
-if os.path.isfile(LOG_FILE):
-    if os.path.getsize(LOG_FILE) > LOG_FILE_MAX_SIZE:
-        os.remove(LOG_FILE)
-
 # Инициализация корневого логгера
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.DEBUG)  # Значение по умолчанию
@@ -61,15 +77,18 @@ root_logger.setLevel(logging.DEBUG)  # Значение по умолчанию
 # Формат сообщений
 formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-# Логирование в файл
-file_handler = logging.FileHandler(LOG_FILE, mode='w')
+# Логирование в файл: при достижении LOG_FILE_MAX_SIZE файл сжимается в сегмент SberGate.log.1.gz
+file_handler = CompressingRotatingFileHandler(LOG_FILE, LOG_FILE_MAX_SIZE, DEFAULT_LOG_BACKUPS)
 file_handler.setFormatter(formatter)
-root_logger.addHandler(file_handler)
 
 # Логирование в консоль
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
-root_logger.addHandler(console_handler)
+
+# Запись журнала выполняет отдельный поток, потоки MQTT и websocket только ставят записи в очередь
+LogQueue = QueueLogging([file_handler, console_handler])
+LogQueue.start(root_logger)
+atexit.register(LogQueue.stop)
 
 # Используем отдельный логгер для модуля
 logger = logging.getLogger(__name__)
@@ -90,70 +109,14 @@ def options_change(k,v):
       logger.info('В настройках изменился параметр: '+k+' с '+str(t)+' на '+str(v)+' (обновляю и сохраняю).')
       json_write(fOptions,Options)
 
-def post_command_to_ha(entity_id, url, payload):
-   logger.info('HA REST API REQUEST: '+ url)
-   hds = {'Authorization': 'Bearer '+Options['ha-api_token'], 'content-type': 'application/json'}
-   logger.debug("Headers: '"+str(hds)+"'")
-   logger.debug("Payload: "+str(payload))
-   full_url = Options['ha-api_url']+url
-   logger.debug("Url: "+full_url)
-   return requests.post(full_url, json=payload, headers=hds)
-
-
-def ha_OnOff(id):
-   OnOff = DevicesDB.get_state(id,'on_off')
-   entity_domain,entity_name=id.split('.',1)
-   logger.info('Отправляем команду в HA для '+id+' ON: '+str(OnOff))
-   # url=Options['ha-api_url']+'/api/services/'+entity_domain+'/'
-   url='/api/services/'+entity_domain+'/'
-   if entity_domain == 'button':
-      url += 'press'
-   else:
-      if OnOff:
-         url += 'turn_on'
-      else:
-         url += 'turn_off'
-   logger.info('HA REST API REQUEST: '+ url)
-   post_command_to_ha(id, url, {"entity_id": id})
-   # hds = {'Authorization': 'Bearer '+Options['ha-api_token'], 'content-type': 'application/json'}
-   # response=requests.post(url, json={"entity_id": id}, headers=hds)
-#   print(response)
-
-def ha_climate(id,changes):
-   hds = {'Authorization': 'Bearer '+Options['ha-api_token'], 'content-type': 'application/json'}
-   entity_domain,entity_name=id.split('.',1)
-   logger.info('Отправляем команду в HA для '+id+' Climate: ')
-#   if changes.get('hvac_temp_set',False):
-   url=Options['ha-api_url']+'/api/services/'+entity_domain+'/set_temperature'
-   logger.info('HA REST API REQUEST: '+ url)
-   if DevicesDB.get_state(id,'on_off'):
-      payload = {"entity_id": id, "temperature": DevicesDB.get_state(id,'hvac_temp_set'), "hvac_mode": "cool"}
-   else:
-      payload = {"entity_id": id, "temperature": DevicesDB.get_state(id,'hvac_temp_set'), "hvac_mode": "off"}
-   response=requests.post(url, json=payload, headers=hds)
-
 def ha_switch(id,OnOff):
 #   if DevicesDB.DB[id].get('entity_ha',False):
    logger.info('Отправляем команду в HA для '+id+' ON: '+str(OnOff))
-   if OnOff:
-      url=Options['ha-api_url']+'/api/services/switch/turn_on'
-   else:
-      url=Options['ha-api_url']+'/api/services/switch/turn_off'
-   hds = {'Authorization': 'Bearer '+Options['ha-api_token'], 'content-type': 'application/json'}
-   response=requests.post(url, json={"entity_id": id}, headers=hds)
-#   if response.status_code == 200:
-#      logger.info(response.text)
-#   else:
-#      logger.info(response.status_code)
+   Commands.call_service('switch', 'turn_on' if OnOff else 'turn_off', id)
 
 def ha_script(id,OnOff):
    logger.info('Отправляем команду в HA для '+id+' ON: '+str(OnOff))
-   if OnOff:
-      url=Options['ha-api_url']+'/api/services/script/turn_on'
-   else:
-      url=Options['ha-api_url']+'/api/services/script/turn_off'
-   hds = {'Authorization': 'Bearer '+Options['ha-api_token'], 'content-type': 'application/json'}
-   response=requests.post(url, json={"entity_id": id}, headers=hds)
+   Commands.call_service('script', 'turn_on' if OnOff else 'turn_off', id)
 
    def DeviceStates_mqttSber(self,id):
       d=self.DB.get(id,None)
@@ -219,6 +182,7 @@ def on_connect_local(mqttc, obj, flags, rc):
 def on_connect(mqttc, obj, flags, rc):
    if rc==0:
       logger.info("Connect OK SberDevices Broker, rc: " + str(rc))
+      Startup.done(PHASE_SBER_MQTT)
       mqttc.subscribe(stdown+"/#", 0)
       mqttc.subscribe("sberdevices/v1/__config", 0)
    else:
@@ -236,11 +200,11 @@ def on_disconnect(client, userdata, rc):
         logger.info("Unexpected MQTT disconnection. Will auto-reconnect. rc: "+str(rc))
 
 def on_message(mqtts, ws, msg):
-   logger.info("OnMESSAGE: "+msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+   logger.info("OnMESSAGE: %s %s %s", msg.topic, msg.qos, msg.payload)
    if msg.topic and msg.topic.endswith('/down/change_group_device_request'):
       try:
-         data = json.loads(msg.payload)
-      except json.JSONDecodeError as e:
+         data = json_codec.loads(msg.payload)
+      except json_codec.JSONDecodeError as e:
          logger.error(f"Ошибка декодирования JSON: {e}")      
          return
       device_id = data.get("device_id")
@@ -252,7 +216,7 @@ def on_message(mqtts, ws, msg):
            mqttc.publish(sber_root_topic+'/up/config', payload, qos=0)
 
    if msg.topic.endswith('/down/rename_device_request'):
-      data = json.loads(msg.payload)
+      data = json_codec.loads(msg.payload)
       device_id = data.get("device_id", None)
       new_name = data.get("new_name", None)
       if device_id is not None and new_name is not None:
@@ -263,82 +227,19 @@ def on_message(mqtts, ws, msg):
             mqttc.publish(sber_root_topic+'/up/config', payload, qos=0)
 
 def on_publish(mqttc, obj, mid):
-    logger.info("mid: " + str(mid))
+    logger.info("mid: %s", mid)
 
 def on_subscribe(mqttc, obj, mid, granted_qos):
-    logger.info("SD Subscribed: " + str(mid) + " " + str(granted_qos))
+    logger.info("SD Subscribed: %s %s", mid, granted_qos)
 
 def on_log(mqttc, obj, level, string):
-    logger.info("OnLOG: "+string)
-
-def send_status(mqttc, s):
-    infot = mqttc.publish(sber_root_topic+'/up/status', s, qos=0)
-
-#*** sber MQTT client setup *****************************************
-def on_message_cmd(mqttc, obj, msg):
-   data=json.loads(msg.payload)
-   logger.info("(on_message_cmd) Sber MQTT Command: " + str(data))
-   for id,cmd_data in data['devices'].items():
-      entity = DevicesDB.entities_store.get(id)
-      if (entity is None):
-         changes={}
-         for k in cmd_data['states']:
-            type=k['value'].get('type','')
-            val=''
-            if type == 'BOOL':
-               val=k['value'].get('bool_value',False)
-            if type == 'INTEGER':
-               val=k['value'].get('integer_value',0)
-            if type == 'ENUM':
-               val=k['value'].get('enum_value','')
-
-            if DevicesDB.DB[id].get(k['key'],None) == val:
-               changes[k['key']] = False
-            else:
-               changes[k['key']] = True
-
-            DevicesDB.change_state(id,k['key'],val)
-
-         if DevicesDB.DB[id].get('entity_type',None) == 'climate':
-            ha_climate(id,changes)
-         else:
-            if DevicesDB.DB[id].get('entity_ha',False):
-               ha_OnOff(id)
-            else:
-               logger.info('Объект отсутствует в HA: ' + id)
-      else:
-         logger.info("(on_message_cmd)Изменяем состояние объекта: " + id)
-         processing_result = entity.process_cmd(cmd_data)
-         for payload in processing_result:
-            command_to_send = payload.get("url", None)
-            if command_to_send is not None:
-               ws_server.send_command(command_to_send)
-
-def on_message_stat(mqttc, obj, msg):
-   try:
-      data=json.loads(msg.payload).get('devices',[])
-      if (len(data) == 1) and data[0] == "": # Это какой-то непонятный приход от сбера - пустой идентификатор сущности.
-         data = [] 
-   except:
-      data=[]
-   logger.info("GetStatus: "  +  str(msg.payload))
-   send_status(mqttc,DevicesDB.do_mqtt_json_states_list(data))
-   logger.info("Answer: "+DevicesDB.mqtt_json_states_list)
-
-def on_errors(mqttc, obj, msg):
-   error_message = str(msg.payload)
-   logger.info("Sber MQTT Errors: " + msg.topic + " " + str(msg.qos) + " " + error_message)
-
-def on_message_conf(mqttc, obj, msg):
-   logger.info("Config: wait for readiness device DB")
-   DevicesDB.waitReady()
-   logger.info("Config: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-   device_list = DevicesDB.do_mqtt_json_devices_list()
-   mqttc.publish(sber_root_topic+'/up/config', device_list, qos=0)
+    logger.info("OnLOG: %s", string)
 
 def on_global_conf(mqttc, obj, msg):
-   data=json.loads(msg.payload)
+   data=json_codec.loads(msg.payload)
    options_change('sber-http_api_endpoint',data.get('http_api_endpoint',''))
+   if Options['sber-http_api_endpoint'] != '':
+      Startup.done(PHASE_SBER_ENDPOINT)
 
 #********** Start **********************************
 
@@ -349,14 +250,23 @@ log_level = Options.get('log_level','INFO')
 log_level_str = Options.get('log_level', 'INFO').upper()
 log_level = getattr(logging, log_level_str, logging.INFO)
 root_logger.setLevel(log_level)
+apply_log_levels(Options.get('log_levels', []))
+file_handler.maxBytes = int(Options.get('log_max_size_mb', LOG_FILE_MAX_SIZE // (1024*1024)) * 1024*1024)
+file_handler.backupCount = Options.get('log_backups', DEFAULT_LOG_BACKUPS)
+Logs = LogStorage(LOG_FILE)
+LogQueue.set_sample_rate(Options.get('log_sample_rate', DEFAULT_LOG_SAMPLE_RATE))
+
+json_codec.set_backend(Options.get('json_backend', json_codec.BACKEND_AUTO))
+
+# Этапы запуска выполняются параллельно, длительность каждого доступна в /api/v2/stats (раздел startup)
+Startup = StartupOrchestrator()
+if Options.get('sber-http_api_endpoint', '') != '':
+   Startup.done(PHASE_SBER_ENDPOINT)
 
 
 #https://developers.sber.ru/docs/ru/smarthome/c2c/value
 sber_types={'FLOAT':'float_value','INTEGER':'integer_value','STRING':'string_value','BOOL':'bool_value','ENUM':'enum_value','JSON':'','COLOUR':'colour_value'}
 #
-if os.path.isfile(LOG_FILE):
-   if os.path.getsize(LOG_FILE)>LOG_FILE_MAX_SIZE:
-      os.remove(LOG_FILE)
 logger.info('Start MQTT SberGate IoT Agent for Home Assistant version: '+VERSION)
 logger.info("Запущено в системе: "+ os.name)
 logger.info("Версия Python     : "+ sys.version)
@@ -386,8 +296,26 @@ logger.info("Список файлов     : "+ str(os.listdir('.')))
 if not os.path.exists(fDevicesDB):
    json_write(fDevicesDB,{})
 
-DevicesDB=CDevicesDB(fDevicesDB, logger, VERSION)
+# Отладочные снимки пишутся на диск фоновым потоком, не чаще раза в snapshot_interval секунд
+Snapshots = SnapshotService(Options.get('snapshot_interval', DEFAULT_SNAPSHOT_INTERVAL), Options.get('snapshot_history', DEFAULT_SNAPSHOT_HISTORY))
+# Изменения размещения и включенных сущностей объединяются и записываются на диск одним файлом
+Writer = WriteBehindWriter(Options.get('persist_delay_ms', DEFAULT_PERSIST_DELAY * 1000) / 1000)
+Writer.start()
+# Несохраненные изменения и снимки записываются и при остановке аддона (SIGTERM)
+atexit.register(Writer.stop)
+atexit.register(Snapshots.stop)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+# Метрики горячих путей, отдаются по /metrics в формате Prometheus
+Metrics = MetricsRegistry()
+DevicesDB=CDevicesDB(fDevicesDB, logger, VERSION, Snapshots, Writer, Metrics)
+HaRest = HaRestClient(Options)
+# Статистика подсистем, отдаваемая по /api/v2/stats
+stats_providers = {"startup": Startup.stats, "ha_rest": HaRest.stats, "devices_config": DevicesDB.config_stats, "snapshots": Snapshots.stats, "persistence": Writer.stats, "logging": LogQueue.stats, "log_files": Logs.stats}
+if ImportProfiler is not None:
+   ImportProfiler.log_summary()
+   stats_providers["imports"] = ImportProfiler.stats
 DevicesConverterInstance = DevicesConverter(DevicesDB, logger)
+DevicesDB.call_when_ready(lambda: Startup.done(PHASE_HA_REGISTRIES))
 
 #******************* Configure Local client (HA Broker)
 #mqttHA = mqtt.Client("SberDevicesAgent local client")
@@ -401,77 +329,91 @@ mqttc = mqtt.Client()
 mqttc.on_connect = on_connect
 mqttc.on_subscribe = on_subscribe
 #mqttc.on_publish = on_publish
-mqttc.on_message = on_message
 mqttc.on_disconnect = on_disconnect
 # Uncomment to enable debug messages
 #mqttc.on_log = on_log
-mqttc.message_callback_add("sberdevices/v1/__config", on_global_conf)
 sber_root_topic='sberdevices/v1/'+Options['sber-mqtt_login']
 stdown=sber_root_topic + "/down"
-mqttc.message_callback_add(stdown+"/errors", on_errors)
-mqttc.message_callback_add(stdown+"/commands", on_message_cmd)
-mqttc.message_callback_add(stdown+"/status_request", on_message_stat)
-mqttc.message_callback_add(stdown+"/config_request", on_message_conf)
+
+def register_sber_callbacks(outer_wrap = lambda callback: callback):
+   """Регистрирует обработчики топиков Сбера. outer_wrap позволяет обернуть каждый обработчик (asyncio режим)"""
+   if Recorder is not None:
+      # Сообщение записывается при получении - до передачи в цикл asyncio
+      wrap = lambda callback: Recorder.wrap_mqtt_callback(outer_wrap(callback))
+   else:
+      wrap = outer_wrap
+   mqttc.on_message = wrap(on_message)
+   for topic, callback in sber_callbacks.items():
+      mqttc.message_callback_add(topic, wrap(callback))
 
 #mqttc = mqtt.Client("",0)
 mqttc.username_pw_set(Options['sber-mqtt_login'], Options['sber-mqtt_password'])
-mqttc.tls_set(certfile=None, keyfile=None, cert_reqs=ssl.CERT_NONE, tls_version=None)
-mqttc.tls_insecure_set(True)
-mqttc.connect(Options['sber-mqtt_broker'], Options['sber-mqtt_broker_port'], 60)
-
-#*********************************
-mqttc.loop_start()
-#mqttHA.loop_start()
-
-#Хитрое получение sber-http_api_endpoint от Сберовского MQTT из глобальной конфигурации. Типа только после этого можно идти дальше, но...
-if Options.get('sber-http_api_endpoint',None) is None:
-   options_change('sber-http_api_endpoint','')
-while (Options['sber-http_api_endpoint'] == ''):
-   logger.info('Ожидаем получение SberDevice http_api_endpoint')
-   time.sleep(1)
-logger.info('SberDevice http_api_endpoint: '+Options['sber-http_api_endpoint'])
-
-hds = {'content-type': 'application/json'}
-if not os.path.exists('models.json'):
-   logger.info('Файл моделей отсутствует. Получаем...')
-   SD_Models = requests.get(Options['sber-http_api_endpoint']+'/v1/mqtt-gate/models', headers=hds,auth=(Options['sber-mqtt_login'], Options['sber-mqtt_password']))
-   if SD_Models.status_code == 200:
-#      logger.info(SD_Models.text)
-      json_write('models.json',SD_Models.json())
-   else:
-      logger.info('ОШИБКА! Запрос models завершился с ошибкой: '+str(SD_Models.status_code))
+# Без TLS - только для локального брокера (нагрузочные и интеграционные тесты задают SBER_GATE_MQTT_TLS=0)
+if os.environ.get('SBER_GATE_MQTT_TLS', '1').lower() not in ('0', 'false', 'no'):
+   mqttc.tls_set(certfile=None, keyfile=None, cert_reqs=ssl.CERT_NONE, tls_version=None)
+   mqttc.tls_insecure_set(True)
+
+def connect_sber_mqtt(client = mqttc):
+   client.connect(Options['sber-mqtt_broker'], Options['sber-mqtt_broker_port'], 60)
+
+def wait_sber_endpoint():
+   #Хитрое получение sber-http_api_endpoint от Сберовского MQTT из глобальной конфигурации. Типа только после этого можно идти дальше, но...
+   if Options.get('sber-http_api_endpoint',None) is None:
+      options_change('sber-http_api_endpoint','')
+   if not Startup.is_done(PHASE_SBER_ENDPOINT):
+      logger.info('Ожидаем получение SberDevice http_api_endpoint')
+      Startup.wait(PHASE_SBER_ENDPOINT)
+   logger.info('SberDevice http_api_endpoint: '+Options['sber-http_api_endpoint'])
+
+def GetModels():
+   if not os.path.exists('models.json'):
+      logger.info('Файл моделей отсутствует. Получаем...')
+      SD_Models = SberApi.fetch('models')
+      if SD_Models is not None and SD_Models.status_code == 200:
+   #      logger.info(SD_Models.text)
+         json_write('models.json',SD_Models.json())
+      elif SD_Models is not None:
+         logger.info('ОШИБКА! Запрос models завершился с ошибкой: '+str(SD_Models.status_code))
    
-def GetCategories():
-   if not os.path.exists(fCategories):
-      logger.info('Файл категорий отсутствует. Получаем...')
-      Categories={}
-      SD_Categories = requests.get(Options['sber-http_api_endpoint']+'/v1/mqtt-gate/categories', headers=hds,auth=(Options['sber-mqtt_login'], Options['sber-mqtt_password'])).json()
-      for id in SD_Categories['categories']:
-         logger.info('Получаем опции для категории: '+id)
-         SD_Features = requests.get(Options['sber-http_api_endpoint']+'/v1/mqtt-gate/categories/'+id+'/features', headers=hds,auth=(Options['sber-mqtt_login'], Options['sber-mqtt_password'])).json()
-         Categories[id]=SD_Features['features']
-      json_write('categories.json',Categories)
-   else:
-      logger.info('Список категорий получен из файла: ' + fCategories)
-      Categories=json_read(fCategories, {})
-   return Categories
-
-categories=GetCategories()
-
-if categories.get('categories',False):
-   logger.info('Старая версия файла категорий, удаляем.')
-   os.remove(fCategories)
-   logger.info('Повторное получения категорий.')
-   categories=GetCategories()
-
-DevicesDB.setCategories(categories)
-
-def start_webserver():
+def prepare_sber_api():
+   wait_sber_endpoint()
+   GetModels()
+
+def load_sber_dictionaries():
+   # Справочник категорий из файла доступен сразу, проверка обновлений в облаке Сбера - в фоне
+   categories=Catalog.load_cached()
+   if categories is not None:
+      DevicesDB.setCategories(categories)
+      Startup.done(PHASE_SBER_DICTIONARIES)
+      if Options.get('sber-http_api_endpoint',None) is None:
+         options_change('sber-http_api_endpoint','')
+      Catalog.refresh_in_background(prepare_sber_api, DevicesDB.setCategories)
+      return
+
+   logger.info('Файл категорий отсутствует. Получаем...')
+   prepare_sber_api()
+   categories=Catalog.refresh()
+   DevicesDB.setCategories(categories if categories is not None else {})
+   Startup.done(PHASE_SBER_DICTIONARIES)
+   if categories is None:
+      # Облако недоступно, а справочника на диске нет - загружаем его в фоне, не дожидаясь перезапуска
+      Catalog.retry_in_background(DevicesDB.setCategories)
+
+StaticCache = StaticAssetCache(ext_mime_types)
+stats_providers["static_cache"] = StaticCache.stats
+SberApi = SberApiClient(Options)
+stats_providers["sber_api"] = SberApi.stats
+Catalog = SberCatalog(SberApi, fCategories, Options.get('sber-bootstrap_workers', DEFAULT_CATALOG_WORKERS))
+stats_providers["sber_catalog"] = Catalog.stats
+def create_webserver():
+    Startup.begin(PHASE_HTTP_SERVER)
     hostName = ''
-    serverPort = 9123
+    # Порт меняется только при запуске вне HA (тесты с заменителями в tests/fakes)
+    serverPort = int(os.environ.get('SBER_GATE_HTTP_PORT', 9123))
 
-    # Создание HTTP-сервера с передачей зависимостей
-    webServer = HTTPServer(
+    # Создание HTTP-сервера с передачей зависимостей.
+    # Каждый запрос обрабатывается в своем потоке: медленный запрос к облаку Сбера не блокирует интерфейс
+    webServer = ThreadingHTTPServer(
         (hostName, serverPort),
         lambda *args, **kwargs: MyServer(
             *args,
@@ -479,15 +421,26 @@ def start_webserver():
             mqttc=mqttc,
             sber_root_topic=sber_root_topic,
             options = Options,
+            stats_providers = stats_providers,
+            snapshots = Snapshots,
+            static_cache = StaticCache,
+            sber_api = SberApi,
+            log_storage = Logs,
+            metrics = Metrics,
             **kwargs
         )
     )
+    StaticCache.preload(static_request, UNCACHED_STATIC_EXTENSIONS)
     logger.info("Server started http://%s:%s" % (hostName, serverPort))
+    Startup.done(PHASE_HTTP_SERVER)
 
     # Сохраняем ссылку на сервер для последующего закрытия
     global webServer_instance
     webServer_instance = webServer
+    return webServer
 
+def start_webserver():
+    webServer = create_webserver()
     tsrv = threading.Thread(target=webServer.serve_forever)
     tsrv.daemon = True
     tsrv.start()
@@ -511,15 +464,81 @@ ws_url=Options['ha-api_url'].replace('http','ws',1) + '/api/websocket'
 logger.info('Start WebSocket Client URL: ' + ws_url)
 ## websocket.enableTrace(True)
 
-web_server = start_webserver();
-
-ws_server = WebSocketHandler(DevicesDB, DevicesConverterInstance, mqttc, Options)
-ws_server.start()
-
-ws_server.join()
-
-stop_webserver(web_server["server"], web_server["thread"])
-
+state_publisher = StatePublisher(DevicesDB, mqttc, sber_root_topic, Options.get('state_publish_window_ms', DEFAULT_WINDOW_MS))
+stats_providers["state_publisher"] = state_publisher.stats
+Metrics.counter("sber_status_publishes_total", "Публикации /up/status: пакеты публикатора и ответы на запросы Сбера", ("source",),
+                func=lambda: {("batch",): state_publisher.published_batches, ("request",): SberHandlers.status_requests.value})
+Metrics.counter("sber_state_entities_published_total", "Состояния сущностей, опубликованные публикатором", func=lambda: state_publisher.published_entities)
+Metrics.gauge("sber_state_pending_entities", "Сущности, ожидающие публикации состояния", func=state_publisher.pending_count)
+Metrics.gauge("sber_mqtt_connected", "Подключение к MQTT Сбера установлено", func=lambda: int(mqttc.is_connected()))
+# Запись трафика HA и Сбера для воспроизведения (benchmarks/bench_replay.py)
+Recorder = None
+if Options.get('traffic_record', False):
+   Recorder = TrafficRecorder(TRAFFIC_FILE, int(Options.get('traffic_record_max_mb', TRAFFIC_MAX_BYTES // (1024*1024)) * 1024*1024))
+   Recorder.start()
+   atexit.register(Recorder.stop)
+   stats_providers["traffic_recorder"] = Recorder.stats
+ws_server = WebSocketHandler(DevicesDB, DevicesConverterInstance, mqttc, Options, state_publisher, Snapshots, Metrics, Recorder)
+DevicesDB.add_exposure_listener(ws_server.on_exposure_changed)
+stats_providers["ha_subscriptions"] = ws_server.subscriptions.stats
+stats_providers["ha_event_filter"] = ws_server.event_filter.stats
+stats_providers["ha_frames"] = ws_server.frame_stats
+Commands = CommandDispatcher(ws_server, HaRest)
+stats_providers["commands"] = Commands.stats
+Metrics.counter("ha_commands_sent_total", "Команды, отправленные в HA", ("transport",),
+                func=lambda: {("websocket",): Commands.sent_ws, ("rest",): Commands.sent_rest})
+stats_providers["ha_commands"] = ws_server.commands.stats
+ws_server.commands.start()
+Executor = CommandExecutor(Options.get('command_workers', DEFAULT_WORKERS), Options.get('command_queue_size', DEFAULT_COMMAND_QUEUE_SIZE))
+stats_providers["command_executor"] = Executor.stats
+Metrics.gauge("command_queue_depth", "Команды Сбера в очередях обработчиков", func=Executor.depth)
+Metrics.counter("commands_rejected_total", "Команды Сбера, отброшенные из-за переполнения очереди", func=lambda: Executor.rejected)
+Metrics.histogram("command_queue_wait_milliseconds", "Ожидание команды Сбера в очереди обработчика", func=lambda: Executor.queue_wait_ms)
+Metrics.histogram("command_latency_milliseconds", "Время от получения команды Сбера до завершения ее обработки", func=lambda: Executor.latency_ms)
+SberHandlers = SberMqttHandlers(DevicesDB, Commands, Executor, sber_root_topic, Startup, Metrics)
+sber_callbacks = {"sberdevices/v1/__config": on_global_conf}
+sber_callbacks.update(SberHandlers.callbacks())
+Executor.start()
+Snapshots.start()
+
+RUNTIME_MODE = Options.get('runtime_mode', 'threaded')
+logger.info("Режим работы: " + RUNTIME_MODE)
+
+if RUNTIME_MODE == 'asyncio':
+   import asyncio
+   from async_runtime import AsyncGateRuntime, DEFAULT_QUEUE_SIZE
+
+   runtime = AsyncGateRuntime(mqttc, ws_server, state_publisher, create_webserver, Options.get('async_queue_size', DEFAULT_QUEUE_SIZE), Metrics)
+   register_sber_callbacks(runtime.wrap_mqtt_callback)
+   Startup.begin(PHASE_SBER_MQTT)
+   asyncio.run(runtime.run(connect_sber_mqtt, load_sber_dictionaries))
+else:
+   register_sber_callbacks()
+   Startup.begin(PHASE_SBER_MQTT)
+   connect_sber_mqtt()
+
+   #*********************************
+   mqttc.loop_start()
+   #mqttHA.loop_start()
+
+   # Справочники Сбера загружаются параллельно с подключением к HA и запуском HTTP сервера
+   Startup.run_in_background(PHASE_SBER_DICTIONARIES, load_sber_dictionaries)
+
+   web_server = start_webserver();
+
+   state_publisher.start()
+   Startup.begin(PHASE_HA_REGISTRIES)
+   ws_server.start()
+
+   ws_server.join()
+
+   state_publisher.stop()
+   stop_webserver(web_server["server"], web_server["thread"])
+
+Executor.stop()
+ws_server.commands.stop()
+Snapshots.stop()
+Writer.stop()
 logger.info("Server stopped.")
 
 #---------------------------------------------
@@ -0,0 +1,212 @@
+"""
+Клиент HTTP API облака Сбера (sber-http_api_endpoint/v1/mqtt-gate/...) с пулом соединений
+и кешем ответов для запросов интерфейса
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/v1/mqtt-gate/'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 10
+# Модели и категории (включая features категорий) меняются редко
+DEFAULT_CACHE_TTL = ["models=3600", "categories=3600"]
+# Сколько ждать ответа на такой же запрос, уже выполняемый другим потоком
+COALESCE_WAIT = DEFAULT_TIMEOUT + 1
+
+
+class SberApiResponse:
+    __slots__ = ("status_code", "text", "etag", "last_modified", "expires_at")
+
+    def __init__(self, status_code, text, etag=None, last_modified=None, expires_at=0.0):
+        self.status_code = status_code
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+def parse_ttl_rules(rules):
+    """
+    Правила вида "<начало пути>=<секунды>", например "categories=3600". Путь указывается
+    относительно /v1/mqtt-gate/. Возвращает список (префикс, ttl), самые длинные префиксы первыми.
+    """
+    parsed = []
+    for rule in rules:
+        prefix, sep, ttl = str(rule).partition('=')
+        try:
+            if not sep:
+                raise ValueError(rule)
+            parsed.append((prefix.strip().lstrip('/').rstrip('*'), float(ttl)))
+        except ValueError:
+            logger.error(f"Неверное правило кеширования API Сбера: {rule}")
+    parsed.sort(key=lambda item: len(item[0]), reverse=True)
+    return parsed
+
+
+class SberApiClient:
+    def __init__(self, options):
+        """
+        Args:
+            options (dict): Настройки. sber-http_api_endpoint читается при каждом запросе -
+                адрес приходит от брокера Сбера уже после запуска. Необязательная sber-api_cache_ttl -
+                список правил времени жизни ответов в кеше (parse_ttl_rules).
+        """
+        self.options = options
+        self.timeout = DEFAULT_TIMEOUT
+        self.ttl_rules = parse_ttl_rules(options.get('sber-api_cache_ttl', DEFAULT_CACHE_TTL))
+
+        # Сессия (и библиотека requests) создается при первом запросе, а не при запуске
+        self.session = None
+        self._session_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        # Путь -> SberApiResponse
+        self._cache = {}
+        # Путь -> Future запроса, выполняемого сейчас
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _get_session(self):
+        if self.session is not None:
+            return self.session
+        with self._session_lock:
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=DEFAULT_POOL_SIZE, pool_block=False)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.auth = (self.options['sber-mqtt_login'], self.options['sber-mqtt_password'])
+                session.headers.update({'content-type': 'application/json'})
+                self.session = session
+        return self.session
+
+    def ttl_for(self, path):
+        for prefix, ttl in self.ttl_rules:
+            if path.startswith(prefix):
+                return ttl
+        return 0
+
+    def get(self, path):
+        """
+        GET /v1/mqtt-gate/<path>. Возвращает SberApiResponse или None, если облако недоступно.
+        Одинаковые одновременные запросы выполняются один раз.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached.expires_at > now:
+                self.hits += 1
+                return cached
+            future = self._in_flight.get(path)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = self._in_flight[path] = Future()
+                owner = True
+
+        if not owner:
+            try:
+                return future.result(timeout=COALESCE_WAIT)
+            except Exception:
+                return None
+
+        response = None
+        try:
+            response = self._fetch(path, cached)
+        finally:
+            with self._lock:
+                del self._in_flight[path]
+            future.set_result(response)
+        return response
+
+    def fetch(self, path, etag=None):
+        """
+        GET без кеша ответов (для загрузки справочников при запуске). etag - для условного запроса,
+        ответ 304 означает, что данные не изменились. Возвращает requests.Response или None.
+        """
+        return self._request(path, {'If-None-Match': etag} if etag else {})
+
+    def _request(self, path, headers):
+        import requests
+
+        session = self._get_session()
+        url = self.options['sber-http_api_endpoint'] + API_PREFIX + path
+        try:
+            response = session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"Ошибка запроса к API Сбера {url}: {e}")
+            return None
+        if response.status_code >= 400:
+            with self._lock:
+                self.errors += 1
+        return response
+
+    def _fetch(self, path, cached):
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        http_response = self._request(path, headers)
+        if http_response is None:
+            return None
+
+        ttl = self.ttl_for(path)
+        if http_response.status_code == 304 and cached is not None:
+            with self._lock:
+                self.revalidated += 1
+                cached.expires_at = time.monotonic() + ttl
+            return cached
+
+        response = SberApiResponse(
+            http_response.status_code,
+            http_response.text,
+            http_response.headers.get('ETag'),
+            http_response.headers.get('Last-Modified'),
+        )
+        if http_response.status_code == 200 and ttl > 0:
+            response.expires_at = time.monotonic() + ttl
+            with self._lock:
+                self._cache[path] = response
+        return response
+
+    def invalidate(self, path=None):
+        """Сбрасывает кеш пути (None - весь кеш)"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._cache)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "entries": entries,
+        }
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
@@ -0,0 +1,162 @@
+"""
+Справочник категорий Сбера и их функций (features) с кешем на диске.
+
+Список категорий и функции категорий загружаются параллельно через SberApiClient.
+Загруженный справочник сохраняется в categories.json (формат прежний: категория -> функции),
+версия и ETag списка категорий - в categories.meta.json. При перезапуске справочник сразу
+берется из файла, а проверка обновлений выполняется в фоне.
+"""
+
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+import json_codec
+from devices_db import json_read
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+CACHE_FORMAT = 1
+# Интервал повторной загрузки справочника, если при первом запуске облако недоступно, секунд
+DEFAULT_RETRY_INTERVAL = 60
+
+
+def categories_version(categories):
+    """Версия справочника - хеш содержимого, не зависит от порядка ключей"""
+    data = json_codec.dumps({k: categories[k] for k in sorted(categories)})
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+class SberCatalog:
+    def __init__(self, api, cache_file='categories.json', workers=DEFAULT_WORKERS):
+        self.api = api
+        self.cache_file = cache_file
+        self.meta_file = cache_file.rsplit('.', 1)[0] + '.meta.json'
+        self.workers = workers
+        self.version = None
+        self.etag = None
+        self.source = None
+        self._refresh_thread = None
+
+    def load_cached(self):
+        """Справочник из файла или None, если файла нет или он старого формата"""
+        categories = json_read(self.cache_file, None)
+        if not isinstance(categories, dict) or not categories:
+            return None
+        if categories.get('categories', False):
+            # Старая версия файла категорий: {"categories": [...]}
+            logger.info('Старая версия файла категорий, будет загружена заново.')
+            return None
+        meta = json_read(self.meta_file, {})
+        if meta.get('format') == CACHE_FORMAT:
+            self.etag = meta.get('etag')
+        self.version = categories_version(categories)
+        self.source = 'cache'
+        logger.info(f'Список категорий получен из файла: {self.cache_file}, версия {self.version}')
+        return categories
+
+    def fetch(self):
+        """
+        Загружает справочник из облака. Функции категорий запрашиваются параллельно.
+        Возвращает справочник или None, если список категорий не изменился (304) либо облако недоступно.
+        """
+        response = self.api.fetch('categories', self.etag)
+        if response is None:
+            return None
+        if response.status_code == 304:
+            logger.info('Список категорий Сбера не изменился')
+            return None
+        if response.status_code != 200:
+            logger.info(f'ОШИБКА! Запрос categories завершился с ошибкой: {response.status_code}')
+            return None
+        category_ids = response.json().get('categories', [])
+        etag = response.headers.get('ETag')
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="SberCatalog") as pool:
+            features = list(pool.map(self._fetch_features, category_ids))
+        if any(f is None for f in features):
+            return None
+
+        categories = dict(zip(category_ids, features))
+        self.etag = etag
+        return categories
+
+    def _fetch_features(self, category_id):
+        logger.info('Получаем опции для категории: ' + category_id)
+        response = self.api.fetch('categories/' + category_id + '/features')
+        if response is None or response.status_code != 200:
+            logger.info(f'ОШИБКА! Запрос функций категории {category_id} завершился с ошибкой')
+            return None
+        return response.json().get('features', [])
+
+    def refresh(self):
+        """
+        Загружает справочник из облака и сохраняет его на диск, если он изменился.
+        Возвращает новый справочник или None, если изменений нет.
+        """
+        categories = self.fetch()
+        if categories is None:
+            return None
+        version = categories_version(categories)
+        atomic_write_json(self.meta_file, {'format': CACHE_FORMAT, 'etag': self.etag, 'version': version})
+        if version == self.version:
+            logger.info(f'Справочник категорий Сбера не изменился, версия {version}')
+            return None
+        atomic_write_json(self.cache_file, categories)
+        self.version = version
+        self.source = 'cloud'
+        logger.info(f'Справочник категорий Сбера обновлен: {len(categories)} категорий, версия {version}')
+        return categories
+
+    def refresh_in_background(self, prepare, on_update):
+        """
+        Обновление справочника в фоне. prepare - блокирующая подготовка (ожидание адреса API),
+        on_update(categories) вызывается, только если справочник изменился.
+        """
+        def run():
+            try:
+                prepare()
+                categories = self.refresh()
+                if categories is not None:
+                    on_update(categories)
+            except Exception as e:
+                logger.error(f'Ошибка фонового обновления справочника категорий: {e}')
+
+        self._refresh_thread = Thread(target=run, name="SberCatalogRefresh")
+        self._refresh_thread.daemon = True
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def retry_in_background(self, on_update, interval=DEFAULT_RETRY_INTERVAL):
+        """
+        Повторяет загрузку справочника в фоне, пока она не удастся - когда файла справочника нет,
+        а облако при запуске было недоступно. on_update(categories) вызывается после загрузки.
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    categories = self.refresh()
+                except Exception as e:
+                    logger.error(f'Ошибка загрузки справочника категорий: {e}')
+                    continue
+                if categories is not None:
+                    on_update(categories)
+                    return
+                logger.info(f'Справочник категорий Сбера не получен, повтор через {interval} с')
+
+        self._refresh_thread = Thread(target=run, name="SberCatalogRetry")
+        self._refresh_thread.daemon = True
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "etag": self.etag,
+            "source": self.source,
+        }
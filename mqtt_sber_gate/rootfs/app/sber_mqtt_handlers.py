@@ -0,0 +1,152 @@
+"""
+Обработчики сообщений Сбера из топиков .../down/*: команды, запросы состояний и конфигурации.
+
+Вынесены из sber-gate.py, чтобы те же обработчики можно было вызывать без запуска шлюза
+(воспроизведение записанного трафика, benchmarks/bench_replay.py).
+"""
+
+import logging
+import time
+
+import json_codec
+from metrics import MetricsRegistry
+from startup import PHASE_HA_REGISTRIES, PHASE_SBER_DICTIONARIES
+
+logger = logging.getLogger(__name__)
+
+
+class SberMqttHandlers:
+    def __init__(self, devices_db, commands, executor, sber_root_topic, startup=None, metrics=None):
+        """
+        Args:
+            devices_db (CDevicesDB): База устройств
+            commands (CommandDispatcher): Отправка команд в HA
+            executor (CommandExecutor): Пул обработчиков команд Сбера
+            sber_root_topic (str): Корневой топик пользователя Сбера (sberdevices/v1/<login>)
+            startup (StartupOrchestrator): Этапы запуска. Если не задан, конфигурация отправляется сразу
+            metrics (MetricsRegistry): Метрики для /metrics
+        """
+        self.devices_db = devices_db
+        self.commands = commands
+        self.executor = executor
+        self.sber_root_topic = sber_root_topic
+        self.startup = startup
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.commands_received = self.metrics.counter("sber_commands_total", "Команды Сбера для устройств")
+        self.status_requests = self.metrics.counter("sber_status_requests_total", "Запросы состояний от Сбера")
+        self.status_request_ms = self.metrics.histogram("sber_status_request_milliseconds", "Время ответа на запрос состояний от Сбера")
+        self.config_requests = self.metrics.counter("sber_config_requests_total", "Запросы конфигурации от Сбера")
+
+    def callbacks(self):
+        """Обработчики по топикам .../down/*"""
+        down = self.sber_root_topic + "/down"
+        return {
+            down + "/errors": self.on_errors,
+            down + "/commands": self.on_message_cmd,
+            down + "/status_request": self.on_message_stat,
+            down + "/config_request": self.on_message_conf,
+        }
+
+    def ha_OnOff(self, id, rollback=None):
+        OnOff = self.devices_db.get_state(id, 'on_off')
+        entity_domain, entity_name = id.split('.', 1)
+        logger.info('Отправляем команду в HA для %s ON: %s', id, OnOff)
+        if entity_domain == 'button':
+            service = 'press'
+        else:
+            if OnOff:
+                service = 'turn_on'
+            else:
+                service = 'turn_off'
+        self.commands.call_service(entity_domain, service, id, rollback=rollback)
+
+    def ha_climate(self, id, changes, rollback=None):
+        entity_domain, entity_name = id.split('.', 1)
+        logger.info('Отправляем команду в HA для %s Climate: ', id)
+        if self.devices_db.get_state(id, 'on_off'):
+            service_data = {"temperature": self.devices_db.get_state(id, 'hvac_temp_set'), "hvac_mode": "cool"}
+        else:
+            service_data = {"temperature": self.devices_db.get_state(id, 'hvac_temp_set'), "hvac_mode": "off"}
+        self.commands.call_service(entity_domain, 'set_temperature', id, service_data, rollback)
+
+    def send_status(self, mqttc, s):
+        mqttc.publish(self.sber_root_topic + '/up/status', s, qos=0)
+
+    def execute_device_command(self, id, cmd_data):
+        entity = self.devices_db.entities_store.get(id)
+        if entity is None:
+            # Состояние меняется до отправки команды - запоминаем прежнее на случай ошибки HA
+            rollback = self.devices_db.states_rollback(id)
+            changes = {}
+            for k in cmd_data['states']:
+                type = k['value'].get('type', '')
+                val = ''
+                if type == 'BOOL':
+                    val = k['value'].get('bool_value', False)
+                if type == 'INTEGER':
+                    val = k['value'].get('integer_value', 0)
+                if type == 'ENUM':
+                    val = k['value'].get('enum_value', '')
+
+                if self.devices_db.DB[id].get(k['key'], None) == val:
+                    changes[k['key']] = False
+                else:
+                    changes[k['key']] = True
+
+                self.devices_db.change_state(id, k['key'], val, command=True)
+
+            if self.devices_db.DB[id].get('entity_type', None) == 'climate':
+                self.ha_climate(id, changes, rollback)
+            else:
+                if self.devices_db.DB[id].get('entity_ha', False):
+                    self.ha_OnOff(id, rollback)
+                else:
+                    logger.info('Объект отсутствует в HA: %s', id)
+        else:
+            logger.info("(on_message_cmd)Изменяем состояние объекта: %s", id)
+            rollback = entity.state_rollback()
+            processing_result = entity.process_cmd(cmd_data)
+            for payload in processing_result:
+                command_to_send = payload.get("url", None)
+                if command_to_send is not None:
+                    self.commands.dispatch(command_to_send, rollback)
+
+    def on_message_cmd(self, mqttc, obj, msg):
+        received_at = time.monotonic()
+        data = json_codec.loads(msg.payload)
+        logger.info("(on_message_cmd) Sber MQTT Command: %s", data)
+        self.commands_received.inc(len(data['devices']))
+        # Команды выполняются пулом обработчиков, сетевой поток MQTT не ждет ответа HA
+        for id, cmd_data in data['devices'].items():
+            self.executor.submit(id, self.execute_device_command, id, cmd_data, received_at=received_at)
+
+    def on_message_stat(self, mqttc, obj, msg):
+        started = time.perf_counter()
+        try:
+            data = json_codec.loads(msg.payload).get('devices', [])
+            if (len(data) == 1) and data[0] == "":  # Это какой-то непонятный приход от сбера - пустой идентификатор сущности.
+                data = []
+        except Exception:
+            data = []
+        logger.info("GetStatus: %s", msg.payload)
+        answer = self.devices_db.do_mqtt_json_states_list(data)
+        self.send_status(mqttc, answer)
+        self.status_requests.inc()
+        self.status_request_ms.observe((time.perf_counter() - started) * 1000)
+        logger.debug("Answer: %s", answer)
+
+    def on_errors(self, mqttc, obj, msg):
+        logger.info("Sber MQTT Errors: %s %s %s", msg.topic, msg.qos, msg.payload)
+
+    def on_message_conf(self, mqttc, obj, msg):
+        logger.info("Config: %s %s %s", msg.topic, msg.qos, msg.payload)
+        self.config_requests.inc()
+
+        def send_config():
+            device_list = self.devices_db.do_mqtt_json_devices_list()
+            mqttc.publish(self.sber_root_topic + '/up/config', device_list, qos=0)
+        if self.startup is None:
+            send_config()
+            return
+        # Не блокируем поток MQTT ожиданием готовности базы и справочников - ответ уйдет, когда они будут загружены
+        self.startup.call_when_done((PHASE_HA_REGISTRIES, PHASE_SBER_DICTIONARIES), send_config)
@@ -0,0 +1,135 @@
+"""
+Отладочные снимки данных (списки устройств и состояний, реестры HA, сообщения websocket).
+
+Горячие пути только кладут данные в кольцевой буфер (capture) - без сериализации и записи на диск.
+Фоновый поток записывает последние снимки в файлы не чаще, чем раз в interval секунд,
+запись по запросу выполняет flush (адрес /api/v2/snapshots).
+"""
+
+import collections
+import logging
+import threading
+import time
+from threading import Thread
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60
+DEFAULT_HISTORY = 5
+
+
+class Snapshot:
+    """Снимок: данные и время их получения"""
+    __slots__ = ("data", "captured_at")
+
+    def __init__(self, data, captured_at):
+        self.data = data
+        self.captured_at = captured_at
+
+
+class SnapshotService:
+    def __init__(self, interval=DEFAULT_INTERVAL, history=DEFAULT_HISTORY):
+        # interval - период записи снимков на диск в секундах, 0 - только по запросу
+        self.interval = interval
+        self.history = max(1, history)
+        self._buffers = {}
+        self._dirty = set()
+        self._written_at = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.captured = 0
+        self.written = 0
+        self.write_errors = 0
+
+    def capture(self, name, data):
+        """
+        Сохраняет снимок в кольцевой буфер. Данные не копируются - вызывающий не должен их изменять
+        после передачи (строки json и ответы HA этому условию удовлетворяют).
+        """
+        snapshot = Snapshot(data, time.time())
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = collections.deque(maxlen=self.history)
+            buffer.append(snapshot)
+            self._dirty.add(name)
+            self.captured += 1
+
+    def latest(self, name):
+        """Последний снимок или None"""
+        with self._lock:
+            buffer = self._buffers.get(name)
+            return buffer[-1] if buffer else None
+
+    def get_history(self, name):
+        """Снимки из кольцевого буфера, от старых к новым"""
+        with self._lock:
+            return list(self._buffers.get(name, ()))
+
+    def flush(self, names=None):
+        """Записывает последние снимки в файлы <name>. names=None - все измененные снимки. Возвращает записанные имена"""
+        with self._lock:
+            if names is None:
+                names = list(self._dirty)
+            pending = [(name, self._buffers[name][-1]) for name in names if self._buffers.get(name)]
+            self._dirty.difference_update(name for name, _ in pending)
+
+        written = []
+        for name, snapshot in pending:
+            try:
+                with open(name, "w", encoding="utf-8") as file:
+                    file.write(json_codec.dumps_pretty(snapshot.data))
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Не удалось записать снимок {name}: {e}")
+                continue
+            self._written_at[name] = snapshot.captured_at
+            self.written += 1
+            written.append(name)
+        return written
+
+    def index(self):
+        """Сведения о снимках для /api/v2/snapshots"""
+        with self._lock:
+            return {
+                name: {
+                    "history": len(buffer),
+                    "captured_at": buffer[-1].captured_at,
+                    "written_at": self._written_at.get(name),
+                }
+                for name, buffer in self._buffers.items() if buffer
+            }
+
+    def stats(self):
+        with self._lock:
+            dirty = len(self._dirty)
+        return {
+            "interval": self.interval,
+            "captured": self.captured,
+            "written": self.written,
+            "write_errors": self.write_errors,
+            "dirty": dirty,
+        }
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, name="SnapshotWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает поток записи и записывает несохраненные снимки - и при записи только по запросу"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
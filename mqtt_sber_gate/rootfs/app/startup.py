@@ -0,0 +1,126 @@
+"""
+Этапы запуска шлюза: события готовности и замер длительности каждого этапа.
+
+Подсистемы запускаются параллельно, а действия, которым нужны результаты нескольких
+этапов (например, отправка конфигурации в Сбер), ждут готовности через call_when_done.
+"""
+
+import logging
+import threading
+import time
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+PHASE_SBER_MQTT = "sber_mqtt"
+PHASE_SBER_ENDPOINT = "sber_endpoint"
+PHASE_SBER_DICTIONARIES = "sber_dictionaries"
+PHASE_HTTP_SERVER = "http_server"
+PHASE_HA_REGISTRIES = "ha_registries"
+
+STARTUP_PHASES = (PHASE_SBER_MQTT, PHASE_SBER_ENDPOINT, PHASE_SBER_DICTIONARIES, PHASE_HTTP_SERVER, PHASE_HA_REGISTRIES)
+
+
+class Phase:
+    __slots__ = ("started_at", "finished_at", "event")
+
+    def __init__(self):
+        self.started_at = None
+        self.finished_at = None
+        self.event = threading.Event()
+
+
+class StartupOrchestrator:
+    def __init__(self, phases=STARTUP_PHASES, clock=time.monotonic):
+        self.clock = clock
+        self.started_at = clock()
+        self.finished_at = None
+        self._phases = {name: Phase() for name in phases}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def begin(self, name):
+        """Отмечает начало этапа (если не отмечено, этап считается начатым при запуске)"""
+        with self._lock:
+            phase = self._phases[name]
+            if phase.started_at is None:
+                phase.started_at = self.clock()
+
+    def done(self, name):
+        """Отмечает завершение этапа и вызывает ожидавшие его действия. Повторные вызовы игнорируются"""
+        with self._lock:
+            phase = self._phases[name]
+            if phase.event.is_set():
+                return
+            now = self.clock()
+            if phase.started_at is None:
+                phase.started_at = self.started_at
+            phase.finished_at = now
+            phase.event.set()
+            ready, waiting = [], []
+            for names, callback in self._callbacks:
+                (ready if self._all_done(names) else waiting).append((names, callback))
+            self._callbacks = waiting
+            all_done = self._all_done(self._phases)
+            if all_done:
+                self.finished_at = now
+        logger.info(f"Запуск: этап {name} завершен за {(now - phase.started_at) * 1000:.0f} мс")
+        if all_done:
+            self.log_summary()
+        for _, callback in ready:
+            callback()
+
+    def is_done(self, name):
+        return self._phases[name].event.is_set()
+
+    def wait(self, name, timeout=None):
+        return self._phases[name].event.wait(timeout)
+
+    def call_when_done(self, names, callback):
+        """Вызывает callback, когда завершены все этапы names (сразу, если уже завершены)"""
+        with self._lock:
+            if not self._all_done(names):
+                self._callbacks.append((tuple(names), callback))
+                return
+        callback()
+
+    def run_in_background(self, name, func):
+        """Выполняет этап в отдельном потоке. func сама отмечает завершение этапа"""
+        self.begin(name)
+
+        def run():
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"Запуск: ошибка на этапе {name}: {e}")
+
+        thread = Thread(target=run, name=f"Startup-{name}")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _all_done(self, names):
+        return all(self._phases[name].event.is_set() for name in names)
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            phases = {}
+            for name, phase in self._phases.items():
+                started = phase.started_at
+                finished = phase.finished_at
+                phases[name] = {
+                    "started_ms": round((started - self.started_at) * 1000, 1) if started is not None else None,
+                    "duration_ms": round(((finished if finished is not None else now) - started) * 1000, 1) if started is not None else None,
+                    "done": finished is not None,
+                }
+            total_end = self.finished_at if self.finished_at is not None else now
+            return {"total_ms": round((total_end - self.started_at) * 1000, 1), "done": self.finished_at is not None, "phases": phases}
+
+    def log_summary(self):
+        stats = self.stats()
+        details = ", ".join(
+            f"{name} {phase['duration_ms']} мс (с {phase['started_ms']} мс)"
+            for name, phase in stats["phases"].items() if phase["done"]
+        )
+        logger.info(f"Запуск завершен за {stats['total_ms']} мс: {details}")
@@ -0,0 +1,160 @@
+"""
+Публикация состояний сущностей в Сбер с накоплением изменений
+"""
+
+import logging
+import threading
+import time
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_MS = 100
+
+
+class StatePublisher:
+    """
+    Накапливает идентификаторы изменившихся сущностей ("грязные" сущности) и раз в окно
+    публикует их состояния в топик /up/status одним сообщением.
+    Публикация не пишет ничего на диск - только сборка json и отправка в MQTT.
+    """
+
+    def __init__(self, devices_db, mqttc, sber_root_topic, window_ms=DEFAULT_WINDOW_MS):
+        """
+        Args:
+            devices_db (CDevicesDB): База устройств, из которой берутся состояния
+            mqttc: MQTT клиент Сбера
+            sber_root_topic (str): Корневой топик Сбера (sberdevices/v1/<login>)
+            window_ms (int): Окно накопления изменений в миллисекундах. 0 - публиковать сразу.
+        """
+        self.devices_db = devices_db
+        self.mqttc = mqttc
+        self.sber_root_topic = sber_root_topic
+        self.window = max(0, window_ms) / 1000.0
+
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._loop = None
+        self._async_wakeup = None
+        # Публикация ждет готовности базы устройств (callback зарегистрирован в call_when_ready)
+        self._waiting_ready = False
+
+        self.running = False
+        self.thread = None
+
+        self.published_batches = 0
+        self.published_entities = 0
+
+    def mark_dirty(self, entity_id):
+        """Помечает сущность как изменившуюся. Вызывается из горячего пути, поэтому ничего не публикует сам."""
+        with self._lock:
+            self._dirty.add(entity_id)
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None:
+            if not self._async_wakeup.is_set():
+                self._loop.call_soon_threadsafe(self._async_wakeup.set)
+        else:
+            self._wakeup.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """
+        Публикует состояния всех накопленных сущностей одним сообщением.
+        Возвращает количество опубликованных сущностей.
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty = self._dirty
+            self._dirty = set()
+
+        payload = self.devices_db.build_mqtt_json_states_list(sorted(dirty))
+        if payload is None:
+            # Сущности остаются "грязными" и уйдут, как только база будет готова
+            with self._lock:
+                self._dirty |= dirty
+                wait_ready = not self._waiting_ready
+                self._waiting_ready = True
+            if wait_ready:
+                self.devices_db.call_when_ready(self._on_db_ready)
+            logger.debug("(StatePublisher.flush) База устройств не готова, откладываем публикацию %d сущностей", len(dirty))
+            return 0
+
+        self.mqttc.publish(self.sber_root_topic + '/up/status', payload, qos=0)
+        self.published_batches += 1
+        self.published_entities += len(dirty)
+        logger.debug("(StatePublisher.flush) Опубликованы состояния %d сущностей", len(dirty))
+        return len(dirty)
+
+    def _on_db_ready(self):
+        with self._lock:
+            self._waiting_ready = False
+        self._wake()
+
+    def stats(self):
+        return {
+            "window_ms": int(self.window * 1000),
+            "pending": self.pending_count(),
+            "published_batches": self.published_batches,
+            "published_entities": self.published_entities,
+        }
+
+    def _run(self):
+        while self.running:
+            self._wakeup.wait()
+            if not self.running:
+                break
+            if self.window > 0:
+                time.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка публикации состояний в Сбер: {e}")
+
+    def attach_loop(self, loop):
+        """Переводит публикатор на работу в цикле asyncio (см. run_async) вместо отдельного потока"""
+        import asyncio
+
+        self._loop = loop
+        self._async_wakeup = asyncio.Event()
+
+    async def run_async(self):
+        """Цикл публикации для asyncio режима. Перед запуском нужно вызвать attach_loop."""
+        import asyncio
+
+        self.running = True
+        try:
+            while self.running:
+                await self._async_wakeup.wait()
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+                self._async_wakeup.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Ошибка публикации состояний в Сбер: {e}")
+        finally:
+            self.running = False
+
+    def start(self):
+        """Start publisher in background thread"""
+        self.running = True
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Останавливает поток публикации и отправляет то, что успело накопиться"""
+        self.running = False
+        self._wakeup.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join()
+        self.thread = None
+        self.flush()
@@ -0,0 +1,126 @@
+"""
+Кеш статических файлов интерфейса в памяти.
+
+Файл читается и сжимается (gzip, brotli - если установлен модуль brotli) один раз,
+повторно - только при изменении времени модификации. Для каждого файла хранится ETag
+и Last-Modified для условных запросов (304 Not Modified).
+"""
+
+import email.utils
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Меньшие файлы не сжимаются - выигрыш меньше накладных расходов
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/vnd.microsoft.icon")
+
+# Файлы сборки с хешем в имени не меняются - их можно кешировать в браузере без проверки
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+
+
+class StaticAsset:
+    __slots__ = ("mime_type", "body", "encodings", "etag", "mtime", "last_modified", "cache_control")
+
+    def __init__(self, mime_type, body, mtime, cache_control):
+        self.mime_type = mime_type
+        self.body = body
+        self.mtime = mtime
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+        self.cache_control = cache_control
+        # Кодировка (br, gzip) -> сжатое содержимое
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_SIZE and mime_type.startswith(COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(body)
+            self.encodings["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+
+    def select_encoding(self, accept_encoding):
+        """Выбирает сжатие по заголовку Accept-Encoding. Возвращает (кодировка или None, тело)"""
+        if accept_encoding:
+            accepted = {item.split(";")[0].strip() for item in accept_encoding.split(",")}
+            for encoding, body in self.encodings.items():
+                if encoding in accepted:
+                    return encoding, body
+        return None, self.body
+
+    def not_modified(self, if_none_match, if_modified_since):
+        """Проверка условного запроса: True - клиент уже имеет актуальную версию"""
+        if if_none_match is not None:
+            return self.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.mtime) <= since
+        return False
+
+
+class StaticAssetCache:
+    def __init__(self, mime_types, immutable_prefixes=("/static/",)):
+        # mime_types - расширение -> тип содержимого (ключ "default" - для остальных)
+        self.mime_types = mime_types
+        self.immutable_prefixes = immutable_prefixes
+        self._assets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, url_path, file_path):
+        """Файл из кеша (перечитывается при изменении). None, если файл не найден"""
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            return None
+        asset = self._assets.get(file_path)
+        if asset is not None and asset.mtime == mtime:
+            self.hits += 1
+            return asset
+
+        with self._lock:
+            asset = self._assets.get(file_path)
+            if asset is not None and asset.mtime == mtime:
+                return asset
+            try:
+                with open(file_path, "rb") as file:
+                    body = file.read()
+            except OSError as e:
+                logger.error(f"Не удалось прочитать {file_path}: {e}")
+                return None
+            extension = os.path.splitext(file_path)[1]
+            mime_type = self.mime_types.get(extension, self.mime_types["default"])
+            if mime_type.startswith("text/"):
+                mime_type += "; charset=utf-8"
+            cache_control = CACHE_CONTROL_IMMUTABLE if url_path.startswith(self.immutable_prefixes) else CACHE_CONTROL_REVALIDATE
+            asset = StaticAsset(mime_type, body, mtime, cache_control)
+            self._assets[file_path] = asset
+            self.loads += 1
+            logger.debug(f"Файл {file_path} загружен в кеш: {len(body)} байт, сжатие {list(asset.encodings)}")
+            return asset
+
+    def preload(self, files, skip_extensions=()):
+        """Загружает и сжимает файлы заранее. files - адрес -> путь к файлу"""
+        for url_path, file_path in files.items():
+            if os.path.splitext(file_path)[1] not in skip_extensions:
+                self.get(url_path, file_path)
+
+    def stats(self):
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(asset.body) for asset in list(self._assets.values())),
+            "hits": self.hits,
+            "loads": self.loads,
+            "brotli": brotli is not None,
+        }
@@ -0,0 +1,146 @@
+"""
+Запись трафика шлюза для воспроизведения (benchmarks/bench_replay.py).
+
+Записываются кадры websocket HA и сообщения MQTT Сбера в том виде, в каком они пришли.
+Формат - gzip, одна запись на строку: [мс от начала записи, источник, топик, данные].
+Для кадров HA топик null, данные - текст кадра; для MQTT - топик и payload в utf-8.
+Запись в файл выполняется отдельным потоком: обработчики только кладут запись в очередь.
+Когда очередь переполнена или записано max_bytes, новые записи отбрасываются и считаются.
+"""
+
+import gzip
+import json
+import logging
+import queue
+import time
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+SOURCE_HA = "ha"
+SOURCE_SBER = "sber"
+DEFAULT_FILE = "traffic.jsonl.gz"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 50
+DEFAULT_QUEUE_SIZE = 10000
+# Как часто сбрасывать gzip на диск, когда новых записей нет (секунды)
+FLUSH_INTERVAL = 1.0
+
+_STOP = object()
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_traffic(path):
+    """Записи файла трафика: (мс от начала записи, источник, топик, данные)"""
+    with _open(path, "r") as file:
+        for line in file:
+            if line.strip():
+                t_ms, source, topic, data = json.loads(line)
+                yield t_ms, source, topic, data
+
+
+def write_traffic(path, records):
+    """Записывает записи (мс, источник, топик, данные) в файл трафика"""
+    with _open(path, "w") as file:
+        for record in records:
+            file.write(json.dumps(list(record), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+class TrafficRecorder:
+    def __init__(self, path=DEFAULT_FILE, max_bytes=DEFAULT_MAX_BYTES, queue_size=DEFAULT_QUEUE_SIZE, clock=time.monotonic):
+        """
+        Args:
+            path (str): Файл записи (.gz - со сжатием)
+            max_bytes (int): Максимальный объем записи до сжатия
+            queue_size (int): Сколько записей может ждать потока записи
+            clock (callable): Источник времени в секундах
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._queue = queue.Queue(queue_size)
+        self._started_at = None
+        self.thread = None
+        self.recorded = 0
+        self.written_bytes = 0
+        self.dropped = 0
+        self.limit_reached = False
+
+    def record_ha(self, frame):
+        """Кадр websocket HA (текст)"""
+        self._record(SOURCE_HA, None, frame)
+
+    def record_sber(self, topic, payload):
+        """Сообщение MQTT Сбера"""
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8", errors="replace")
+        self._record(SOURCE_SBER, topic, payload)
+
+    def wrap_mqtt_callback(self, callback):
+        """Оборачивает обработчик MQTT: сообщение записывается до вызова обработчика"""
+        def wrapper(client, userdata, msg):
+            self.record_sber(msg.topic, msg.payload)
+            return callback(client, userdata, msg)
+        return wrapper
+
+    def _record(self, source, topic, data):
+        if self.thread is None or self.limit_reached:
+            return
+        t_ms = round((self.clock() - self._started_at) * 1000, 3)
+        try:
+            self._queue.put_nowait((t_ms, source, topic, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self._started_at = self.clock()
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info("Запись трафика в %s", self.path)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        thread = self.thread
+        self.thread = None
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _run(self):
+        with _open(self.path, "w") as file:
+            while True:
+                try:
+                    record = self._queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    file.flush()
+                    continue
+                if record is _STOP:
+                    break
+                if self.limit_reached:
+                    self.dropped += 1
+                    continue
+                line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                size = len(line.encode("utf-8"))
+                if self.written_bytes + size > self.max_bytes:
+                    self.limit_reached = True
+                    self.dropped += 1
+                    logger.warning("Запись трафика остановлена: достигнут размер %d байт", self.max_bytes)
+                    continue
+                file.write(line)
+                self.written_bytes += size
+                self.recorded += 1
+
+    def stats(self):
+        return {
+            "file": self.path,
+            "recording": self.thread is not None,
+            "recorded": self.recorded,
+            "bytes": self.written_bytes,
+            "dropped": self.dropped,
+            "limit_reached": self.limit_reached,
+        }
@@ -1,7 +1,8 @@
 function Init(){
    AddBlok('<h1>SberGate version: 1.0.17</h1>')
    AddBlok('<a href="index.html">Перейти к настройкам СберАгента</a></p>')
-   AddBlok('<a href="SberGate.log">Скачать SberGate.log</a></p>')
+   AddBlok('<a href="SberGate.log">Скачать SberGate.log</a> <button id="log_follow" onclick="LogFollow()">Следить за журналом</button></p>')
+   AddBlok('<pre id="log_tail" class="log"></pre>')
    AddBlok('<a href="data/devices.json" download="devices.json">Скачать devices.json</a></p>')
    AddBlok('<a href="data/categories.json" download="categories.json">Скачать categories.json</a></p>')
    AddBlok('<h2>Команды:</h2>')
@@ -19,6 +20,44 @@ function AddBlok(str,CN){
 //   document.body.append(div);
 }
 
+var LogOffset = null;
+var LogFileId = null;
+var LogFollowing = false;
+function LogFollow(){
+   LogFollowing = !LogFollowing;
+   document.getElementById('log_follow').textContent = LogFollowing ? 'Остановить' : 'Следить за журналом';
+   if (LogFollowing) {LogTail();}
+}
+
+function LogTail(){
+   if (!LogFollowing) {return;}
+   let url = '/api/v2/logs/tail?wait=10';
+   if (LogOffset !== null) {url += '&offset=' + LogOffset + '&file_id=' + encodeURIComponent(LogFileId);}
+   let xhr = new XMLHttpRequest();
+   xhr.open('GET', url);
+   xhr.send();
+   xhr.onload = function() {
+      if (xhr.status == 200) {
+         let r = JSON.parse(xhr.response);
+         let pre = document.getElementById('log_tail');
+         if (r['reset']) {pre.textContent = '';}
+         pre.textContent += r['data'];
+         // В окне храним только конец журнала
+         if (pre.textContent.length > 200000) {pre.textContent = pre.textContent.slice(-100000);}
+         pre.scrollTop = pre.scrollHeight;
+         LogOffset = r['offset'];
+         LogFileId = r['file_id'];
+         LogTail();
+      } else {
+         console.log(`Ошибка ${xhr.status}: ${xhr.statusText}`);
+         setTimeout(LogTail, 5000);
+      }
+   };
+   xhr.onerror = function() {
+      setTimeout(LogTail, 5000);
+   };
+}
+
 function RunCmd(id,opt){
    alert(id+':'+opt);
    let s = {'command':id}
@@ -2,12 +2,16 @@
 WebSocket handler module for SberGate integration
 """
 
-import asyncio
 import threading
 # from devices.light import LightEntity
-from devices_db import json_write
+from snapshots import SnapshotService
+from metrics import MetricsRegistry
+from command_tracker import CommandTracker, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from ha_subscriptions import EntitySubscriptions, SUBSCRIPTION_ENTITIES, SUBSCRIPTION_ALL
+from event_filter import EventFilter, DEFAULT_IGNORE_RULES
+from ws_frame import peek_frame, FRAME_TYPE_EVENT
 import websocket
-import json
+import json_codec
 import logging
 import time
 from threading import Thread
@@ -16,6 +20,8 @@ logger = logging.getLogger(__name__)
 
 async def async_publish(mqttc, topic, payload, qos=0):
    """Асинхронная обертка для mqttc.publish"""
+   import asyncio
+
    if (mqttc.is_connected()):
     await asyncio.to_thread(mqttc.publish, topic, payload, qos)
 
@@ -23,7 +29,7 @@ async def async_publish(mqttc, topic, payload, qos=0):
 class WebSocketHandler:
     """Class for handling WebSocket communication with Home Assistant"""
     
-    def __init__(self, devices_db, devices_converter, mqttc, options):
+    def __init__(self, devices_db, devices_converter, mqttc, options, state_publisher=None, snapshots=None, metrics=None, recorder=None):
         """
         Initialize WebSocket handler
         
@@ -32,6 +38,10 @@ class WebSocketHandler:
             ha_api_token (str): Authentication token
             devices_db (CDevicesDB): Devices database instance
             options (dict): Configuration options
+            state_publisher (StatePublisher): Публикатор состояний в Сбер. Если не задан, состояния публикуются сразу.
+            snapshots (SnapshotService): Отладочные снимки сообщений и реестров HA.
+            metrics (MetricsRegistry): Метрики для /metrics.
+            recorder (TrafficRecorder): Запись полученных кадров для воспроизведения. Если не задан, кадры не записываются.
         """
         ha_api_url = options['ha-api_url']
         self.ws_url = ha_api_url.replace('http', 'ws', 1) + '/api/websocket'
@@ -46,6 +56,9 @@ class WebSocketHandler:
         self.sber_root_topic='sberdevices/v1/'+options['sber-mqtt_login']
 
         self.mqttc = mqttc
+        self.state_publisher = state_publisher
+        self.snapshots = snapshots if snapshots is not None else SnapshotService()
+        self.recorder = recorder
         self.HA_AREA = {}
         self.running = True
         self.ws = None
@@ -54,6 +67,17 @@ class WebSocketHandler:
         self.command_lock = threading.Lock()
 
         self.command_counter = 0
+        self.authenticated = False
+        # Отправленные команды, ожидающие результата HA
+        self.commands = CommandTracker(
+            resend=self._resend_command,
+            on_failure=self._on_command_failed,
+            timeout=options.get('ha-command_timeout', DEFAULT_TIMEOUT),
+            retries=options.get('ha-command_retries', DEFAULT_RETRIES),
+        )
+        # Подписка только на переданные в Сбер сущности или на все события state_changed
+        self.subscription_mode = options.get('ha-event_subscription', SUBSCRIPTION_ENTITIES)
+        self.subscriptions = EntitySubscriptions(self.send_request)
 
         self.handler_map = {
             'auth_required': self.handle_auth_required,
@@ -65,30 +89,71 @@ class WebSocketHandler:
             'None': self.handle_default
         }
 
-        self.dont_log_messages_for = ["sensor.archer_ax58", "sensor.datchik_kachestva_vozdukha", "sensor.yandex_pogoda", "sensor.datchik_osveshchennosti_i_prisutstviia_osveshchennost", "sun.sun", "device_tracker", "person"]
-#        self.dont_log_messages_for = []
+        # События каких сущностей не обрабатываются
+        self.event_filter = EventFilter(options.get('ha-event_ignore', DEFAULT_IGNORE_RULES), options.get('ha-event_allow', []))
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics.counter("ha_frames_total", "Кадры websocket HA: разобраны или пропущены по заголовку", ("result",),
+                             func=lambda: {("decoded",): self.frames_decoded, ("skipped",): self.frames_skipped})
+        events = self.metrics.counter("ha_events_total", "События state_changed HA: обработаны или отброшены фильтром", ("result",))
+        self._events_processed = events.labels("processed")
+        self._events_filtered = events.labels("filtered")
+        self._event_ms = self.metrics.histogram("ha_event_processing_milliseconds", "Время обработки события HA от получения кадра")
+        self._connections = self.metrics.counter("ha_websocket_connections_total", "Подключения websocket к HA")
+        self._disconnections = self.metrics.counter("ha_websocket_disconnections_total", "Разрывы websocket соединения с HA")
+        self.metrics.gauge("ha_websocket_connected", "Соединение с HA установлено и авторизовано", func=lambda: int(self.is_connected()))
+        self.metrics.gauge("ha_commands_pending", "Команды HA, ожидающие результата", func=lambda: len(self.commands.pending))
+        self.metrics.histogram("ha_command_milliseconds", "Время выполнения команд HA через websocket", ("service",),
+                               func=lambda: {(service,): histogram for service, histogram in list(self.commands.latency_by_service.items())})
 
 
     def on_open(self, ws):
         """Handle WebSocket open event"""
         logger.info("WebSocket: opened")
         self.ws = ws
+        self._connections.inc()
 
     def on_close(self, ws, close_status_code, close_msg):
         """Handle WebSocket close event"""
         logger.info(f"WebSocket: Connection closed ({close_status_code}: {close_msg})")
+        self.authenticated = False
+        self._disconnections.inc()
+        self.subscriptions.reset()
+        lost_commands = self.commands.fail_all("websocket connection closed")
+        if lost_commands > 0:
+            logger.warning(f"WebSocket: {lost_commands} команд остались без ответа HA")
+
+    def is_connected(self):
+        """Соединение с HA установлено и авторизовано - можно отправлять команды"""
+        return self.authenticated and self.ws is not None
 
     # async def _process_event(self, entity_id, old_state, new_state):
     def on_message(self, ws, message):
     # async def on_message_async(self, ws, message):
         """Handle incoming WebSocket messages"""
+        started = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.record_ha(message)
         try:
-            message_data = json.loads(message)
+            # Судьба события решается по заголовку кадра - до полного разбора json
+            header = peek_frame(message)
+            if header.type == FRAME_TYPE_EVENT and not self._accept_frame(header):
+                self.frames_skipped += 1
+                return
+            self.frames_decoded += 1
+            message_data = json_codec.loads(message)
             if "event" in message_data:
-                for dont_log in self.dont_log_messages_for:
-                    if message_data['event']['data']['entity_id'].startswith(dont_log):
-                        return
-                
+                trigger_event = self.subscriptions.parse_event(message_data["event"])
+                if trigger_event is not None:
+                    if self._accept_event(*trigger_event):
+                        self._process_event(*trigger_event)
+                        self._event_done(started)
+                    else:
+                        self._events_filtered.inc()
+                    return
+
                 event_data = message_data["event"]
                 event_type = event_data["event_type"]
                 if event_type == "state_changed":
@@ -96,14 +161,18 @@ class WebSocketHandler:
                     entity_id = data["entity_id"]
                     old_state = data["old_state"]
                     new_state = data["new_state"]
-                    logger.debug(f"WebSocket: Received message {event_type} for {entity_id}: {new_state}")
+                    if not self._accept_event(entity_id, old_state, new_state):
+                        self._events_filtered.inc()
+                        return
+                    logger.debug("WebSocket: Received message %s for %s: %s", event_type, entity_id, new_state)
                     self._process_event(entity_id, old_state, new_state)
+                    self._event_done(started)
                     # await self._process_event(entity_id, old_state, new_state)
                 else:
-                    logger.debug(f"Unknown event type is got: {event_type}")
+                    logger.debug("Unknown event type is got: %s", event_type)
             else:
-                logger.debug(f"WebSocket: Received message type: {message_data['type']}")
-                json_write("ws_received_message.json", message)
+                logger.debug("WebSocket: Received message type: %s", message_data['type'])
+                self.snapshots.capture("ws_received_message.json", message)
 
                 msg_type = message_data.get('type')
                 if msg_type is None:
@@ -114,29 +183,134 @@ class WebSocketHandler:
         except Exception as e:
             logger.error(f"Error processing WebSocket message: {e}")
 
+    def _event_done(self, started):
+        self._events_processed.inc()
+        self._event_ms.observe((time.perf_counter() - started) * 1000)
+
+    def _accept_frame(self, header):
+        """Нужно ли разбирать кадр события: тип события обрабатывается, а сущность известна шлюзу и не отфильтрована"""
+        if header.event_type is not None and header.event_type != "state_changed":
+            logger.debug("Unknown event type is got: %s", header.event_type)
+            return False
+        if header.entity_id is None:
+            return True
+        if not self.event_filter.accept_id(header.entity_id):
+            return False
+        return self._handles_entity(header.entity_id)
+
+    def _handles_entity(self, entity_id):
+        """Сущность есть в хранилище сущностей или в базе устройств старого формата"""
+        if self.devices_db is None:
+            return True
+        return self.devices_db.entities_store.get(entity_id) is not None or entity_id in self.devices_db.DB
+
+    def frame_stats(self):
+        return {
+            "decoded": self.frames_decoded,
+            "skipped": self.frames_skipped,
+        }
+
+    def _accept_event(self, entity_id, old_state, new_state):
+        """Проверка события правилами фильтра, включая класс устройства из нового состояния"""
+        if entity_id is None:
+            return True
+        device_class = None
+        if new_state is not None:
+            device_class = new_state.get("attributes", {}).get("device_class")
+        return self.event_filter.accept(entity_id, device_class)
+
     def handle_auth_required(self, data):
         """Handle authentication required message"""
         logger.info("WebSocket: auth_required")
         with self.command_lock:
-            self.ws.send(json.dumps({"type": "auth", "access_token": self.ha_api_token}))
+            self.ws.send(json_codec.dumps({"type": "auth", "access_token": self.ha_api_token}))
 
     def handle_auth_ok(self, data):
         """Handle authentication success"""
         logger.info("WebSocket: auth_ok")
         with self.command_lock:
-            self.ws.send(json.dumps({'id': 1, 'type': 'subscribe_events', 'event_type': 'state_changed'}))
-            self.ws.send(json.dumps({'id': 2, 'type': 'config/area_registry/list'}))
-            self.ws.send(json.dumps({'id': 3, 'type': 'config/device_registry/list'}))
-            self.ws.send(json.dumps({'id': 4, 'type': 'config/entity_registry/list'}))
-            self.ws.send(json.dumps({'id': 5, 'type': 'get_states'}))
+            if self.subscription_mode == SUBSCRIPTION_ALL:
+                self.ws.send(json_codec.dumps({'id': 1, 'type': 'subscribe_events', 'event_type': 'state_changed'}))
+            self.ws.send(json_codec.dumps({'id': 2, 'type': 'config/area_registry/list'}))
+            self.ws.send(json_codec.dumps({'id': 3, 'type': 'config/device_registry/list'}))
+            self.ws.send(json_codec.dumps({'id': 4, 'type': 'config/entity_registry/list'}))
+            self.ws.send(json_codec.dumps({'id': 5, 'type': 'get_states'}))
             self.command_counter = 6
+        self.authenticated = True
 
-    def send_command(self, command):
-        logger.debug(f"(WebSocketHandler.send_command) WebSocket: sending command [{self.command_counter}]: {command}")
+    def send_request(self, message):
+        """Отправляет служебное сообщение в HA без ожидания результата. Возвращает id сообщения."""
         with self.command_lock:
-            command["id"] = self.command_counter
+            message_id = self.command_counter
+            message["id"] = message_id
             self.command_counter += 1
-            self.ws.send(json.dumps(command))
+            self.ws.send(json_codec.dumps(message))
+        return message_id
+
+    def sync_subscriptions(self):
+        """Подписывается на изменения всех переданных в Сбер сущностей"""
+        if self.subscription_mode != SUBSCRIPTION_ENTITIES or not self.is_connected():
+            return
+        try:
+            self.subscriptions.sync(self.devices_db.exposed_entity_ids())
+        except Exception as e:
+            logger.error(f"WebSocket: ошибка подписки на сущности: {e}")
+
+    def on_exposure_changed(self, entity_id, enabled):
+        """Сущность включена или выключена в Сбере - добавляем или снимаем подписку"""
+        if self.subscription_mode != SUBSCRIPTION_ENTITIES or not self.is_connected():
+            return
+        try:
+            if enabled:
+                self.subscriptions.subscribe(entity_id)
+            else:
+                self.subscriptions.unsubscribe(entity_id)
+        except Exception as e:
+            logger.error(f"WebSocket: ошибка изменения подписки на {entity_id}: {e}")
+
+    def send_command(self, command, on_done=None, pending=None, rollback=None):
+        """
+        Отправляет команду в HA. Возвращает id сообщения, по которому HA пришлет результат.
+        on_done(future) вызывается, когда команда выполнена, завершилась ошибкой или таймаутом.
+        rollback() вызывается, если команда не выполнена - возвращает сущности состояние до команды.
+        При ошибке отправки выбрасывает исключение websocket.
+        """
+        logger.debug("(WebSocketHandler.send_command) WebSocket: sending command [%s]: %s", self.command_counter, command)
+        with self.command_lock:
+            command_id = self.command_counter
+            command["id"] = command_id
+            self.command_counter += 1
+            pending = self.commands.track(command_id, command, pending, rollback)
+            try:
+                self.ws.send(json_codec.dumps(command))
+            except Exception:
+                self.commands.discard(command_id)
+                raise
+        if on_done is not None:
+            pending.future.add_done_callback(on_done)
+        return command_id
+
+    def _resend_command(self, pending):
+        if not self.is_connected():
+            raise ConnectionError("websocket is not connected")
+        return self.send_command(pending.command, pending=pending)
+
+    def _on_command_failed(self, pending, error):
+        """
+        Команда не выполнена. Состояние сущности уже изменено при разборе команды Сбера -
+        возвращаем состояние до команды и передаем его Сберу.
+        """
+        if pending.rollback is not None:
+            pending.rollback()
+        for entity_id in pending.entity_ids:
+            self.publish_state(entity_id)
+
+    def _complete_command(self, data):
+        """Сопоставляет результат с отправленной командой по id"""
+        if self.subscriptions.handle_result(data):
+            return
+        if not self.commands.complete(data):
+            logger.info("WebSocket: result: %s", data)
 
     def handle_auth_invalid(self, data):
         """Handle authentication failure"""
@@ -147,19 +321,19 @@ class WebSocketHandler:
         """Handle result messages"""
         if data.get('id') == 2:
             logger.info(f"WebSocket: Получен список зон: {data}")
-            json_write("ha_area.json", data)
+            self.snapshots.capture("ha_area.json", data)
             self.HA_AREA = {a['area_id']: a['name'] for a in data.get('result', [])}
             logger.info(f"HA_AREA: {self.HA_AREA}")
             
         elif data.get('id') == 3:
-            json_write("device_registry.json", data)
+            self.snapshots.capture("device_registry.json", data)
             device_data = data.get('result', [])
             for device_data_item in device_data:
                 self.devices_db.upsert_device_data(device_data_item)
 
         elif data.get('id') == 4:
             logger.info(f"WebSocket: Получен список сущностей.")
-            json_write("entity_registry.json", data)
+            self.snapshots.capture("entity_registry.json", data)
             entities = data.get('result', [])
             for ha_entity in entities:
                 entity_id = ha_entity['entity_id']
@@ -170,7 +344,7 @@ class WebSocketHandler:
         elif data.get('id') == 5:
             logger.info(f"WebSocket: Получены состояния сущностей.")
             states = data.get("result", [])
-            json_write("states_registry.json", states)
+            self.snapshots.capture("states_registry.json", states)
             self.devices_converter.update_entities(states)
             for state in states:
                 entity_id = state.get('entity_id')
@@ -179,22 +353,21 @@ class WebSocketHandler:
                     if entity:
                         entity.fill_by_ha_state(state)
             self.devices_db.setReady()
+            self.sync_subscriptions()
 
         else: 
-            logger.info(f"WebSocket: result: {data}")
+            self._complete_command(data)
 
     def _process_event(self, entity_id, old_state, new_state):
         if entity_id is None or new_state is None:
-            logger.info(f"Either entity_id or new_state is None. entity_id: {entity_id}, new_state: {new_state}. Skipping.")
+            logger.info("Either entity_id or new_state is None. entity_id: %s, new_state: %s. Skipping.", entity_id, new_state)
             return
         
         entity = self.devices_db.entities_store.get(entity_id)
         if entity:
             entity.process_state_change(old_state, new_state)
-            logger.info(f"(_process_event) Publishing device {entity_id}")
-            sber_root_topic = self.sber_root_topic 
-            assert self.mqttc is not None, "MQTT client is not initialized"
-            self.mqttc.publish(sber_root_topic+'/up/status', self.devices_db.do_mqtt_json_states_list([entity_id]), qos=0)
+            logger.info("(_process_event) Publishing device %s", entity_id)
+            self.publish_state(entity_id)
         else:
             self.handle_event_new(entity_id, old_state, new_state)
             # logger.debug(f"Process event: entity {entity_id} not found")
@@ -218,7 +391,7 @@ class WebSocketHandler:
         if not dev or not dev.get('enabled'):
             return
             
-        logger.info(f'HA Event: {entity_id}: {old_state["state"]} -> {new_state["state"]}')
+        logger.info('HA Event: %s: %s -> %s', entity_id, old_state["state"], new_state["state"])
         
         if dev['category'] == 'sensor_temp':
             self.devices_db.change_state(entity_id, 'temperature', float(new_state['state']))
@@ -238,10 +411,17 @@ class WebSocketHandler:
                     self.devices_db.change_state(entity_id, 'button_event', 'double_click')
                     
         # Send updated states
-        sber_root_topic = self.sber_root_topic 
+        self.publish_state(entity_id)
+
+    def publish_state(self, entity_id):
+        """Передает новое состояние сущности в Сбер - через публикатор состояний, если он задан"""
+        if self.state_publisher is not None:
+            self.state_publisher.mark_dirty(entity_id)
+            return
+        assert self.mqttc is not None, "MQTT client is not initialized"
         # Async publishing here leads to hang all processes. So remain sync publishing here.
-        self.mqttc.publish(sber_root_topic+'/up/status', 
-                     self.devices_db.do_mqtt_json_states_list([entity_id]), 
+        self.mqttc.publish(self.sber_root_topic+'/up/status',
+                     self.devices_db.build_mqtt_json_states_list([entity_id]),
                      qos=0)
 
     def handle_pong(self, data):
@@ -249,11 +429,11 @@ class WebSocketHandler:
         return
     
     def on_data(self, app, data, ivalue, bvalue):
-        logger.debug(f"Hello, onData: {data}, {ivalue}, {bvalue}")
+        logger.debug("Hello, onData: %s, %s, %s", data, ivalue, bvalue)
 
     def handle_default(self, data):
         """Default message handler"""
-        logger.info(f"WebSocket: default message: {data}")
+        logger.info("WebSocket: default message: %s", data)
 
     def _run(self):
         while self.running:
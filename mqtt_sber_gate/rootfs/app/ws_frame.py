@@ -0,0 +1,44 @@
+"""
+Предварительный разбор кадров websocket HA без декодирования json
+"""
+
+import re
+from typing import NamedTuple
+
+# HA пишет тип сообщения в начале кадра: {"id":1,"type":"event","event":{"event_type":"state_changed","data":{"entity_id":...
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([A-Za-z_]+)"')
+_EVENT_TYPE_RE = re.compile(r'"event_type"\s*:\s*"([A-Za-z_]+)"')
+# data.entity_id (и trigger.entity_id) сериализуется раньше состояний, поэтому первое
+# строковое значение entity_id в кадре события - это сущность события
+_ENTITY_ID_RE = re.compile(r'"entity_id"\s*:\s*"([^"]+)"')
+
+_TYPE_SEARCH_LIMIT = 64
+_EVENT_TYPE_SEARCH_LIMIT = 160
+
+FRAME_TYPE_EVENT = "event"
+
+
+class FrameHeader(NamedTuple):
+    """Заголовок кадра: поля, по которым можно решить судьбу кадра до разбора json"""
+    type: str
+    event_type: str
+    entity_id: str
+
+
+def peek_frame(message):
+    """
+    Извлекает type, event_type и entity_id из сырого кадра регулярными выражениями.
+    Поля, которые не удалось найти, равны None - тогда решение принимается после полного разбора.
+    """
+    match = _TYPE_RE.search(message, 0, _TYPE_SEARCH_LIMIT)
+    if match is None:
+        return FrameHeader(None, None, None)
+    frame_type = match.group(1)
+    if frame_type != FRAME_TYPE_EVENT:
+        return FrameHeader(frame_type, None, None)
+
+    match = _EVENT_TYPE_RE.search(message, 0, _EVENT_TYPE_SEARCH_LIMIT)
+    event_type = match.group(1) if match else None
+    match = _ENTITY_ID_RE.search(message)
+    entity_id = match.group(1) if match else None
+    return FrameHeader(frame_type, event_type, entity_id)
@@ -3,3 +3,5 @@ from pathlib import Path
 
 # Добавляем rootfs/app в системный путь
 sys.path.append(str(Path(__file__).parent.parent / "rootfs" / "app"))
+# Заменители HA и брокера Сбера (fakes) для интеграционных тестов
+sys.path.append(str(Path(__file__).parent))
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import unittest
+
+from devices.light import LightEntity
+from devices_db import CDevicesDB, json_read
+from fakes.common import WorkdirTestCase
+
+
+class TestDevicesConfigCache(WorkdirTestCase):
+    def setUp(self):
+        data_devices_path = os.path.join(os.path.dirname(__file__), "..", "data", "devices")
+        devices_data = json_read(os.path.join(data_devices_path, "device_registry.json"), [])
+        entities_data = json_read(os.path.join(data_devices_path, "lights", "ha_entities_light.json"), [])
+        self.states_data = json_read(os.path.join(data_devices_path, "lights", "ha_states_light.json"), [])
+
+        # База пишет файлы в текущий каталог
+        super().setUp()
+
+        self.db = CDevicesDB("devices.json", logging.getLogger(__name__), "test")
+        store = self.db.entities_store
+        for device_data in devices_data:
+            store.upsert_device_data(device_data)
+        for entity_data in entities_data:
+            store.upsert(LightEntity(entity_data))
+        for state in self.states_data:
+            store.update_by_ha_state(state)
+        store.enable_entity("light.spot1_sp")
+        store.enable_entity("light.liustra_sp")
+        self.db.setReady()
+
+    def _state(self, entity_id):
+        return json.loads(json.dumps(next(s for s in self.states_data if s["entity_id"] == entity_id)))
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.db.do_mqtt_json_devices_list()
+        ids = [d["id"] for d in json.loads(first)["devices"]]
+        self.assertEqual(ids, ["root", "light.spot1_sp", "light.liustra_sp"])
+        self.assertEqual(self.db.config_version, 1)
+
+        self.assertIs(self.db.do_mqtt_json_devices_list(), first)
+        stats = self.db.config_stats()
+        self.assertEqual(stats["version"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 2)
+
+    def test_state_change_does_not_rebuild_fragment(self):
+        self.db.do_mqtt_json_devices_list()
+        state = self._state("light.spot1_sp")
+        state["attributes"]["brightness"] = 10
+        self.db.entities_store.get("light.spot1_sp").fill_by_ha_state(state)
+        self.db.do_mqtt_json_devices_list()
+        self.assertEqual(self.db.config_stats()["misses"], 2)
+        self.assertEqual(self.db.config_version, 1)
+
+    def test_supported_modes_change_rebuilds_fragment(self):
+        self.db.do_mqtt_json_devices_list()
+        state = self._state("light.spot1_sp")
+        state["attributes"]["supported_color_modes"] = ["onoff"]
+        self.db.entities_store.get("light.spot1_sp").fill_by_ha_state(state)
+        devices = json.loads(self.db.do_mqtt_json_devices_list())["devices"]
+        self.assertEqual(devices[1]["model"]["features"], ["online", "on_off"])
+        self.assertEqual(self.db.config_stats()["misses"], 3)
+        self.assertEqual(self.db.config_version, 2)
+
+    def test_legacy_device_before_categories_are_loaded(self):
+        self.db.upsert("switch.old", {"enabled": True, "name": "Old", "category": "relay"})
+        devices = json.loads(self.db.do_mqtt_json_devices_list())["devices"]
+        self.assertIn("switch.old", [d["id"] for d in devices])
+        states = json.loads(self.db.build_mqtt_json_states_list(["switch.old"]))["devices"]
+        self.assertEqual(states["switch.old"]["states"], [])
+
+    def test_rename_and_enable_invalidate(self):
+        self.db.do_mqtt_json_devices_list()
+        self.db.entities_store.rename_entity("light.spot1_sp", "Спот")
+        devices = json.loads(self.db.do_mqtt_json_devices_list())["devices"]
+        self.assertEqual(devices[1]["name"], "Спот")
+
+        self.db.entities_store.disable_entity("light.liustra_sp")
+        devices = json.loads(self.db.do_mqtt_json_devices_list())["devices"]
+        self.assertEqual([d["id"] for d in devices], ["root", "light.spot1_sp"])
+        self.assertEqual(self.db.config_version, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
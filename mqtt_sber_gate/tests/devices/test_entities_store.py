@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from devices.light import LightEntity
+from devices_db import EntitiesStore, json_read
+
+
+class TestEntitiesStore(unittest.TestCase):
+    def setUp(self):
+        data_devices_path = os.path.join(os.path.dirname(__file__), "..", "data", "devices")
+        self.devices_data = json_read(os.path.join(data_devices_path, "device_registry.json"), [])
+        self.entities_data = json_read(os.path.join(data_devices_path, "lights", "ha_entities_light.json"), [])
+        self.states_data = json_read(os.path.join(data_devices_path, "lights", "ha_states_light.json"), [])
+        self.store = EntitiesStore(logging.getLogger(__name__))
+        for device_data in self.devices_data:
+            self.store.upsert_device_data(device_data)
+        for entity_data in self.entities_data:
+            self.store.upsert(LightEntity(entity_data))
+        for state in self.states_data:
+            self.store.update_by_ha_state(state)
+
+    def test_enabled_set(self):
+        self.store.enable_entity("light.spot1_sp")
+        self.store.enable_entity("light.liustra_sp")
+        self.store.enable_entity("light.spot1_sp")
+        self.store.enable_entity("light.unknown")
+        self.assertTrue(self.store.is_entity_enabled("light.spot1_sp"))
+        self.assertEqual(self.store.get_enabled_keys(), ["light.spot1_sp", "light.liustra_sp"])
+        self.store.disable_entity("light.spot1_sp")
+        self.store.disable_entity("light.spot1_sp")
+        self.assertFalse(self.store.is_entity_enabled("light.spot1_sp"))
+
+    def test_exposure_listener(self):
+        changes = []
+        self.store.add_exposure_listener(lambda entity_id, enabled: changes.append((entity_id, enabled)))
+        self.store.enable_entity("light.spot1_sp")
+        self.store.enable_entity("light.spot1_sp")
+        self.store.disable_entity("light.spot1_sp")
+        self.store.disable_entity("light.spot1_sp")
+        self.assertEqual(changes, [("light.spot1_sp", True), ("light.spot1_sp", False)])
+
+    def test_indexes(self):
+        self.assertEqual(len(self.store.get_by_domain("light")), len(self.entities_data))
+        self.assertEqual(self.store.get_by_domain("cover"), [])
+        self.assertEqual(self.store.get_by_device("2c4316989f4db8d7a96d7a1ffc32e775"), ["light.liustra_sp_1"])
+        self.assertIn("light.liustra_sp", self.store.get_by_area("spalnia"))
+
+    def test_area_from_linked_device(self):
+        entity = self.store.get("light.liustra_sp_1")
+        self.assertIsNotNone(entity.linked_device)
+        area_id = entity.linked_device.get("area_id")
+        self.assertIn("light.liustra_sp_1", self.store.get_by_area(area_id))
+
+    def test_device_data_after_entity(self):
+        store = EntitiesStore(logging.getLogger(__name__))
+        entity_data = next(e for e in self.entities_data if e["entity_id"] == "light.liustra_sp_1")
+        store.upsert(LightEntity(entity_data))
+        self.assertIsNone(store.get("light.liustra_sp_1").linked_device)
+        device_data = next(d for d in self.devices_data if d["id"] == entity_data["device_id"])
+        store.upsert_device_data(device_data)
+        self.assertIs(store.get("light.liustra_sp_1").linked_device, device_data)
+        self.assertEqual(store.get_by_area(device_data["area_id"]), ["light.liustra_sp_1"])
+
+    def test_reupsert_keeps_indexes_consistent(self):
+        entity_data = dict(next(e for e in self.entities_data if e["entity_id"] == "light.liustra_sp"))
+        entity_data["area_id"] = "kukhnia"
+        self.store.upsert(LightEntity(entity_data))
+        self.assertNotIn("light.liustra_sp", self.store.get_by_area("spalnia"))
+        self.assertEqual(self.store.get_by_area("kukhnia"), ["light.liustra_sp"])
+        self.assertEqual(self.store.get_by_domain("light").count("light.liustra_sp"), 1)
+
+    def test_groups(self):
+        self.assertEqual(self.store.get_entity_groups("light.spot1_sp"), ["light.spoty_pr_sp"])
+        self.assertEqual(self.store.get_entity_groups("light.spoty_pr_sp"), ["light.spoty_sp"])
+        self.assertEqual(self.store.get_group_members("light.spoty_sp"), ["light.spoty_lev_sp", "light.spoty_pr_sp"])
+        # Повторное состояние группы не дублирует участников
+        for state in self.states_data:
+            self.store.update_by_ha_state(state)
+        self.assertEqual(self.store.get_entity_groups("light.spot1_sp"), ["light.spoty_pr_sp"])
+
+    def test_group_member_removed(self):
+        state = dict(next(s for s in self.states_data if s["entity_id"] == "light.spoty_sp"))
+        state["attributes"] = dict(state["attributes"], entity_id=["light.spoty_pr_sp"])
+        self.store.update_by_ha_state(state)
+        self.assertEqual(self.store.get_group_members("light.spoty_sp"), ["light.spoty_pr_sp"])
+        self.assertEqual(self.store.get_entity_groups("light.spoty_lev_sp"), [])
+        self.assertEqual(self.store.get_entity_groups("light.spoty_pr_sp"), ["light.spoty_sp"])
+
+        # Группа без участников больше не считается группой
+        state["attributes"] = dict(state["attributes"], entity_id=[])
+        self.store.update_by_ha_state(state)
+        self.assertEqual(self.store.get_group_members("light.spoty_sp"), [])
+        self.assertEqual(self.store.get_entity_groups("light.spoty_pr_sp"), [])
+
+    def test_enabled_entities_file_format(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                self.store.enable_entity("light.spot1_sp")
+                self.store.enable_entity("light.spot2_sp")
+                self.store.save()
+                with open("enabled_entities.json", encoding="utf-8") as file:
+                    self.assertEqual(json.load(file), ["light.spot1_sp", "light.spot2_sp"])
+
+                store = EntitiesStore(logging.getLogger(__name__))
+                store.load(None)
+                self.assertTrue(store.is_entity_enabled("light.spot2_sp"))
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
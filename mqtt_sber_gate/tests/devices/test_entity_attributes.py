@@ -0,0 +1,49 @@
+import gc
+import unittest
+
+from devices.curtain import CurtainEntity
+from devices.light import LightEntity
+
+
+class TestEntityAttributes(unittest.TestCase):
+    def setUp(self):
+        self.ha_state = {
+            "entity_id": "light.group",
+            "state": "on",
+            "attributes": {
+                "friendly_name": "Группа",
+                "entity_id": ["light.a", "light.b"],
+                "supported_color_modes": ["color_temp"],
+                "brightness": 128,
+                "effect_list": ["effect_1", "effect_2"],
+            },
+        }
+
+    def test_only_schema_attributes_are_kept(self):
+        entity = LightEntity({"entity_id": "light.group"})
+        entity.fill_by_ha_state(self.ha_state)
+        self.assertEqual(set(entity.attributes), {"friendly_name", "entity_id", "supported_color_modes", "brightness"})
+        self.assertTrue(entity.is_group_state())
+
+    def test_source_attributes_are_not_retained(self):
+        entity = LightEntity({"entity_id": "light.group"})
+        entity.fill_by_ha_state(self.ha_state)
+        # Полный словарь атрибутов HA не должен удерживаться сущностью
+        referrers = [referrer for referrer in gc.get_referrers(self.ha_state["attributes"]) if referrer is not self.ha_state]
+        self.assertEqual(referrers, [])
+
+    def test_attributes_are_read_only(self):
+        entity = LightEntity({"entity_id": "light.group"})
+        entity.fill_by_ha_state(self.ha_state)
+        with self.assertRaises(TypeError):
+            entity.attributes["brightness"] = 1
+
+    def test_class_schema(self):
+        entity = CurtainEntity({"entity_id": "cover.c"})
+        entity.fill_by_ha_state({"state": "open", "attributes": {"current_position": 40, "brightness": 1}})
+        self.assertEqual(dict(entity.attributes), {"current_position": 40})
+        self.assertEqual(entity.current_position, 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,7 @@
+"""
+Локальные заменители внешних сервисов для интеграционных и нагрузочных тестов шлюза:
+- fake_ha - websocket API Home Assistant с N сущностями, которые могут генерировать события;
+- fake_mqtt_broker - минимальный брокер MQTT 3.1.1 на месте брокера Сбера;
+- gate_process - запуск настоящего sber-gate.py, подключенного к заменителям;
+- common - общие заменители модульных тестов (настройки, база устройств, MQTT клиент, часы).
+"""
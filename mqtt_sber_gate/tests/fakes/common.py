@@ -0,0 +1,179 @@
+"""
+Общие заменители для модульных тестов: настройки шлюза, часы, websocket и MQTT клиент,
+база устройств, публикатор состояний, пул команд и тест во временном рабочем каталоге.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+# Минимальные настройки шлюза (options.json). Тесты дополняют их: OPTIONS | {...}
+OPTIONS = {
+    'ha-api_url': "http://ha:8123",
+    'ha-api_token': "token",
+    'sber-http_api_endpoint': "",
+    'sber-mqtt_login': "user",
+    'sber-mqtt_password': "password",
+    'sber-mqtt_broker': "broker",
+}
+
+
+def state_changed(entity_id, attributes=None):
+    """Кадр события state_changed HA (компактный json, как у HA)"""
+    state = {"entity_id": entity_id, "state": "on", "attributes": attributes if attributes is not None else {}}
+    return json.dumps({
+        "id": 1,
+        "type": "event",
+        "event": {
+            "event_type": "state_changed",
+            "data": {"entity_id": entity_id, "old_state": state, "new_state": state},
+        },
+    }, separators=(",", ":"))
+
+
+class WorkdirTestCase(unittest.TestCase):
+    """Тест во временном текущем каталоге - шлюз пишет файлы (базу, снимки, журналы) в текущий каталог"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+
+class FakeClock:
+    """Часы с ручным сдвигом времени: clock.now += секунды"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeWs:
+    """Websocket HA: запоминает отправленные сообщения"""
+
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def send(self, data):
+        if self.fail:
+            raise ConnectionError("socket is closed")
+        self.sent.append(json.loads(data))
+
+
+class FakeMessage:
+    """Сообщение paho MQTT"""
+
+    def __init__(self, topic, payload=b""):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+
+
+class FakeMqttClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, payload))
+
+
+class FakePublisher:
+    """StatePublisher: запоминает сущности, отмеченные для публикации"""
+
+    def __init__(self):
+        self.dirty = []
+
+    def mark_dirty(self, entity_id):
+        self.dirty.append(entity_id)
+
+
+class FakeEntity:
+    """Сущность HA: запоминает полученные изменения состояния (old_state, new_state)"""
+
+    def __init__(self):
+        self.states = []
+
+    def process_state_change(self, old_state, new_state):
+        self.states.append((old_state, new_state))
+
+
+class FakeEntitiesStore:
+    def __init__(self, entities):
+        self.entities = entities
+
+    def get(self, entity_id):
+        return self.entities.get(entity_id)
+
+
+class FakeDevicesDb:
+    """
+    База устройств (CDevicesDB) с заданными сущностями.
+    Состояния сущностей с to_sber_current_state берутся у сущности, остальных - пустые.
+    """
+
+    def __init__(self, entities=None, exposed=(), ready=True):
+        self.entities_store = FakeEntitiesStore(entities if entities is not None else {})
+        self.exposed = list(exposed)
+        self.ready = ready
+        self.ready_callbacks = []
+        self.requests = []
+        self.DB = {}
+
+    def call_when_ready(self, callback):
+        if self.ready:
+            callback()
+        else:
+            self.ready_callbacks.append(callback)
+
+    def set_ready(self):
+        self.ready = True
+        callbacks, self.ready_callbacks = self.ready_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def exposed_entity_ids(self):
+        return list(self.exposed)
+
+    def build_mqtt_json_states_list(self, entity_ids):
+        if not self.ready:
+            return None
+        self.requests.append(list(entity_ids))
+        devices = {}
+        for entity_id in entity_ids:
+            entity = self.entities_store.get(entity_id)
+            if hasattr(entity, "to_sber_current_state"):
+                devices.update(entity.to_sber_current_state())
+            else:
+                devices[entity_id] = {"states": []}
+        return json.dumps({"devices": devices})
+
+    def do_mqtt_json_states_list(self, devices):
+        return json.dumps({"devices": devices})
+
+    def do_mqtt_json_devices_list(self):
+        return "config"
+
+
+class FakeExecutor:
+    """CommandExecutor: запоминает ключи команд, при inline=True сразу выполняет их"""
+
+    def __init__(self, inline=False):
+        self.inline = inline
+        self.submitted = []
+
+    def submit(self, key, func, *args, received_at=None):
+        self.submitted.append(key)
+        if self.inline:
+            func(*args)
+        return True
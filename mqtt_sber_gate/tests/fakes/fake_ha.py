@@ -0,0 +1,360 @@
+"""
+Заменитель websocket API Home Assistant (/api/websocket).
+
+Поддерживается то, что использует шлюз: авторизация, subscribe_events state_changed, subscribe_trigger
+на сущность, unsubscribe_events, списки зон/устройств/сущностей, get_states, call_service для света
+и ping. Сущности - светильники light.load_<i>. Изменения состояний (generate_events или call_service)
+рассылаются подписчикам так же, как это делает HA.
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+HA_VERSION = "2025.9.0"
+AREA_ID = "load"
+
+
+def encode_frame(opcode, payload):
+    """Кадр websocket от сервера (без маски)"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def read_frame(stream):
+    """Кадр websocket от клиента: (fin, opcode, данные) или None, если соединение закрыто"""
+    head = stream.read(2)
+    if len(head) < 2:
+        return None
+    fin, opcode = head[0] & 0x80, head[0] & 0x0F
+    masked, length = head[1] & 0x80, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", stream.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", stream.read(8))[0]
+    mask = stream.read(4) if masked else None
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bool(fin), opcode, payload
+
+
+def light_state(entity_id, on=False, brightness=None):
+    return {
+        "entity_id": entity_id,
+        "state": "on" if on else "off",
+        "attributes": {
+            "supported_color_modes": ["brightness"],
+            "color_mode": "brightness" if on else None,
+            "brightness": brightness if on else None,
+            "friendly_name": "Нагрузка " + entity_id.rsplit("_", 1)[1],
+            "supported_features": 0,
+        },
+        "last_changed": "2025-09-01T00:00:00+00:00",
+        "last_updated": "2025-09-01T00:00:00+00:00",
+        "context": {"id": "0", "parent_id": None, "user_id": None},
+    }
+
+
+class HaConnection(StreamRequestHandler):
+    """Одно websocket соединение клиента HA"""
+
+    def setup(self):
+        super().setup()
+        self.ha = self.server.ha
+        self.send_lock = threading.Lock()
+        self.authenticated = False
+        self.event_subscriptions = set()  # id подписок subscribe_events state_changed
+        self.triggers = {}                # id подписки -> entity_id
+
+    def handle(self):
+        if not self._handshake():
+            return
+        self.ha._connected(self)
+        try:
+            self.send_json({"type": "auth_required", "ha_version": HA_VERSION})
+            message = b""
+            while True:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    break
+                fin, opcode, payload = frame
+                if opcode == OPCODE_CLOSE:
+                    self._send(OPCODE_CLOSE, payload[:2])
+                    break
+                if opcode == OPCODE_PING:
+                    self._send(OPCODE_PONG, payload)
+                    continue
+                if opcode in (OPCODE_TEXT, OPCODE_BINARY, OPCODE_CONTINUATION):
+                    message += payload
+                    if fin:
+                        self._handle_message(json.loads(message.decode("utf-8")))
+                        message = b""
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.ha._disconnected(self)
+
+    def _handshake(self):
+        request_line = self.rfile.readline()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not request_line.startswith(b"GET /api/websocket") or key is None:
+            self.wfile.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("ascii"))
+        return True
+
+    def _send(self, opcode, payload):
+        with self.send_lock:
+            self.wfile.write(encode_frame(opcode, payload))
+
+    def send_json(self, message):
+        try:
+            self._send(OPCODE_TEXT, json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        except OSError:
+            pass
+
+    def result(self, message_id, result=None, success=True):
+        self.send_json({"id": message_id, "type": "result", "success": success, "result": result})
+
+    def _handle_message(self, message):
+        message_type = message.get("type")
+        message_id = message.get("id")
+        if message_type == "auth":
+            self.authenticated = message.get("access_token") == self.ha.token
+            self.send_json({"type": "auth_ok" if self.authenticated else "auth_invalid", "ha_version": HA_VERSION})
+            return
+        if not self.authenticated:
+            return
+        self.ha.requests[message_type] = self.ha.requests.get(message_type, 0) + 1
+        if message_type == "subscribe_events":
+            self.event_subscriptions.add(message_id)
+            self.result(message_id)
+        elif message_type == "subscribe_trigger":
+            self.triggers[message_id] = message["trigger"]["entity_id"]
+            self.result(message_id)
+        elif message_type == "unsubscribe_events":
+            self.event_subscriptions.discard(message["subscription"])
+            self.triggers.pop(message["subscription"], None)
+            self.result(message_id)
+        elif message_type == "config/area_registry/list":
+            self.result(message_id, self.ha.areas())
+        elif message_type == "config/device_registry/list":
+            self.result(message_id, self.ha.devices())
+        elif message_type == "config/entity_registry/list":
+            self.result(message_id, self.ha.entity_registry())
+        elif message_type == "get_states":
+            self.result(message_id, self.ha.get_states())
+        elif message_type == "call_service":
+            success = self.ha._call_service(message)
+            self.result(message_id, {"context": {"id": str(message_id)}} if success else None, success)
+        elif message_type == "ping":
+            self.send_json({"id": message_id, "type": "pong"})
+        else:
+            self.result(message_id, None, False)
+
+    def notify(self, entity_id, old_state, new_state):
+        """Рассылает изменение состояния подпискам соединения"""
+        for subscription_id in list(self.event_subscriptions):
+            self.send_json({"id": subscription_id, "type": "event", "event": {
+                "event_type": "state_changed",
+                "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state},
+                "origin": "LOCAL", "time_fired": new_state["last_updated"], "context": new_state["context"]}})
+        for subscription_id, trigger_entity_id in list(self.triggers.items()):
+            if trigger_entity_id == entity_id:
+                self.send_json({"id": subscription_id, "type": "event", "event": {
+                    "variables": {"trigger": {"id": "0", "idx": "0", "alias": None, "platform": "state",
+                                              "entity_id": entity_id, "from_state": old_state, "to_state": new_state}},
+                    "context": new_state["context"]}})
+
+
+class FakeHomeAssistant:
+    def __init__(self, entities=10, token="token", host="127.0.0.1", port=0):
+        """
+        Args:
+            entities (int): Сколько светильников light.load_<i> создать
+            token (str): Токен доступа, который должен передать клиент
+            host, port: Адрес сервера (port=0 - свободный порт)
+        """
+        self.token = token
+        self.entity_ids = [f"light.load_{i}" for i in range(entities)]
+        self._states = {entity_id: light_state(entity_id) for entity_id in self.entity_ids}
+        self._lock = threading.Lock()
+        self._connections = []
+        self._connected_event = threading.Event()
+        self.requests = {}
+        self.service_calls = []
+        self.events_emitted = 0
+        # on_service_call(domain, service, entity_id, service_data) - вызывается при получении call_service
+        self.on_service_call = None
+        # on_state_changed(entity_id, new_state) - вызывается перед рассылкой изменения состояния
+        self.on_state_changed = None
+        self._server = ThreadingTCPServer((host, port), HaConnection, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.ha = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeHomeAssistant")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._server.server_close()
+
+    def _connected(self, connection):
+        with self._lock:
+            self._connections.append(connection)
+        self._connected_event.set()
+
+    def _disconnected(self, connection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def connections(self):
+        with self._lock:
+            return list(self._connections)
+
+    def watched_entities(self):
+        """Сколько сущностей отслеживает клиент: все при подписке на state_changed, иначе - по subscribe_trigger"""
+        watched = set()
+        for connection in self.connections():
+            if connection.event_subscriptions:
+                return len(self.entity_ids)
+            watched.update(connection.triggers.values())
+        return len(watched)
+
+    def areas(self):
+        return [{"area_id": AREA_ID, "name": "Нагрузка", "aliases": [], "floor_id": None, "icon": None, "labels": [], "picture": None}]
+
+    def devices(self):
+        return [{
+            "id": f"device_{entity_id}", "area_id": AREA_ID, "name": "Нагрузка " + entity_id.rsplit("_", 1)[1],
+            "name_by_user": None, "manufacturer": "Fake", "model": "Load light", "model_id": None,
+            "sw_version": "1.0", "hw_version": None, "serial_number": None, "via_device_id": None,
+            "identifiers": [["fake", entity_id]], "connections": [], "config_entries": ["fake"],
+            "config_entries_subentries": {"fake": [None]}, "disabled_by": None, "entry_type": None, "labels": [],
+            "configuration_url": None, "created_at": 0, "modified_at": 0, "primary_config_entry": "fake",
+        } for entity_id in self.entity_ids]
+
+    def entity_registry(self):
+        return [{
+            "entity_id": entity_id, "id": f"id_{entity_id}", "unique_id": f"unique_{entity_id}",
+            "device_id": f"device_{entity_id}", "area_id": None, "platform": "fake", "config_entry_id": "fake",
+            "config_subentry_id": None, "categories": {}, "disabled_by": None, "entity_category": None,
+            "has_entity_name": True, "hidden_by": None, "icon": None, "labels": [], "name": None,
+            "options": {"conversation": {"should_expose": True}}, "original_name": None, "translation_key": None,
+            "created_at": 0, "modified_at": 0,
+        } for entity_id in self.entity_ids]
+
+    def get_states(self):
+        with self._lock:
+            return list(self._states.values())
+
+    def state(self, entity_id):
+        with self._lock:
+            return self._states[entity_id]
+
+    def set_state(self, entity_id, on, brightness=None):
+        """Изменяет состояние светильника и рассылает событие подписчикам"""
+        new_state = light_state(entity_id, on, brightness)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        new_state["last_changed"] = new_state["last_updated"] = now
+        with self._lock:
+            old_state = self._states[entity_id]
+            self._states[entity_id] = new_state
+            self.events_emitted += 1
+            connections = list(self._connections)
+        if self.on_state_changed is not None:
+            self.on_state_changed(entity_id, new_state)
+        for connection in connections:
+            connection.notify(entity_id, old_state, new_state)
+        return new_state
+
+    def _call_service(self, message):
+        domain, service = message.get("domain"), message.get("service")
+        entity_ids = message.get("target", {}).get("entity_id", [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        service_data = message.get("service_data", {})
+        for entity_id in entity_ids:
+            self.service_calls.append((domain, service, entity_id, service_data))
+            if self.on_service_call is not None:
+                self.on_service_call(domain, service, entity_id, service_data)
+        if domain != "light" or service not in ("turn_on", "turn_off", "toggle"):
+            return False
+        for entity_id in entity_ids:
+            if entity_id not in self._states:
+                return False
+            current = self.state(entity_id)
+            on = service == "turn_on" or (service == "toggle" and current["state"] == "off")
+            brightness = service_data.get("brightness", current["attributes"]["brightness"] or 255)
+            self.set_state(entity_id, on, brightness)
+        return True
+
+    def generate_events(self, rate, duration, entity_ids=None, stop_event=None):
+        """
+        Изменяет яркость сущностей entity_ids (по умолчанию всех) по кругу с частотой rate событий
+        в секунду в течение duration секунд. Возвращает количество событий. Если не успевает, события идут без пауз.
+        """
+        entity_ids = entity_ids or self.entity_ids
+        started = time.monotonic()
+        count = 0
+        while time.monotonic() - started < duration and not (stop_event is not None and stop_event.is_set()):
+            delay = started + count / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            entity_id = entity_ids[count % len(entity_ids)]
+            self.set_state(entity_id, True, 1 + count % 254)
+            count += 1
+        return count
+
+    def wait_connected(self, timeout):
+        return self._connected_event.wait(timeout)
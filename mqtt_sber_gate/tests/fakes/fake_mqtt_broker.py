@@ -0,0 +1,274 @@
+"""
+Минимальный брокер MQTT 3.1.1 на месте брокера Сбера (без TLS).
+
+Поддерживается то, что использует шлюз: CONNECT с логином и паролем, SUBSCRIBE/UNSUBSCRIBE с масками
++ и #, PUBLISH QoS 0 и 1 (QoS 1 подтверждается, доставка подписчикам - с QoS 0), PINGREQ, DISCONNECT.
+Сообщения клиентов доставляются подписчикам и передаются в on_publish; сообщения от имени Сбера
+отправляются методом publish.
+"""
+
+import socket
+import struct
+import threading
+import time
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_CREDENTIALS = 4
+
+
+def topic_matches(topic_filter, topic):
+    """Соответствие топика маске подписки с + и #"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_length(length):
+    result = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        result.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(result)
+
+
+def encode_string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_packet(packet_type, flags, body):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+def read_packet(stream):
+    """Пакет клиента: (тип, флаги, тело) или None, если соединение закрыто"""
+    head = stream.read(1)
+    if not head:
+        return None
+    length, multiplier = 0, 1
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return None
+        length += (byte[0] & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte[0] & 0x80:
+            break
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return head[0] >> 4, head[0] & 0x0F, body
+
+
+def read_string(body, offset):
+    length = struct.unpack_from("!H", body, offset)[0]
+    return body[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+class MqttConnection(StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.broker = self.server.broker
+        self.send_lock = threading.Lock()
+        self.client_id = None
+        self.subscriptions = set()
+
+    def handle(self):
+        try:
+            while True:
+                packet = read_packet(self.rfile)
+                if packet is None:
+                    break
+                packet_type, flags, body = packet
+                if packet_type == CONNECT:
+                    if not self._connect(body):
+                        break
+                elif packet_type == PUBLISH:
+                    self._publish(flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._unsubscribe(body)
+                elif packet_type == PINGREQ:
+                    self.send(encode_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (OSError, struct.error):
+            pass
+        finally:
+            self.broker._disconnected(self)
+
+    def send(self, data):
+        try:
+            with self.send_lock:
+                self.wfile.write(data)
+        except OSError:
+            pass
+
+    def _connect(self, body):
+        _, offset = read_string(body, 0)  # имя протокола
+        offset += 1  # версия протокола
+        flags = body[offset]
+        offset += 3  # флаги и keep alive
+        client_id, offset = read_string(body, offset)
+        if flags & 0x04:  # will: топик и сообщение
+            _, offset = read_string(body, offset)
+            _, offset = read_string(body, offset)
+        username = password = None
+        if flags & 0x80:
+            username, offset = read_string(body, offset)
+            username = username.decode("utf-8")
+        if flags & 0x40:
+            password, offset = read_string(body, offset)
+            password = password.decode("utf-8")
+        accepted = self.broker.credentials is None or self.broker.credentials == (username, password)
+        self.send(encode_packet(CONNACK, 0, bytes([0, CONNACK_ACCEPTED if accepted else CONNACK_BAD_CREDENTIALS])))
+        if accepted:
+            self.client_id = client_id.decode("utf-8")
+            self.broker._connected(self)
+        return accepted
+
+    def _publish(self, flags, body):
+        qos = (flags >> 1) & 0x03
+        topic, offset = read_string(body, 0)
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self.send(encode_packet(PUBACK, 0, packet_id))
+        self.broker._route(topic.decode("utf-8"), body[offset:], self)
+
+    def _subscribe(self, body):
+        packet_id, offset, granted = body[:2], 2, bytearray()
+        while offset < len(body):
+            topic_filter, offset = read_string(body, offset)
+            offset += 1  # запрошенный QoS
+            self.subscriptions.add(topic_filter.decode("utf-8"))
+            granted.append(0)
+        self.send(encode_packet(SUBACK, 0, packet_id + bytes(granted)))
+        self.broker._subscribed()
+
+    def _unsubscribe(self, body):
+        packet_id, offset = body[:2], 2
+        while offset < len(body):
+            topic_filter, offset = read_string(body, offset)
+            self.subscriptions.discard(topic_filter.decode("utf-8"))
+        self.send(encode_packet(UNSUBACK, 0, packet_id))
+
+    def deliver(self, topic, payload):
+        if any(topic_matches(topic_filter, topic) for topic_filter in list(self.subscriptions)):
+            self.send(encode_packet(PUBLISH, 0, encode_string(topic) + payload))
+            return True
+        return False
+
+
+class FakeMqttBroker:
+    def __init__(self, username=None, password=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            username, password: Если заданы, подключение с другими данными отклоняется
+            host, port: Адрес брокера (port=0 - свободный порт)
+        """
+        self.credentials = (username, password) if username is not None else None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._connections = []
+        self.received = 0
+        self.delivered = 0
+        # on_publish(topic, payload) - вызывается для каждого сообщения от клиентов
+        self.on_publish = None
+        self._server = ThreadingTCPServer((host, port), MqttConnection, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.broker = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeMqttBroker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._server.server_close()
+
+    def _connected(self, connection):
+        with self._condition:
+            self._connections.append(connection)
+            self._condition.notify_all()
+
+    def _disconnected(self, connection):
+        with self._condition:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def _subscribed(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _route(self, topic, payload, sender=None):
+        with self._lock:
+            if sender is not None:
+                self.received += 1
+            connections = list(self._connections)
+        if sender is not None and self.on_publish is not None:
+            self.on_publish(topic, payload)
+        for connection in connections:
+            if connection.deliver(topic, payload):
+                self.delivered += 1
+
+    def publish(self, topic, payload):
+        """Отправляет сообщение подписчикам от имени брокера (сообщение Сбера)"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self._route(topic, payload)
+
+    def has_subscriber(self, topic):
+        with self._lock:
+            return any(topic_matches(topic_filter, topic) for connection in self._connections for topic_filter in connection.subscriptions)
+
+    def wait_subscriber(self, topic, timeout):
+        """Ждет, пока кто-нибудь подпишется на топик"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not any(topic_matches(topic_filter, topic) for connection in self._connections for topic_filter in connection.subscriptions):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
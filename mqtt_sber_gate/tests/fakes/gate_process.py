@@ -0,0 +1,137 @@
+"""
+Запуск настоящего sber-gate.py в отдельном процессе, подключенного к FakeHomeAssistant и FakeMqttBroker.
+
+Шлюз запускается в своем временном каталоге (как /data аддона) с options.json, указывающим
+на заменители (TLS к брокеру отключен и порт HTTP сервера задан переменными окружения), заранее включенными сущностями (enabled_entities.json) и справочником категорий,
+чтобы не обращаться к облаку Сбера. Журнал шлюза остается в каталоге (SberGate.log).
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+GATE_SCRIPT = Path(__file__).parent.parent.parent / "rootfs" / "app" / "sber-gate.py"
+SBER_LOGIN = "user"
+SBER_PASSWORD = "password"
+SBER_ROOT_TOPIC = "sberdevices/v1/" + SBER_LOGIN
+# Этап запуска шлюза (startup.py): реестры HA загружены
+PHASE_HA_REGISTRIES = "ha_registries"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(predicate, timeout, interval=0.05):
+    """Ждет, пока predicate() вернет истину. Возвращает последнее значение predicate()"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        if result or time.monotonic() >= deadline:
+            return result
+        time.sleep(interval)
+
+
+class GateProcess:
+    def __init__(self, workdir, ha, broker, options=None):
+        """
+        Args:
+            workdir (str): Рабочий каталог шлюза
+            ha (FakeHomeAssistant): Запущенный заменитель HA
+            broker (FakeMqttBroker): Запущенный брокер
+            options (dict): Дополнительные настройки шлюза
+        """
+        self.workdir = Path(workdir)
+        self.ha = ha
+        self.broker = broker
+        self.http_port = free_port()
+        self.options = {
+            "ha-api_url": ha.url,
+            "ha-api_token": ha.token,
+            "sber-mqtt_login": SBER_LOGIN,
+            "sber-mqtt_password": SBER_PASSWORD,
+            "sber-mqtt_broker": broker.host,
+            "sber-mqtt_broker_port": broker.port,
+            "sber-http_api_endpoint": "",
+            "log_level": "INFO",
+        }
+        self.options.update(options or {})
+        self.process = None
+        self.started_at = None
+
+    def prepare(self):
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        with open(self.workdir / "options.json", "w", encoding="utf-8") as file:
+            json.dump(self.options, file)
+        with open(self.workdir / "enabled_entities.json", "w", encoding="utf-8") as file:
+            json.dump(self.ha.entity_ids, file)
+        # Справочник категорий из файла - шлюз не ждет облако Сбера
+        with open(self.workdir / "categories.json", "w", encoding="utf-8") as file:
+            json.dump({"light": []}, file)
+
+    def start(self):
+        self.prepare()
+        # TLS и порт веб-интерфейса задаются окружением - в настройках аддона их нет
+        env = dict(os.environ, PYTHONUNBUFFERED="1", SBER_GATE_MQTT_TLS="0", SBER_GATE_HTTP_PORT=str(self.http_port))
+        self.started_at = time.monotonic()
+        self.process = subprocess.Popen([sys.executable, str(GATE_SCRIPT)], cwd=self.workdir, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, timeout=30):
+        """
+        Ждет, пока шлюз подпишется на топики Сбера, загрузит реестры HA и подпишется на изменения всех сущностей.
+        Возвращает время запуска в секундах или None по таймауту.
+        """
+        ready = wait_until(lambda: self.process.poll() is not None or (
+            self.broker.has_subscriber(SBER_ROOT_TOPIC + "/down/commands")
+            and self.ha.watched_entities() >= len(self.ha.entity_ids)
+            and self.phase_done(PHASE_HA_REGISTRIES)), timeout)
+        if not ready or self.process.poll() is not None:
+            return None
+        return time.monotonic() - self.started_at
+
+    def stats(self):
+        """Статистика шлюза (/api/v2/stats) или None, если HTTP сервер еще не запущен"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.http_port}/api/v2/stats", timeout=2) as response:
+                return json.loads(response.read())
+        except (OSError, ValueError):
+            return None
+
+    def phase_done(self, name):
+        stats = self.stats()
+        return stats is not None and stats.get("startup", {}).get("phases", {}).get(name, {}).get("done", False)
+
+    def peak_rss_mb(self):
+        """Пиковый RSS процесса шлюза (только Linux)"""
+        try:
+            with open(f"/proc/{self.process.pid}/status", encoding="ascii") as file:
+                for line in file:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def log(self):
+        try:
+            return (self.workdir / "SberGate.log").read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return ""
+
+    def stop(self, timeout=10):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
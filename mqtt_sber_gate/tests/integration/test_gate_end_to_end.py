@@ -0,0 +1,90 @@
+import json
+import tempfile
+import threading
+import unittest
+
+from fakes.fake_ha import FakeHomeAssistant
+from fakes.fake_mqtt_broker import FakeMqttBroker, topic_matches
+from fakes.gate_process import GateProcess, SBER_LOGIN, SBER_PASSWORD, SBER_ROOT_TOPIC, wait_until
+
+ENTITIES = 20
+TIMEOUT = 15
+
+
+class TestTopicMatches(unittest.TestCase):
+    def test_wildcards(self):
+        self.assertTrue(topic_matches("sberdevices/v1/user/down/#", "sberdevices/v1/user/down/commands"))
+        self.assertTrue(topic_matches("sberdevices/+/user/down/commands", "sberdevices/v1/user/down/commands"))
+        self.assertFalse(topic_matches("sberdevices/v1/user/down/+", "sberdevices/v1/user/down/a/b"))
+        self.assertFalse(topic_matches("sberdevices/v1/__config", "sberdevices/v1/user/down/commands"))
+
+
+class TestGateEndToEnd(unittest.TestCase):
+    """Настоящий sber-gate.py, подключенный к заменителям HA и брокера Сбера"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.ha = FakeHomeAssistant(ENTITIES)
+        cls.broker = FakeMqttBroker(SBER_LOGIN, SBER_PASSWORD)
+        cls.lock = threading.Lock()
+        cls.published = []
+        cls.broker.on_publish = cls.on_publish
+        cls.ha.start()
+        cls.broker.start()
+        cls.gate = GateProcess(cls.tmp_dir.name, cls.ha, cls.broker, {"state_publish_window_ms": 20})
+        cls.gate.start()
+        if cls.gate.wait_ready(TIMEOUT) is None:
+            log = cls.gate.log()
+            cls.tearDownClass()
+            raise AssertionError("Шлюз не запустился:\n" + log[-3000:])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gate.stop()
+        cls.ha.stop()
+        cls.broker.stop()
+        cls.tmp_dir.cleanup()
+
+    @classmethod
+    def on_publish(cls, topic, payload):
+        with cls.lock:
+            cls.published.append((topic, json.loads(payload)))
+
+    def wait_published(self, suffix, predicate):
+        def find():
+            with self.lock:
+                return next((data for topic, data in self.published if topic == SBER_ROOT_TOPIC + suffix and predicate(data)), None)
+        return wait_until(find, TIMEOUT)
+
+    def test_config_request(self):
+        self.broker.publish(SBER_ROOT_TOPIC + "/down/config_request", "")
+        config = self.wait_published("/up/config", lambda data: True)
+        self.assertIsNotNone(config)
+        ids = [device["id"] for device in config["devices"]]
+        self.assertEqual(ids[0], "root")
+        self.assertEqual(sorted(ids[1:]), sorted(self.ha.entity_ids))
+
+    def test_event_is_published(self):
+        self.ha.set_state("light.load_3", True, 128)
+        status = self.wait_published("/up/status", lambda data: "light.load_3" in data["devices"])
+        self.assertIsNotNone(status)
+        states = {state["key"]: state["value"] for state in status["devices"]["light.load_3"]["states"]}
+        self.assertTrue(states["on_off"]["bool_value"])
+
+    def test_command_round_trip(self):
+        command = {"devices": {"light.load_7": {"states": [{"key": "on_off", "value": {"type": "BOOL", "bool_value": True}}]}}}
+        self.broker.publish(SBER_ROOT_TOPIC + "/down/commands", json.dumps(command))
+        self.assertTrue(wait_until(lambda: ("light", "turn_on", "light.load_7", {}) in self.ha.service_calls, TIMEOUT))
+        status = self.wait_published("/up/status", lambda data: "light.load_7" in data["devices"])
+        self.assertIsNotNone(status)
+        self.assertEqual(self.ha.state("light.load_7")["state"], "on")
+
+    def test_status_request(self):
+        self.broker.publish(SBER_ROOT_TOPIC + "/down/status_request", json.dumps({"devices": ["light.load_1", "light.load_2"]}))
+        status = self.wait_published("/up/status", lambda data: sorted(data["devices"]) == ["light.load_1", "light.load_2"])
+        self.assertIsNotNone(status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import socket
+import threading
+import unittest
+
+import websocket
+
+from async_runtime import AsyncGateRuntime, AsyncHaConnection, AsyncMqttAdapter
+from fakes.common import FakeDevicesDb, FakeMessage, FakeMqttClient, FakePublisher
+from state_publisher import StatePublisher
+
+
+class FakeFrame:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeWebSocket:
+    """Websocket поверх socketpair: один кадр - одна строка"""
+    def __init__(self, sock):
+        self.sock = sock
+        self._file = sock.makefile("rb", buffering=0)
+
+    def recv_data_frame(self, control_frame=False):
+        line = self._file.readline()
+        if not line:
+            return websocket.ABNF.OPCODE_CLOSE, FakeFrame(b"")
+        return websocket.ABNF.OPCODE_TEXT, FakeFrame(line.rstrip(b"\n"))
+
+
+class FakeHandler:
+    running = True
+
+    def __init__(self):
+        self.messages = []
+
+    def on_message(self, ws, message):
+        self.messages.append(message)
+
+
+class TestAsyncHaConnection(unittest.TestCase):
+    def test_reading_paused_when_queue_is_full(self):
+        """При заполнении очереди поток чтения ждет и продолжает после разбора"""
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            handler = FakeHandler()
+            connection = AsyncHaConnection(loop, handler, queue_size=4)
+            reader, writer = socket.socketpair()
+            connection.ws = FakeWebSocket(reader)
+            closed = loop.create_future()
+            for i in range(10):
+                writer.sendall(f"msg{i}\n".encode())
+
+            connection.start_reader(connection.ws, closed)
+            await asyncio.sleep(0.05)
+            self.assertEqual(connection.queue.qsize(), 4)
+            self.assertTrue(connection._reader.is_alive())
+
+            consumer = asyncio.create_task(connection.consume())
+            for _ in range(100):
+                if len(handler.messages) == 10:
+                    break
+                await asyncio.sleep(0.01)
+            writer.close()
+            await asyncio.wait_for(closed, 1)
+            consumer.cancel()
+            reader.close()
+            return handler.messages
+
+        messages = asyncio.run(scenario())
+        self.assertEqual(messages, [f"msg{i}" for i in range(10)])
+
+    def test_partial_frame_does_not_block_loop(self):
+        """Кадр, пришедший не целиком, не останавливает цикл событий"""
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            handler = FakeHandler()
+            connection = AsyncHaConnection(loop, handler)
+            reader, writer = socket.socketpair()
+            connection.ws = FakeWebSocket(reader)
+            closed = loop.create_future()
+            consumer = asyncio.create_task(connection.consume())
+            connection.start_reader(connection.ws, closed)
+
+            writer.sendall(b"par")
+            started = loop.time()
+            await asyncio.sleep(0.02)
+            self.assertLess(loop.time() - started, 0.5)
+            self.assertEqual(handler.messages, [])
+
+            writer.sendall(b"tial\n")
+            for _ in range(100):
+                if handler.messages:
+                    break
+                await asyncio.sleep(0.01)
+            writer.close()
+            await asyncio.wait_for(closed, 1)
+            consumer.cancel()
+            reader.close()
+            return handler.messages
+
+        self.assertEqual(asyncio.run(scenario()), ["partial"])
+
+
+class TestAsyncGateRuntime(unittest.TestCase):
+    def test_mqtt_callbacks_are_queued_in_order(self):
+        async def scenario():
+            runtime = AsyncGateRuntime(None, None, None, None, queue_size=2)
+            runtime.loop = asyncio.get_running_loop()
+            runtime.mqtt_queue = asyncio.Queue(maxsize=2)
+            handled = []
+            wrapped = runtime.wrap_mqtt_callback(lambda client, userdata, msg: handled.append(msg.topic))
+
+            for topic in ["a", "b", "c"]:
+                wrapped(None, None, FakeMessage(topic))
+            self.assertEqual(handled, [])
+
+            consumer = asyncio.create_task(runtime._consume_mqtt())
+            await asyncio.sleep(0.05)
+            consumer.cancel()
+            return handled, runtime.mqtt_dropped()
+
+        # Третье сообщение не помещается в очередь размером 2 - отбрасывается и учитывается
+        handled, dropped = asyncio.run(scenario())
+        self.assertEqual(handled, ["a", "b"])
+        self.assertEqual(dropped, {"c": 1})
+
+    def test_mqtt_callbacks_run_off_loop_thread(self):
+        async def scenario():
+            runtime = AsyncGateRuntime(None, None, None, None)
+            runtime.loop = asyncio.get_running_loop()
+            runtime.mqtt_queue = asyncio.Queue()
+            threads = []
+            runtime.wrap_mqtt_callback(lambda client, userdata, msg: threads.append(threading.get_ident()))(None, None, FakeMessage("a"))
+            consumer = asyncio.create_task(runtime._consume_mqtt())
+            await asyncio.sleep(0.05)
+            consumer.cancel()
+            return threads
+
+        threads = asyncio.run(scenario())
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+    def test_mqtt_reading_paused_while_queue_is_full(self):
+        async def scenario():
+            runtime = AsyncGateRuntime(None, None, None, None, queue_size=2)
+            runtime.loop = asyncio.get_running_loop()
+            runtime.mqtt_queue = asyncio.Queue(maxsize=2)
+            runtime.mqtt_adapter = FakeMqttAdapter()
+            wrapped = runtime.wrap_mqtt_callback(lambda client, userdata, msg: None)
+            wrapped(None, None, FakeMessage("a"))
+            self.assertFalse(runtime.mqtt_adapter.paused)
+            wrapped(None, None, FakeMessage("b"))
+            self.assertTrue(runtime.mqtt_adapter.paused)
+
+            consumer = asyncio.create_task(runtime._consume_mqtt())
+            await asyncio.sleep(0.05)
+            consumer.cancel()
+            return runtime.mqtt_adapter.paused, runtime.mqtt_dropped()
+
+        self.assertEqual(asyncio.run(scenario()), (False, {}))
+
+    def test_dropped_command_publishes_actual_state(self):
+        publisher = FakePublisher()
+
+        async def scenario():
+            runtime = AsyncGateRuntime(None, None, publisher, None, queue_size=1)
+            runtime.loop = asyncio.get_running_loop()
+            runtime.mqtt_queue = asyncio.Queue(maxsize=1)
+            wrapped = runtime.wrap_mqtt_callback(lambda client, userdata, msg: None)
+            wrapped(None, None, FakeMessage("sberdevices/v1/user/down/status_request", b'{"devices": []}'))
+            wrapped(None, None, FakeMessage("sberdevices/v1/user/down/commands", b'{"devices": {"light.a": {"states": []}}}'))
+            return runtime.mqtt_dropped()
+
+        self.assertEqual(asyncio.run(scenario()), {"commands": 1})
+        self.assertEqual(publisher.dirty, ["light.a"])
+
+
+class FakeMqttAdapter:
+    paused = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+class FakePahoClient:
+    def __init__(self):
+        self.reads = 0
+
+    def loop_read(self):
+        self.reads += 1
+
+
+class TestAsyncMqttAdapter(unittest.TestCase):
+    def test_pause_and_resume_reading(self):
+        async def scenario():
+            client = FakePahoClient()
+            adapter = AsyncMqttAdapter(asyncio.get_running_loop(), client)
+            sock, peer = socket.socketpair()
+            adapter.on_socket_open(client, None, sock)
+            peer.sendall(b"x")
+            await asyncio.sleep(0.02)
+            reads = client.reads
+
+            adapter.pause_reading()
+            await asyncio.sleep(0.02)
+            paused_reads = client.reads - reads
+
+            adapter.resume_reading()
+            await asyncio.sleep(0.02)
+            resumed = client.reads > reads
+            adapter.on_socket_close(client, None, sock)
+            sock.close()
+            peer.close()
+            return reads, paused_reads, resumed
+
+        reads, paused_reads, resumed = asyncio.run(scenario())
+        self.assertGreater(reads, 0)
+        self.assertEqual(paused_reads, 0)
+        self.assertTrue(resumed)
+
+
+class TestStatePublisherAsync(unittest.TestCase):
+    def test_run_async_coalesces_changes(self):
+        mqttc = FakeMqttClient()
+
+        async def scenario():
+            publisher = StatePublisher(FakeDevicesDb(), mqttc, "sberdevices/v1/user", window_ms=20)
+            publisher.attach_loop(asyncio.get_running_loop())
+            task = asyncio.create_task(publisher.run_async())
+            for entity_id in ["light.a", "light.b", "light.a"]:
+                publisher.mark_dirty(entity_id)
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(scenario())
+        self.assertEqual(len(mqttc.published), 1)
+        self.assertEqual(set(json.loads(mqttc.published[0][1])["devices"]), {"light.a", "light.b"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from command_dispatcher import CommandDispatcher, make_service_call
+from fakes.common import OPTIONS, FakeWs, WorkdirTestCase
+from web_socket_handler import WebSocketHandler
+
+
+class FakeRest:
+    def __init__(self):
+        self.calls = []
+
+    def call_service(self, domain, service, payload):
+        self.calls.append((domain, service, payload))
+
+
+class TestCommandDispatcher(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.handler = WebSocketHandler(None, None, None, OPTIONS)
+        self.rest = FakeRest()
+        self.dispatcher = CommandDispatcher(self.handler, self.rest)
+
+    def _connect(self, ws):
+        self.handler.on_open(ws)
+        self.handler.handle_auth_ok({})
+        ws.sent.clear()
+
+    def test_command_goes_over_websocket_with_correlated_result(self):
+        ws = FakeWs()
+        self._connect(ws)
+
+        command_id = self.dispatcher.call_service("switch", "turn_on", "switch.kettle")
+        self.assertEqual(ws.sent, [{
+            "id": command_id,
+            "type": "call_service",
+            "domain": "switch",
+            "service": "turn_on",
+            "target": {"entity_id": "switch.kettle"},
+        }])
+        self.assertIn(command_id, self.handler.commands.pending)
+
+        self.handler.on_message(ws, json.dumps({"id": command_id, "type": "result", "success": True, "result": {}}))
+        self.assertNotIn(command_id, self.handler.commands.pending)
+        self.assertEqual(self.rest.calls, [])
+
+    def test_rest_fallback_when_socket_is_down(self):
+        command = make_service_call("climate", "set_temperature", "climate.ac", {"temperature": 22, "hvac_mode": "cool"})
+        self.assertIsNone(self.dispatcher.dispatch(command))
+        self.assertEqual(self.rest.calls, [
+            ("climate", "set_temperature", {"temperature": 22, "hvac_mode": "cool", "entity_id": "climate.ac"})
+        ])
+
+    def test_rest_fallback_when_send_fails(self):
+        self._connect(FakeWs())
+        self.handler.ws = FakeWs(fail=True)
+        self.assertIsNone(self.dispatcher.call_service("light", "turn_off", "light.l"))
+        self.assertEqual(self.rest.calls, [("light", "turn_off", {"entity_id": "light.l"})])
+        self.assertEqual(self.handler.commands.pending, {})
+
+    def test_close_drops_pending_commands(self):
+        ws = FakeWs()
+        self._connect(ws)
+        self.dispatcher.call_service("light", "turn_on", "light.l")
+        self.handler.on_close(ws, None, None)
+        self.assertFalse(self.handler.is_connected())
+        self.assertEqual(self.handler.commands.pending, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from command_executor import CommandExecutor
+from metrics import Histogram
+
+
+class TestCommandExecutor(unittest.TestCase):
+    def test_commands_of_one_entity_keep_order(self):
+        executor = CommandExecutor(workers=4, queue_size=100)
+        executor.start()
+        executed = []
+        for i in range(50):
+            self.assertTrue(executor.submit("light.l", executed.append, i))
+        executor.stop()
+        self.assertEqual(executed, list(range(50)))
+        self.assertEqual(executor.stats()["completed"], 50)
+
+    def test_slow_entity_does_not_block_others(self):
+        executor = CommandExecutor(workers=2, queue_size=10)
+        # Подбираем сущность, попадающую к другому обработчику
+        other = next(f"light.l{i}" for i in range(100)
+                     if executor._queue_for(f"light.l{i}") is not executor._queue_for("climate.slow"))
+        executor.start()
+        release = threading.Event()
+        done = threading.Event()
+        executor.submit("climate.slow", release.wait, 5)
+        executor.submit(other, done.set)
+        self.assertTrue(done.wait(2))
+        release.set()
+        executor.stop()
+
+    def test_full_queue_rejects_command(self):
+        executor = CommandExecutor(workers=1, queue_size=1, submit_timeout=0.01)
+        executor.start()
+        release = threading.Event()
+        started = threading.Event()
+        executor.submit("light.l", lambda: (started.set(), release.wait(5)))
+        self.assertTrue(started.wait(2))
+        self.assertTrue(executor.submit("light.l", lambda: None))
+        self.assertFalse(executor.submit("light.l", lambda: None))
+        release.set()
+        executor.stop()
+        stats = executor.stats()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["completed"], 2)
+        self.assertEqual(stats["max_queue_depth"], 1)
+
+    def test_failed_command_does_not_stop_worker(self):
+        executor = CommandExecutor(workers=1)
+        executor.start()
+        executed = []
+        executor.submit("light.l", lambda: 1 / 0)
+        executor.submit("light.l", executed.append, 1)
+        executor.stop()
+        self.assertEqual(executed, [1])
+        self.assertEqual(executor.stats()["failed"], 1)
+
+    def test_latency_counts_from_receive_time(self):
+        executor = CommandExecutor(workers=1)
+        executor.start()
+        executor.submit("light.l", lambda: None, received_at=time.monotonic() - 0.2)
+        executor.stop()
+        self.assertGreaterEqual(executor.stats()["latency_ms"]["max"], 200)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram(buckets=(1, 10, 100))
+        for value in [0.5] * 90 + [50] * 9 + [500]:
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(99), 100)
+        self.assertEqual(histogram.percentile(100), 500)
+        self.assertEqual(histogram.cumulative_counts(), [(1, 90), (10, 90), (100, 99), (float("inf"), 100)])
+
+    def test_empty(self):
+        self.assertEqual(Histogram().snapshot()["p99"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
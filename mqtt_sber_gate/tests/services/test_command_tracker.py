@@ -0,0 +1,187 @@
+import json
+import logging
+import time
+import unittest
+
+from command_tracker import CommandTracker, CommandError, CommandTimeout
+from command_dispatcher import CommandDispatcher, make_service_call
+from devices.light import LightEntity
+from devices_db import CDevicesDB
+from fakes.common import OPTIONS, FakeDevicesDb, FakeExecutor, FakeMqttClient, FakePublisher, FakeWs, WorkdirTestCase
+from sber_mqtt_handlers import SberMqttHandlers
+from web_socket_handler import WebSocketHandler
+
+HANDLER_OPTIONS = OPTIONS | {'ha-command_timeout': 5, 'ha-command_retries': 1}
+
+
+class TestCommandTracker(unittest.TestCase):
+    def setUp(self):
+        self.failures = []
+        self.resent = []
+        self.tracker = CommandTracker(resend=self.resent.append,
+                                      on_failure=lambda pending, error: self.failures.append((pending, error)),
+                                      timeout=5, retries=1)
+
+    def test_success_resolves_future_and_records_latency(self):
+        pending = self.tracker.track(7, make_service_call("light", "turn_on", "light.l"))
+        self.assertTrue(self.tracker.complete({"id": 7, "type": "result", "success": True, "result": {"ok": 1}}))
+        self.assertEqual(pending.future.result(0), {"ok": 1})
+        stats = self.tracker.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["latency_ms"]["count"], 1)
+        self.assertEqual(stats["latency_by_service_ms"]["light.turn_on"]["count"], 1)
+        self.assertFalse(self.tracker.complete({"id": 7, "type": "result", "success": True}))
+
+    def test_error_result(self):
+        pending = self.tracker.track(7, make_service_call("light", "turn_on", "light.l"))
+        self.tracker.complete({"id": 7, "type": "result", "success": False, "error": {"code": "not_found"}})
+        self.assertIsInstance(pending.future.exception(0), CommandError)
+        self.assertEqual(len(self.failures), 1)
+        self.assertEqual(self.tracker.stats()["errors"], 1)
+
+    def test_timeout_retries_then_fails(self):
+        pending = self.tracker.track(7, make_service_call("light", "turn_on", "light.l"))
+        self.tracker.expire(time.monotonic() + 1)
+        self.assertEqual(self.resent, [])
+
+        self.tracker.expire(time.monotonic() + 6)
+        self.assertEqual(self.resent, [pending])
+        self.assertEqual(pending.attempt, 1)
+        self.assertEqual(self.tracker.pending, {})
+
+        # Повторная отправка регистрирует команду под новым id
+        self.tracker.track(8, pending.command, pending)
+        self.tracker.expire(time.monotonic() + 6)
+        self.assertIsInstance(pending.future.exception(0), CommandTimeout)
+        self.assertEqual(self.failures[0][0], pending)
+        stats = self.tracker.stats()
+        self.assertEqual((stats["retried"], stats["timeouts"]), (1, 1))
+
+    def test_fail_all(self):
+        pending = self.tracker.track(7, make_service_call("light", "turn_on", "light.l"))
+        self.assertEqual(self.tracker.fail_all("closed"), 1)
+        self.assertIsInstance(pending.future.exception(0), CommandError)
+
+
+class TestHandlerCommandTracking(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.publisher = FakePublisher()
+        self.handler = WebSocketHandler(None, None, None, HANDLER_OPTIONS, self.publisher)
+        self.ws = FakeWs()
+        self.handler.on_open(self.ws)
+        self.handler.handle_auth_ok({})
+        self.ws.sent.clear()
+
+    def test_on_done_callback(self):
+        done = []
+        command_id = self.handler.send_command(make_service_call("switch", "turn_on", "switch.s"), on_done=done.append)
+        self.handler.on_message(self.ws, json.dumps({"id": command_id, "type": "result", "success": True, "result": None}))
+        self.assertEqual(len(done), 1)
+        self.assertIsNone(done[0].exception())
+
+    def test_unanswered_command_is_resent_then_reported_to_sber(self):
+        first_id = self.handler.send_command(make_service_call("switch", "turn_on", "switch.s"))
+        self.handler.commands.expire(time.monotonic() + 6)
+        self.assertEqual(len(self.ws.sent), 2)
+        second_id = self.ws.sent[1]["id"]
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual(self.publisher.dirty, [])
+
+        self.handler.commands.expire(time.monotonic() + 6)
+        # Сбер получает фактическое состояние устройства
+        self.assertEqual(self.publisher.dirty, ["switch.s"])
+
+
+class TestFailedCommandRollback(WorkdirTestCase):
+    """Сущность меняет состояние при разборе команды Сбера - при ошибке HA состояние возвращается"""
+
+    def setUp(self):
+        super().setUp()
+        self.light = LightEntity({"entity_id": "light.l"})
+        self.light.fill_by_ha_state({"entity_id": "light.l", "state": "off", "attributes": {"supported_color_modes": ["onoff"]}})
+        self.mqttc = FakeMqttClient()
+        self.handler = WebSocketHandler(FakeDevicesDb({"light.l": self.light}), None, self.mqttc, HANDLER_OPTIONS)
+        self.ws = FakeWs()
+        self.handler.on_open(self.ws)
+        self.handler.handle_auth_ok({})
+        self.ws.sent.clear()
+        self.sber = SberMqttHandlers(self.handler.devices_db, CommandDispatcher(self.handler, None), FakeExecutor(inline=True),
+                                     "sberdevices/v1/user")
+
+    def published_on_off(self):
+        topic, payload = self.mqttc.published[-1]
+        self.assertEqual(topic, "sberdevices/v1/user/up/status")
+        states = {state["key"]: state["value"] for state in json.loads(payload)["devices"]["light.l"]["states"]}
+        return states["on_off"]["bool_value"]
+
+    def turn_on(self):
+        self.sber.execute_device_command("light.l", {"states": [{"key": "on_off", "value": {"type": "BOOL", "bool_value": True}}]})
+        self.assertTrue(self.light.current_state)
+        return self.ws.sent[-1]["id"]
+
+    def test_error_result_publishes_state_before_command(self):
+        command_id = self.turn_on()
+        self.handler.on_message(self.ws, json.dumps({"id": command_id, "type": "result", "success": False, "error": {"code": "failed"}}))
+        self.assertFalse(self.light.current_state)
+        self.assertFalse(self.published_on_off())
+
+    def test_timeout_publishes_state_before_command(self):
+        self.turn_on()
+        self.handler.commands.expire(time.monotonic() + 6)
+        self.handler.commands.expire(time.monotonic() + 12)
+        self.assertFalse(self.published_on_off())
+
+    def test_state_from_ha_is_not_rolled_back(self):
+        command_id = self.turn_on()
+        self.light.process_state_change(None, {"entity_id": "light.l", "state": "on", "attributes": {"supported_color_modes": ["onoff"]}})
+        self.handler.on_message(self.ws, json.dumps({"id": command_id, "type": "result", "success": False, "error": {"code": "failed"}}))
+        self.assertTrue(self.published_on_off())
+
+    def test_rollback_keeps_device_link(self):
+        self.light.device_id = "device_1"
+        self.light.link_device({"id": "device_1", "area_id": "spalnia"})
+        command_id = self.turn_on()
+        # Реестр устройств HA обновился, пока команда выполнялась
+        self.light.link_device({"id": "device_1", "area_id": "kukhnia"})
+        self.handler.on_message(self.ws, json.dumps({"id": command_id, "type": "result", "success": False, "error": {"code": "failed"}}))
+        self.assertFalse(self.light.current_state)
+        self.assertEqual(self.light.linked_device, {"id": "device_1", "area_id": "kukhnia"})
+
+
+class TestFailedLegacyCommandRollback(WorkdirTestCase):
+    """Устройства базы (CDevicesDB) без класса сущности: откат состояний States"""
+
+    def setUp(self):
+        super().setUp()
+        self.db = CDevicesDB("devices.json", logging.getLogger(__name__), "test")
+        self.db.upsert("switch.s", {'entity_ha': True, 'entity_type': 'sw', 'friendly_name': "Розетка", 'category': 'relay',
+                                    'enabled': True, 'States': {'on_off': False}})
+        self.handler = WebSocketHandler(self.db, None, FakeMqttClient(), HANDLER_OPTIONS, FakePublisher())
+        self.ws = FakeWs()
+        self.handler.on_open(self.ws)
+        self.handler.handle_auth_ok({})
+        self.ws.sent.clear()
+        self.sber = SberMqttHandlers(self.db, CommandDispatcher(self.handler, None), FakeExecutor(inline=True), "sberdevices/v1/user")
+
+    def turn_on(self):
+        self.sber.execute_device_command("switch.s", {"states": [{"key": "on_off", "value": {"type": "BOOL", "bool_value": True}}]})
+        self.assertTrue(self.db.get_state("switch.s", "on_off"))
+        return self.ws.sent[-1]["id"]
+
+    def fail(self, command_id):
+        self.handler.on_message(self.ws, json.dumps({"id": command_id, "type": "result", "success": False, "error": {"code": "failed"}}))
+
+    def test_error_result_restores_states(self):
+        self.fail(self.turn_on())
+        self.assertFalse(self.db.get_state("switch.s", "on_off"))
+
+    def test_state_from_ha_is_not_rolled_back(self):
+        command_id = self.turn_on()
+        self.handler.handle_event_new("switch.s", {"state": "on"}, {"entity_id": "switch.s", "state": "on"})
+        self.fail(command_id)
+        self.assertTrue(self.db.get_state("switch.s", "on_off"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from event_filter import EventFilter, DEFAULT_IGNORE_RULES
+
+
+class TestEventFilter(unittest.TestCase):
+    def test_rule_kinds(self):
+        event_filter = EventFilter([
+            "light.kitchen",
+            "sensor.*",
+            "switch.plug*",
+            "re:^binary_sensor\\..*_motion$",
+            "device_class:power",
+        ])
+        self.assertEqual(event_filter.match("light.kitchen"), "light.kitchen")
+        self.assertIsNone(event_filter.match("light.kitchen_2"))
+        self.assertEqual(event_filter.match("sensor.anything"), "sensor.*")
+        self.assertEqual(event_filter.match("switch.plug_3"), "switch.plug*")
+        self.assertIsNone(event_filter.match("switch.pl"))
+        self.assertEqual(event_filter.match("binary_sensor.hall_motion"), "re:^binary_sensor\\..*_motion$")
+        self.assertEqual(event_filter.match("climate.ac", "power"), "device_class:power")
+        self.assertIsNone(event_filter.match("climate.ac", "temperature"))
+
+    def test_default_rules_keep_prefix_semantics(self):
+        event_filter = EventFilter(DEFAULT_IGNORE_RULES)
+        self.assertIsNotNone(event_filter.match("sensor.archer_ax58_download_speed"))
+        self.assertIsNotNone(event_filter.match("device_tracker.phone"))
+        self.assertIsNotNone(event_filter.match("person.owner"))
+        self.assertIsNone(event_filter.match("light.kitchen"))
+
+    def test_allow_overrides_ignore(self):
+        event_filter = EventFilter(["sensor.*"], ["sensor.temperature_hall", "device_class:temperature"])
+        self.assertIsNone(event_filter.match("sensor.temperature_hall"))
+        self.assertIsNone(event_filter.match("sensor.t", "temperature"))
+        self.assertEqual(event_filter.match("sensor.power"), "sensor.*")
+
+    def test_counters(self):
+        event_filter = EventFilter(["sensor.*", "person*"])
+        self.assertFalse(event_filter.accept_id("sensor.power"))
+        self.assertFalse(event_filter.accept("person.owner"))
+        self.assertTrue(event_filter.accept("light.kitchen"))
+        self.assertEqual(event_filter.stats(), {"processed": 1, "dropped": {"sensor.*": 1, "person*": 1}})
+
+    def test_id_check_needs_device_class_after_decode(self):
+        event_filter = EventFilter(["device_class:power"])
+        self.assertTrue(event_filter.accept_id("sensor.power"))
+        self.assertFalse(event_filter.accept("sensor.power", "power"))
+
+    def test_device_class_allow_defers_id_check(self):
+        event_filter = EventFilter(["sensor.*"], ["device_class:temperature"])
+        self.assertTrue(event_filter.accept_id("sensor.t"))
+
+
+if __name__ == '__main__':
+    unittest.main()
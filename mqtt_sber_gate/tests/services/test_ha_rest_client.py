@@ -0,0 +1,77 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ha_rest_client import HaRestClient
+
+
+class FakeHaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        server.received.append((self.path, self.headers.get('Authorization'), json.loads(body)))
+        status = server.statuses.pop(0) if server.statuses else 200
+        data = b'[]'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHaRestClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHaHandler)
+        self.server.received = []
+        self.server.statuses = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = HaRestClient({
+            'ha-api_url': f"http://127.0.0.1:{self.server.server_address[1]}",
+            'ha-api_token': "token",
+            'ha-rest_timeout': 5,
+        })
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        """Серия команд идет по одному соединению"""
+        for i in range(5):
+            response = self.client.call_service("light", "turn_on", {"entity_id": f"light.l{i}"})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(self.server.received), 5)
+        path, auth, payload = self.server.received[0]
+        self.assertEqual(path, "/api/services/light/turn_on")
+        self.assertEqual(auth, "Bearer token")
+        self.assertEqual(payload, {"entity_id": "light.l0"})
+
+        stats = self.client.stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 4)
+
+    def test_unavailable_ha_is_retried(self):
+        self.server.statuses = [503]
+        response = self.client.post("/api/services/switch/turn_off", {"entity_id": "switch.s"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(self.client.stats()["errors"], 0)
+
+    def test_connection_error_returns_none(self):
+        client = HaRestClient({'ha-api_url': "http://127.0.0.1:1", 'ha-api_token': "token", 'ha-rest_retries': 0})
+        self.assertIsNone(client.post("/api/services/light/turn_on", {}))
+        self.assertEqual(client.stats()["errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
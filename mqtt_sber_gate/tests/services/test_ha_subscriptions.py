@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from fakes.common import OPTIONS, FakeDevicesDb, FakeEntity, FakePublisher, FakeWs, WorkdirTestCase
+from web_socket_handler import WebSocketHandler
+
+
+class TestEntitySubscriptions(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        exposed = ["light.a", "cover.b"]
+        self.devices_db = FakeDevicesDb({entity_id: FakeEntity() for entity_id in exposed}, exposed)
+        self.publisher = FakePublisher()
+
+    def _connect(self, options=OPTIONS):
+        handler = WebSocketHandler(self.devices_db, None, None, options, self.publisher)
+        ws = FakeWs()
+        handler.on_open(ws)
+        handler.handle_auth_ok({})
+        return handler, ws
+
+    def _subscriptions(self, ws):
+        return {m["trigger"]["entity_id"]: m["id"] for m in ws.sent if m["type"] == "subscribe_trigger"}
+
+    def test_subscribes_only_to_exposed_entities(self):
+        handler, ws = self._connect()
+        self.assertNotIn("subscribe_events", [m["type"] for m in ws.sent])
+        handler.sync_subscriptions()
+        subscriptions = self._subscriptions(ws)
+        self.assertEqual(set(subscriptions), {"light.a", "cover.b"})
+        self.assertEqual(ws.sent[-1]["trigger"]["platform"], "state")
+
+    def test_trigger_event_is_processed(self):
+        handler, ws = self._connect()
+        handler.sync_subscriptions()
+        subscription_id = self._subscriptions(ws)["light.a"]
+        old_state = {"entity_id": "light.a", "state": "off", "attributes": {}}
+        new_state = {"entity_id": "light.a", "state": "on", "attributes": {}}
+        handler.on_message(ws, json.dumps({
+            "id": subscription_id,
+            "type": "event",
+            "event": {"variables": {"trigger": {
+                "platform": "state", "entity_id": "light.a", "from_state": old_state, "to_state": new_state
+            }}}
+        }))
+        self.assertEqual(self.devices_db.entities_store.get("light.a").states, [(old_state, new_state)])
+        self.assertEqual(self.publisher.dirty, ["light.a"])
+        self.assertEqual(handler.subscriptions.stats()["events"], 1)
+
+    def test_incremental_resubscription(self):
+        handler, ws = self._connect()
+        handler.sync_subscriptions()
+        subscription_id = self._subscriptions(ws)["cover.b"]
+        ws.sent.clear()
+
+        handler.on_exposure_changed("cover.b", False)
+        self.assertEqual(ws.sent, [{"id": ws.sent[0]["id"], "type": "unsubscribe_events", "subscription": subscription_id}])
+
+        handler.on_exposure_changed("switch.c", True)
+        self.assertEqual(list(self._subscriptions(ws)), ["switch.c"])
+        self.assertEqual(handler.subscriptions.stats()["subscriptions"], 2)
+
+    def test_failed_subscription_is_forgotten(self):
+        handler, ws = self._connect()
+        handler.sync_subscriptions()
+        subscription_id = self._subscriptions(ws)["light.a"]
+        handler.on_message(ws, json.dumps({"id": subscription_id, "type": "result", "success": False, "error": {}}))
+        self.assertEqual(handler.subscriptions.stats()["subscriptions"], 1)
+
+    def test_close_resets_subscriptions(self):
+        handler, ws = self._connect()
+        handler.sync_subscriptions()
+        handler.on_close(ws, None, None)
+        self.assertEqual(handler.subscriptions.stats()["subscriptions"], 0)
+        handler.on_exposure_changed("light.a", False)
+
+    def test_all_events_mode(self):
+        handler, ws = self._connect(OPTIONS | {'ha-event_subscription': "all"})
+        self.assertEqual(ws.sent[0], {"id": 1, "type": "subscribe_events", "event_type": "state_changed"})
+        handler.sync_subscriptions()
+        self.assertEqual(self._subscriptions(ws), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
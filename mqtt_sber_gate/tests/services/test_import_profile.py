@@ -0,0 +1,112 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from import_profile import ImportProfiler, profiling_enabled
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'rootfs', 'app'))
+GATE_SCRIPT = os.path.join(APP_DIR, 'sber-gate.py')
+LAZY_MODULES = ["asyncio", "requests", "urllib3", "charset_normalizer", "idna"]
+# С запасом: на медленных машинах и без кеша байткода импорт заметно дольше
+STARTUP_IMPORT_BUDGET_MS = 1500
+
+
+def startup_modules():
+    """
+    Модули, которые sber-gate.py импортирует при запуске в обычном (threaded) режиме -
+    импорты верхнего уровня скрипта. Импорты внутри условий и функций (asyncio режим) не учитываются.
+    """
+    with open(GATE_SCRIPT, encoding="utf-8-sig") as file:
+        tree = ast.parse(file.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+class TestImportProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        sys.path.insert(0, self.tmp_dir.name)
+        self.write_module("profiled_child", "import time\ntime.sleep(0.02)\nVALUE = 1\n")
+        self.write_module("profiled_parent", "import time\nimport profiled_child\ntime.sleep(0.01)\n")
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir.name)
+        for name in ("profiled_parent", "profiled_child"):
+            sys.modules.pop(name, None)
+        self.tmp_dir.cleanup()
+
+    def write_module(self, name, source):
+        with open(os.path.join(self.tmp_dir.name, name + ".py"), "w", encoding="utf-8") as file:
+            file.write(source)
+
+    def test_cumulative_and_self_time(self):
+        profiler = ImportProfiler().install()
+        try:
+            import profiled_parent
+        finally:
+            profiler.uninstall()
+        self.assertNotIn(profiler, sys.meta_path)
+        self.assertEqual(profiled_parent.profiled_child.VALUE, 1)
+        self.assertEqual(type(profiled_parent.__spec__.loader).__name__, "SourceFileLoader")
+
+        records = {r.name: r for r in profiler.top(10)}
+        parent, child = records["profiled_parent"], records["profiled_child"]
+        self.assertEqual((parent.depth, child.depth), (0, 1))
+        self.assertGreaterEqual(child.cumulative, 0.02)
+        self.assertGreaterEqual(parent.cumulative, child.cumulative + 0.01)
+        self.assertAlmostEqual(parent.self_time, parent.cumulative - child.cumulative)
+
+        stats = profiler.stats()
+        self.assertEqual(stats["modules"], 2)
+        self.assertEqual(stats["top"][0]["module"], "profiled_parent")
+        self.assertEqual(stats["total_ms"], round(parent.cumulative * 1000, 1))
+
+    def test_enabled_by_option(self):
+        options_file = os.path.join(self.tmp_dir.name, "options.json")
+        self.assertFalse(profiling_enabled(options_file))
+        with open(options_file, "w", encoding="utf-8") as file:
+            json.dump({"startup_profile": True}, file)
+        self.assertTrue(profiling_enabled(options_file))
+
+
+class TestStartupImportBudget(unittest.TestCase):
+    def test_startup_modules_follow_gate_script(self):
+        modules = startup_modules()
+        for name in ("import_profile", "json_codec", "metrics", "log_queue", "log_storage",
+                     "traffic_recorder", "sber_mqtt_handlers", "web_socket_handler", "paho.mqtt.client"):
+            self.assertIn(name, modules)
+        self.assertNotIn("async_runtime", modules)
+
+    def test_startup_imports_are_lazy_and_within_budget(self):
+        script = textwrap.dedent(f"""
+            import json, sys
+            sys.path.insert(0, {APP_DIR!r})
+            from import_profile import ImportProfiler
+            profiler = ImportProfiler().install()
+            for name in {startup_modules()!r}:
+                __import__(name)
+            profiler.uninstall()
+            print(json.dumps({{
+                "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules],
+                "total_ms": profiler.stats()["total_ms"],
+            }}))
+        """)
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60, cwd=APP_DIR)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(report["loaded"], [])
+        self.assertLess(report["total_ms"], STARTUP_IMPORT_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+import json_codec
+
+PAYLOAD = {
+    "devices": {
+        "light.kitchen": {"states": [
+            {"key": "online", "value": {"type": "BOOL", "bool_value": True}},
+            {"key": "light_brightness", "value": {"type": "INTEGER", "integer_value": "500"}},
+        ]},
+        "cover.hall": {"states": [], "description": "Штора"},
+    }
+}
+
+
+class TestJsonCodec(unittest.TestCase):
+    def tearDown(self):
+        json_codec.set_backend(json_codec.BACKEND_STDLIB)
+
+    def test_backends_round_trip(self):
+        for name in json_codec.available_backends():
+            with self.subTest(backend=name):
+                codec = json_codec.create_codec(name)
+                self.assertEqual(json.loads(codec.dumps(PAYLOAD)), PAYLOAD)
+                self.assertEqual(codec.loads(json.dumps(PAYLOAD)), PAYLOAD)
+                self.assertEqual(codec.loads(json.dumps(PAYLOAD).encode("utf-8")), PAYLOAD)
+                self.assertEqual(json.loads(codec.dumps_pretty(PAYLOAD)), PAYLOAD)
+                self.assertIsInstance(codec.dumps(PAYLOAD), str)
+
+    def test_stdlib_output_is_unchanged(self):
+        codec = json_codec.create_codec(json_codec.BACKEND_STDLIB)
+        self.assertEqual(codec.dumps(PAYLOAD), json.dumps(PAYLOAD))
+        self.assertEqual(codec.dumps_pretty(PAYLOAD), json.dumps(PAYLOAD, indent=4))
+
+    def test_decode_error(self):
+        for name in json_codec.available_backends():
+            with self.subTest(backend=name):
+                json_codec.set_backend(name)
+                with self.assertRaises(json_codec.JSONDecodeError):
+                    json_codec.loads(b"{not json")
+
+    def test_fallback_to_stdlib(self):
+        self.assertEqual(json_codec.set_backend("unknown"), json_codec.BACKEND_STDLIB)
+        self.assertEqual(json_codec.backend(), json_codec.BACKEND_STDLIB)
+
+    def test_auto_prefers_fast_backend(self):
+        self.assertEqual(json_codec.set_backend(json_codec.BACKEND_AUTO), json_codec.available_backends()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import logging
+import threading
+import unittest
+
+from fakes.common import FakeClock
+from log_queue import QueueLogging, SamplingFilter, parse_level_rules
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+        self.threads.add(threading.current_thread().name)
+
+
+def make_record(msg, args=(), level=logging.INFO, name="sber_gate"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class TestSamplingFilter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sampler = SamplingFilter(rate=2, clock=self.clock)
+
+    def test_rate_per_template(self):
+        passed = [self.sampler.filter(make_record("OnMESSAGE: %s", (i,))) for i in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertTrue(self.sampler.filter(make_record("Config: %s", ("x",))))
+        self.assertTrue(self.sampler.filter(make_record("OnMESSAGE: %s", (5,), level=logging.WARNING)))
+        self.assertEqual(self.sampler.suppressed, 3)
+
+        self.clock.now += 1
+        record = make_record("OnMESSAGE: %s", (6,))
+        self.assertTrue(self.sampler.filter(record))
+        self.assertEqual(record.getMessage(), "OnMESSAGE: 6 (пропущено похожих сообщений: 3)")
+
+    def test_disabled(self):
+        self.sampler.rate = 0
+        self.assertTrue(all(self.sampler.filter(make_record("OnMESSAGE: %s", (i,))) for i in range(10)))
+
+
+class TestQueueLogging(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("test_log_queue")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.collector = CollectingHandler()
+
+    def tearDown(self):
+        self.logger.handlers.clear()
+        self.logger.propagate = True
+
+    def test_records_are_written_by_listener_thread(self):
+        logs = QueueLogging([self.collector], sample_rate=0)
+        logs.start(self.logger)
+        for i in range(100):
+            self.logger.info("HA Event: %s", i)
+        logs.stop()
+        self.assertEqual(self.collector.messages, [f"HA Event: {i}" for i in range(100)])
+        self.assertNotIn(threading.current_thread().name, self.collector.threads)
+        self.assertEqual(self.logger.handlers, [self.collector])
+
+    def test_full_queue_drops_records(self):
+        logs = QueueLogging([self.collector], queue_size=5, sample_rate=0)
+        logs.start(self.logger)
+        logs.listener.stop()
+        for i in range(8):
+            self.logger.info("HA Event: %s", i)
+        self.assertEqual(logs.stats()["dropped"], 3)
+        logs.listener.start()
+        logs.stop()
+        self.assertEqual(len(self.collector.messages), 5)
+
+    def test_sampling(self):
+        logs = QueueLogging([self.collector], sample_rate=3)
+        logs.start(self.logger)
+        for i in range(10):
+            self.logger.info("OnMESSAGE: %s", i)
+        logs.stop()
+        self.assertEqual(len(self.collector.messages), 3)
+        self.assertEqual(logs.stats()["suppressed"], 7)
+
+
+class TestLevelRules(unittest.TestCase):
+    def test_parse(self):
+        rules = parse_level_rules(["web_socket_handler=debug", "paho = WARNING", "broken", "x=LOUD"])
+        self.assertEqual(rules, [("web_socket_handler", logging.DEBUG), ("paho", logging.WARNING)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import gzip
+import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from fakes.common import OPTIONS, FakeClock
+from http_server import MyServer, parse_byte_range
+from log_storage import CompressingRotatingFileHandler, LogStorage
+
+
+class LogStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp_dir.name, "SberGate.log")
+        self.clock = FakeClock()
+        self.storage = LogStorage(self.log_file, clock=self.clock, sleep=self.clock.sleep)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, text, mode="a"):
+        with open(self.log_file, mode, encoding="utf-8") as file:
+            file.write(text)
+
+
+class TestRotation(LogStorageTestCase):
+    def test_segments_are_compressed_and_bounded(self):
+        handler = CompressingRotatingFileHandler(self.log_file, max_bytes=1000, backups=2)
+        log = logging.getLogger("test_log_storage")
+        log.propagate = False
+        log.addHandler(handler)
+        try:
+            for i in range(200):
+                log.warning("HA Event: light.room_%d: off -> on", i)
+        finally:
+            log.removeHandler(handler)
+            handler.close()
+
+        names = [s["name"] for s in self.storage.segments()]
+        self.assertEqual(names, ["SberGate.log", "SberGate.log.1.gz", "SberGate.log.2.gz"])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), sorted(names))
+        with gzip.open(self.storage.segment_path("SberGate.log.1.gz"), "rt", encoding="utf-8") as file:
+            self.assertTrue(file.read().startswith("HA Event: light.room_"))
+        self.assertIn("HA Event: light.room_199", open(self.log_file, encoding="utf-8").read())
+
+    def test_segment_path_is_restricted(self):
+        self.write("line\n")
+        self.assertEqual(self.storage.segment_path("SberGate.log"), self.log_file)
+        self.assertIsNone(self.storage.segment_path("../options.json"))
+        self.assertIsNone(self.storage.segment_path("SberGate.log.1.gz"))
+
+
+class TestTail(LogStorageTestCase):
+    def test_follow(self):
+        self.write("".join(f"line {i}\n" for i in range(100)))
+        first = self.storage.tail(limit=30)
+        self.assertTrue(first["data"].endswith("line 99\n"))
+        self.assertTrue(first["data"].startswith("line "))
+        self.assertEqual(first["offset"], os.path.getsize(self.log_file))
+
+        self.write("line 100\nline 101\n")
+        update = self.storage.tail(first["offset"])
+        self.assertEqual(update["data"], "line 100\nline 101\n")
+        self.assertFalse(update["reset"])
+
+        empty = self.storage.tail(update["offset"], wait=1)
+        self.assertEqual(empty["data"], "")
+        self.assertEqual(empty["offset"], update["offset"])
+        self.assertGreaterEqual(self.clock.now, 101)
+
+    def test_limit_returns_whole_lines(self):
+        self.write("".join(f"line {i}\n" for i in range(10)))
+        chunk = self.storage.tail(0, limit=15)
+        self.assertEqual(chunk["data"], "line 0\nline 1\n")
+        self.assertEqual(self.storage.tail(chunk["offset"], limit=15)["data"], "line 2\nline 3\n")
+
+    def test_reset_after_rotation(self):
+        self.write("old line\n" * 10)
+        offset = self.storage.tail()["offset"]
+        self.write("new line\n", mode="w")
+        result = self.storage.tail(offset)
+        self.assertTrue(result["reset"])
+        self.assertEqual(result["data"], "new line\n")
+
+    def test_reset_after_rotation_to_larger_file(self):
+        self.write("old line\n")
+        first = self.storage.tail()
+        os.rename(self.log_file, self.log_file + ".1")
+        self.write("new line\n" * 10)
+        result = self.storage.tail(first["offset"], file_id=first["file_id"])
+        self.assertTrue(result["reset"])
+        self.assertEqual(result["data"], "new line\n" * 10)
+        self.assertFalse(self.storage.tail(result["offset"], file_id=result["file_id"])["reset"])
+
+
+class TestByteRange(unittest.TestCase):
+    def test_parse(self):
+        self.assertIsNone(parse_byte_range(None, 100))
+        self.assertIsNone(parse_byte_range("bytes=0-1,5-6", 100))
+        self.assertEqual(parse_byte_range("bytes=10-19", 100), (10, 19))
+        self.assertEqual(parse_byte_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_byte_range("bytes=-5", 100), (95, 99))
+        self.assertEqual(parse_byte_range("bytes=50-500", 100), (50, 99))
+        with self.assertRaises(ValueError):
+            parse_byte_range("bytes=100-", 100)
+
+
+class TestLogEndpoints(LogStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = "".join(f"2025-01-01 00:00:00 INFO: line {i}\n" for i in range(5000))
+        self.write(self.content)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *args, **kwargs: MyServer(
+            *args, devices_db=None, mqttc=None, sber_root_topic="", options=OPTIONS, log_storage=self.storage, **kwargs))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def request(self, path, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response, body
+
+    def test_download_and_range(self):
+        data = self.content.encode("utf-8")
+        response, body = self.request("/SberGate.log")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, data)
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+
+        response, body = self.request("/SberGate.log", {"Range": "bytes=100-"})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, data[100:])
+        self.assertEqual(response.getheader("Content-Range"), f"bytes 100-{len(data) - 1}/{len(data)}")
+
+        response, _ = self.request("/SberGate.log", {"Range": f"bytes={len(data)}-"})
+        self.assertEqual(response.status, 416)
+
+    def test_tail_and_listing(self):
+        response, body = self.request("/api/v2/logs/tail?limit=100")
+        tail = json.loads(body)
+        self.assertTrue(tail["data"].endswith("line 4999\n"))
+        self.write("next\n")
+        response, body = self.request(f"/api/v2/logs/tail?offset={tail['offset']}&file_id={tail['file_id']}")
+        self.assertEqual(json.loads(body)["data"], "next\n")
+
+        response, body = self.request("/api/v2/logs")
+        self.assertEqual([s["name"] for s in json.loads(body)["segments"]], ["SberGate.log"])
+        response, _ = self.request("/api/v2/logs/..%2Foptions.json")
+        self.assertEqual(response.status, 404)
+        response, _ = self.request("/api/v2/logs/tail?offset=x")
+        self.assertEqual(response.status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
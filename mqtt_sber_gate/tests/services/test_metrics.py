@@ -0,0 +1,104 @@
+import http.client
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from fakes.common import OPTIONS, FakeDevicesDb, FakeEntity, FakePublisher, WorkdirTestCase, state_changed
+from http_server import MyServer
+from metrics import Counter, Histogram, MetricsRegistry
+from web_socket_handler import WebSocketHandler
+
+HANDLER_OPTIONS = OPTIONS | {'ha-event_subscription': "all", 'ha-event_ignore': ["sensor.noise*"]}
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_render(self):
+        events = self.registry.counter("ha_events_total", "События HA", ("result",))
+        events.labels("processed").inc()
+        events.labels("processed").inc()
+        events.labels("filtered").inc()
+        commands = self.registry.counter("sber_commands_total", "Команды")
+        self.assertIsInstance(commands, Counter)
+        commands.inc(3)
+        self.registry.gauge("queue_depth", "Очередь", func=lambda: 7)
+        latency = self.registry.histogram("latency_milliseconds", "Задержка", buckets=(1, 10))
+        latency.observe(0.5)
+        latency.observe(20)
+
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE sber_gate_ha_events_total counter", lines)
+        self.assertIn('sber_gate_ha_events_total{result="processed"} 2', lines)
+        self.assertIn('sber_gate_ha_events_total{result="filtered"} 1', lines)
+        self.assertIn("sber_gate_sber_commands_total 3", lines)
+        self.assertIn("sber_gate_queue_depth 7", lines)
+        self.assertIn('sber_gate_latency_milliseconds_bucket{le="1"} 1', lines)
+        self.assertIn('sber_gate_latency_milliseconds_bucket{le="10"} 1', lines)
+        self.assertIn('sber_gate_latency_milliseconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("sber_gate_latency_milliseconds_sum 20.5", lines)
+        self.assertIn("sber_gate_latency_milliseconds_count 2", lines)
+
+    def test_component_metrics_and_escaping(self):
+        histogram = Histogram()
+        histogram.observe(3)
+        self.registry.histogram("ha_command_milliseconds", "Команды", ("service",), func=lambda: {('light.turn_on "x"',): histogram})
+        self.assertIn('sber_gate_ha_command_milliseconds_count{service="light.turn_on \\"x\\""} 1', self.registry.render())
+
+    def test_same_name_returns_same_metric(self):
+        self.assertIs(self.registry.counter("x_total", "x"), self.registry.counter("x_total", "x"))
+        with self.assertRaises(ValueError):
+            self.registry.counter("y_total", "y", ("a",)).labels("1", "2")
+
+
+class TestHandlerMetrics(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = MetricsRegistry()
+        self.handler = WebSocketHandler(FakeDevicesDb({"light.kitchen": FakeEntity()}), None, None, HANDLER_OPTIONS, FakePublisher(),
+                                        metrics=self.metrics)
+
+    def test_events_are_counted(self):
+        self.handler.on_message(None, state_changed("light.kitchen"))
+        self.handler.on_message(None, state_changed("light.kitchen"))
+        self.handler.on_message(None, state_changed("sensor.noise_level"))
+        self.handler.on_message(None, state_changed("sensor.unknown"))
+        lines = self.metrics.render().splitlines()
+        self.assertIn('sber_gate_ha_events_total{result="processed"} 2', lines)
+        self.assertIn('sber_gate_ha_frames_total{result="skipped"} 2', lines)
+        self.assertIn("sber_gate_ha_event_processing_milliseconds_count 2", lines)
+        self.assertIn("sber_gate_ha_websocket_connected 0", lines)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.metrics.counter("sber_commands_total", "Команды").inc()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *args, **kwargs: MyServer(
+            *args, devices_db=None, mqttc=None, sber_root_topic="", options=OPTIONS, metrics=self.metrics, **kwargs))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, path):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        body = response.read().decode("utf-8")
+        connection.close()
+        return response, body
+
+    def test_metrics(self):
+        self.request("/api/v2/snapshots/missing")
+        response, body = self.request("/metrics")
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.getheader("Content-type").startswith("text/plain; version=0.0.4"))
+        self.assertIn("sber_gate_sber_commands_total 1", body)
+        self.assertIn('sber_gate_http_requests_total{method="GET",code="404"} 1', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import time
+import unittest
+
+from devices_db import EntitiesStore
+from fakes.common import WorkdirTestCase
+from persistence import WriteBehindWriter, atomic_write_json
+
+
+class CountingWriter(WriteBehindWriter):
+    """Считает физические записи файлов"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written = []
+
+    def flush(self):
+        with self._condition:
+            self.written.extend(self._pending)
+        return super().flush()
+
+
+class TestWriteBehind(WorkdirTestCase):
+    def read(self, path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def test_atomic_write_leaves_no_temp_file(self):
+        atomic_write_json("a.json", {"a": 1})
+        atomic_write_json("a.json", {"a": 2})
+        self.assertEqual(self.read("a.json"), {"a": 2})
+        self.assertEqual(os.listdir("."), ["a.json"])
+
+    def test_not_started_writes_immediately(self):
+        writer = WriteBehindWriter()
+        writer.schedule("a.json", [1])
+        self.assertEqual(self.read("a.json"), [1])
+
+    def test_bulk_enable_is_one_write(self):
+        writer = CountingWriter(delay=0.05, max_delay=1)
+        writer.start()
+        store = EntitiesStore(logging.getLogger(__name__), writer)
+        for i in range(200):
+            store.enable_entity(f"light.l{i}")
+            store.save()
+        self.assertFalse(os.path.exists("enabled_entities.json"))
+        deadline = time.monotonic() + 2
+        while not os.path.exists("enabled_entities.json") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        writer.stop()
+        self.assertEqual(len(self.read("enabled_entities.json")), 200)
+        self.assertEqual(sorted(writer.written), ["enabled_entities.json", "store_placements.json"])
+        self.assertEqual(writer.stats()["writes"], 2)
+
+    def test_stop_flushes_pending(self):
+        writer = WriteBehindWriter(delay=60, max_delay=60)
+        writer.start()
+        writer.schedule("a.json", {"a": 1})
+        writer.schedule("a.json", {"a": 2})
+        writer.stop()
+        self.assertEqual(self.read("a.json"), {"a": 2})
+        self.assertEqual(writer.stats(), {"scheduled": 2, "writes": 1, "write_errors": 0, "pending": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sber_api_client import SberApiClient, parse_ttl_rules
+
+
+class FakeSberHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.received.append((self.path, self.headers.get('Authorization'), self.headers.get('If-None-Match')))
+        time.sleep(server.delay)
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = b'{"models": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSberApiClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSberHandler)
+        self.server.received = []
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.options = {
+            'sber-http_api_endpoint': f"http://127.0.0.1:{self.server.server_address[1]}",
+            'sber-mqtt_login': "user",
+            'sber-mqtt_password': "password",
+            'sber-api_cache_ttl': ["models=60", "categories/light=0.01"],
+        }
+        self.client = SberApiClient(self.options)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_ttl_rules(self):
+        rules = parse_ttl_rules(["categories=60", "categories/light=5", "*=1", "broken"])
+        self.assertEqual(rules, [("categories/light", 5.0), ("categories", 60.0), ("", 1.0)])
+        self.assertEqual(self.client.ttl_for("models"), 60)
+        self.assertEqual(self.client.ttl_for("objects"), 0)
+
+    def test_cached_response(self):
+        first = self.client.get("models")
+        second = self.client.get("models")
+        self.assertEqual(first.status_code, 200)
+        self.assertIs(first, second)
+        self.assertEqual(len(self.server.received), 1)
+        path, authorization, _ = self.server.received[0]
+        self.assertEqual(path, "/v1/mqtt-gate/models")
+        self.assertTrue(authorization.startswith("Basic "))
+        self.assertEqual(self.client.stats()["hits"], 1)
+
+    def test_uncached_path(self):
+        self.client.get("objects")
+        self.client.get("objects")
+        self.assertEqual(len(self.server.received), 2)
+
+    def test_revalidation_with_etag(self):
+        self.client.get("categories/light/features")
+        time.sleep(0.02)
+        response = self.client.get("categories/light/features")
+        self.assertEqual(response.text, '{"models": []}')
+        self.assertEqual(self.server.received[1][2], '"v1"')
+        self.assertEqual(self.client.stats()["revalidated"], 1)
+
+    def test_concurrent_requests_are_coalesced(self):
+        self.server.delay = 0.2
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.client.get("models"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.received), 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.client.stats()["coalesced"], 4)
+
+    def test_unavailable(self):
+        self.options['sber-http_api_endpoint'] = "http://127.0.0.1:1"
+        self.assertIsNone(self.client.get("models"))
+        self.assertEqual(self.client.stats()["errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
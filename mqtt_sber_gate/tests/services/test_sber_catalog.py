@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fakes.common import WorkdirTestCase
+from sber_api_client import SberApiClient
+from sber_catalog import SberCatalog
+
+CATEGORIES = ["light", "relay", "curtain", "sensor_temp"]
+
+
+class FakeSberHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.received.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+
+        if self.path == "/v1/mqtt-gate/categories":
+            if server.failures > 0:
+                server.failures -= 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.headers.get('If-None-Match') == server.etag:
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = {"categories": server.categories}
+        else:
+            category = self.path.split("/")[-2]
+            data = {"features": ["online", category]}
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSberCatalog(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSberHandler)
+        self.server.received = []
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0.05
+        self.server.etag = '"v1"'
+        self.server.failures = 0
+        self.server.categories = list(CATEGORIES)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = SberApiClient({
+            'sber-http_api_endpoint': f"http://127.0.0.1:{self.server.server_address[1]}",
+            'sber-mqtt_login': "user",
+            'sber-mqtt_password': "password",
+        })
+
+    def tearDown(self):
+        self.api.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_parallel_fetch_and_disk_cache(self):
+        catalog = SberCatalog(self.api)
+        self.assertIsNone(catalog.load_cached())
+        categories = catalog.refresh()
+        self.assertEqual(categories, {c: ["online", c] for c in CATEGORIES})
+        self.assertGreater(self.server.max_active, 1)
+        with open("categories.json", encoding="utf-8") as file:
+            self.assertEqual(json.load(file), categories)
+
+        restarted = SberCatalog(self.api)
+        self.assertEqual(restarted.load_cached(), categories)
+        self.assertEqual(restarted.etag, '"v1"')
+        self.assertEqual(restarted.version, catalog.version)
+
+    def test_unchanged_catalog_is_not_refetched(self):
+        SberCatalog(self.api).refresh()
+        self.server.received.clear()
+        catalog = SberCatalog(self.api)
+        catalog.load_cached()
+        self.assertIsNone(catalog.refresh())
+        self.assertEqual(self.server.received, ["/v1/mqtt-gate/categories"])
+
+    def test_background_refresh_reports_changes(self):
+        SberCatalog(self.api).refresh()
+        self.server.etag = '"v2"'
+        self.server.categories = CATEGORIES + ["kettle"]
+        catalog = SberCatalog(self.api)
+        self.assertIn("light", catalog.load_cached())
+        updates = []
+        catalog.refresh_in_background(lambda: None, updates.append).join(5)
+        self.assertEqual(len(updates), 1)
+        self.assertIn("kettle", updates[0])
+        self.assertEqual(catalog.source, "cloud")
+
+    def test_retry_until_cloud_is_available(self):
+        self.server.failures = 2
+        catalog = SberCatalog(self.api)
+        self.assertIsNone(catalog.refresh())
+        updates = []
+        catalog.retry_in_background(updates.append, interval=0.01).join(5)
+        self.assertEqual(updates, [{c: ["online", c] for c in CATEGORIES}])
+        self.assertEqual(self.server.failures, 0)
+
+    def test_old_cache_format_is_ignored(self):
+        with open("categories.json", "w", encoding="utf-8") as file:
+            json.dump({"categories": ["light"]}, file)
+        self.assertIsNone(SberCatalog(self.api).load_cached())
+
+
+if __name__ == '__main__':
+    unittest.main()
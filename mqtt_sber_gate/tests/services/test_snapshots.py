@@ -0,0 +1,56 @@
+import json
+import os
+import unittest
+
+from fakes.common import WorkdirTestCase
+from snapshots import SnapshotService
+
+
+class TestSnapshotService(WorkdirTestCase):
+    def test_capture_does_not_write(self):
+        snapshots = SnapshotService(history=2)
+        for i in range(3):
+            snapshots.capture("new_states_list.json", {"n": i})
+        self.assertFalse(os.path.exists("new_states_list.json"))
+        self.assertEqual([s.data for s in snapshots.get_history("new_states_list.json")], [{"n": 1}, {"n": 2}])
+        self.assertEqual(snapshots.latest("new_states_list.json").data, {"n": 2})
+        self.assertIsNone(snapshots.latest("unknown.json"))
+
+    def test_flush_writes_latest_once(self):
+        snapshots = SnapshotService()
+        snapshots.capture("a.json", {"n": 1})
+        snapshots.capture("a.json", {"n": 2})
+        snapshots.capture("b.json", [1])
+        self.assertEqual(sorted(snapshots.flush()), ["a.json", "b.json"])
+        with open("a.json", encoding="utf-8") as file:
+            self.assertEqual(json.load(file), {"n": 2})
+        # Без новых снимков повторная запись не выполняется
+        self.assertEqual(snapshots.flush(), [])
+        self.assertEqual(snapshots.stats()["written"], 2)
+
+    def test_flush_on_demand_by_name(self):
+        snapshots = SnapshotService(interval=0)
+        snapshots.capture("a.json", 1)
+        snapshots.capture("b.json", 2)
+        self.assertEqual(snapshots.flush(["b.json", "missing.json"]), ["b.json"])
+        self.assertEqual(snapshots.stats()["dirty"], 1)
+        self.assertIsNotNone(snapshots.index()["b.json"]["written_at"])
+        self.assertIsNone(snapshots.index()["a.json"]["written_at"])
+
+    def test_stop_flushes(self):
+        snapshots = SnapshotService(interval=3600)
+        snapshots.start()
+        snapshots.capture("a.json", {"n": 1})
+        snapshots.stop()
+        self.assertTrue(os.path.exists("a.json"))
+
+    def test_stop_flushes_without_writer_thread(self):
+        snapshots = SnapshotService(interval=0)
+        snapshots.start()
+        snapshots.capture("a.json", {"n": 1})
+        snapshots.stop()
+        self.assertTrue(os.path.exists("a.json"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import unittest
+
+from fakes.common import FakeClock
+from startup import StartupOrchestrator
+
+
+class TestStartupOrchestrator(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.startup = StartupOrchestrator(("mqtt", "endpoint", "registries"), clock=self.clock)
+
+    def test_phase_timings(self):
+        self.clock.now += 0.1
+        self.startup.begin("registries")
+        self.clock.now += 0.2
+        self.startup.done("mqtt")
+        self.clock.now += 0.3
+        self.startup.done("registries")
+        stats = self.startup.stats()
+        self.assertEqual(stats["phases"]["mqtt"], {"started_ms": 0.0, "duration_ms": 300.0, "done": True})
+        self.assertEqual(stats["phases"]["registries"], {"started_ms": 100.0, "duration_ms": 500.0, "done": True})
+        self.assertEqual(stats["phases"]["endpoint"]["done"], False)
+        self.assertFalse(stats["done"])
+
+        self.clock.now += 0.4
+        self.startup.done("endpoint")
+        self.clock.now += 5
+        stats = self.startup.stats()
+        self.assertTrue(stats["done"])
+        self.assertEqual(stats["total_ms"], 1000.0)
+
+    def test_call_when_done(self):
+        calls = []
+        self.startup.call_when_done(("mqtt", "registries"), lambda: calls.append("config"))
+        self.startup.done("mqtt")
+        self.startup.done("mqtt")
+        self.assertEqual(calls, [])
+        self.startup.done("registries")
+        self.assertEqual(calls, ["config"])
+        self.startup.call_when_done(("mqtt",), lambda: calls.append("now"))
+        self.assertEqual(calls, ["config", "now"])
+
+    def test_wait_and_background_phase(self):
+        release = threading.Event()
+
+        def load():
+            release.wait(5)
+            self.startup.done("endpoint")
+
+        thread = self.startup.run_in_background("endpoint", load)
+        self.assertFalse(self.startup.wait("endpoint", 0.01))
+        release.set()
+        self.assertTrue(self.startup.wait("endpoint", 5))
+        thread.join(5)
+        self.assertTrue(self.startup.is_done("endpoint"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import time
+import unittest
+
+from fakes.common import FakeDevicesDb, FakeMqttClient
+from state_publisher import StatePublisher
+
+
+class TestStatePublisher(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDevicesDb()
+        self.mqttc = FakeMqttClient()
+        self.publisher = StatePublisher(self.db, self.mqttc, "sberdevices/v1/user", window_ms=50)
+
+    def tearDown(self):
+        self.publisher.stop()
+
+    def test_flush_coalesces_dirty_entities(self):
+        """Несколько изменений одной сущности и разных сущностей уходят одним сообщением"""
+        self.publisher.mark_dirty("light.a")
+        self.publisher.mark_dirty("light.b")
+        self.publisher.mark_dirty("light.a")
+
+        self.assertEqual(self.publisher.flush(), 2)
+        self.assertEqual(self.db.requests, [["light.a", "light.b"]])
+        self.assertEqual(len(self.mqttc.published), 1)
+        topic, payload = self.mqttc.published[0]
+        self.assertEqual(topic, "sberdevices/v1/user/up/status")
+        self.assertEqual(set(json.loads(payload)["devices"].keys()), {"light.a", "light.b"})
+
+    def test_flush_without_changes_publishes_nothing(self):
+        self.assertEqual(self.publisher.flush(), 0)
+        self.assertEqual(self.mqttc.published, [])
+
+    def test_not_ready_db_is_not_published(self):
+        self.db.ready = False
+        self.publisher.mark_dirty("light.a")
+        self.assertEqual(self.publisher.flush(), 0)
+        self.assertEqual(self.mqttc.published, [])
+        self.assertEqual(self.publisher.pending_count(), 1)
+
+    def test_changes_are_kept_until_db_is_ready(self):
+        self.db.ready = False
+        self.publisher.mark_dirty("light.a")
+        self.publisher.flush()
+        self.publisher.mark_dirty("light.b")
+        self.db.ready = True
+        self.assertEqual(self.publisher.flush(), 2)
+        self.assertEqual(self.db.requests, [["light.a", "light.b"]])
+        self.assertEqual(self.publisher.pending_count(), 0)
+
+    def test_marked_before_ready_is_published_once_ready(self):
+        """Сущность, отмеченная до готовности базы, публикуется без других событий"""
+        self.db.ready = False
+        self.publisher.start()
+        self.publisher.mark_dirty("light.a")
+        time.sleep(0.1)
+        self.assertEqual(self.mqttc.published, [])
+
+        self.db.set_ready()
+        deadline = time.monotonic() + 2
+        while not self.mqttc.published and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.db.requests, [["light.a"]])
+        self.assertEqual(len(self.mqttc.published), 1)
+
+    def test_background_thread_publishes_batch(self):
+        self.publisher.start()
+        for i in range(20):
+            self.publisher.mark_dirty(f"light.l{i % 5}")
+
+        deadline = time.monotonic() + 2
+        while not self.mqttc.published and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(len(self.mqttc.published), 1)
+        self.assertEqual(self.publisher.stats()["published_entities"], 5)
+
+    def test_stop_flushes_pending(self):
+        self.publisher.mark_dirty("cover.c")
+        self.publisher.stop()
+        self.assertEqual(len(self.mqttc.published), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import gzip
+import http.client
+import os
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from fakes.common import OPTIONS
+from http_server import MyServer, ext_mime_types
+from static_cache import StaticAssetCache, CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE
+
+SCRIPT = ("console.log('Интеграция с умным домом Сбер');\n" * 100).encode("utf-8")
+
+
+class TestStaticAssetCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "main.js")
+        with open(self.path, "wb") as file:
+            file.write(SCRIPT)
+        self.cache = StaticAssetCache(ext_mime_types)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_asset_is_cached_and_compressed(self):
+        asset = self.cache.get("/static/js/main.js", self.path)
+        self.assertIs(self.cache.get("/static/js/main.js", self.path), asset)
+        self.assertEqual(asset.mime_type, "text/javascript; charset=utf-8")
+        self.assertEqual(asset.cache_control, CACHE_CONTROL_IMMUTABLE)
+        self.assertEqual(gzip.decompress(asset.encodings["gzip"]), SCRIPT)
+        self.assertEqual(self.cache.stats()["loads"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_reloaded_when_file_changes(self):
+        asset = self.cache.get("/ui2/main.js", self.path)
+        self.assertEqual(asset.cache_control, CACHE_CONTROL_REVALIDATE)
+        with open(self.path, "wb") as file:
+            file.write(b"changed")
+        os.utime(self.path, (asset.mtime + 10, asset.mtime + 10))
+        changed = self.cache.get("/ui2/main.js", self.path)
+        self.assertEqual(changed.body, b"changed")
+        self.assertNotEqual(changed.etag, asset.etag)
+        self.assertEqual(changed.encodings, {})
+
+    def test_conditional_requests(self):
+        asset = self.cache.get("/ui2/main.js", self.path)
+        self.assertTrue(asset.not_modified(asset.etag, None))
+        self.assertFalse(asset.not_modified('"other"', asset.last_modified))
+        self.assertTrue(asset.not_modified(None, asset.last_modified))
+        self.assertFalse(asset.not_modified(None, "garbage"))
+
+    def test_missing_file(self):
+        self.assertIsNone(self.cache.get("/x", os.path.join(self.tmp_dir.name, "missing.js")))
+
+
+class TestServeStatic(unittest.TestCase):
+    def setUp(self):
+        # Пути static_request заданы относительно каталога приложения
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), "..", "..", "rootfs", "app"))
+        self.cache = StaticAssetCache(ext_mime_types)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *args, **kwargs: MyServer(
+            *args, devices_db=None, mqttc=None, sber_root_topic="", options=OPTIONS, static_cache=self.cache, **kwargs))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+
+    def request(self, path, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response, body
+
+    def test_gzip_and_not_modified(self):
+        response, body = self.request("/ui2/main.js", {"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        with open("../app/ui2/main.js", "rb") as file:
+            self.assertEqual(gzip.decompress(body), file.read())
+
+        response, body = self.request("/ui2/main.js", {"If-None-Match": response.getheader("ETag")})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b"")
+
+    def test_uncompressed_for_plain_clients(self):
+        response, body = self.request("/ui2/main.css")
+        self.assertEqual(response.status, 200)
+        self.assertIsNone(response.getheader("Content-Encoding"))
+        self.assertEqual(int(response.getheader("Content-Length")), len(body))
+
+
+if __name__ == '__main__':
+    unittest.main()
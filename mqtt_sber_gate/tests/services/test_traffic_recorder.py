@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+from fakes.common import OPTIONS, FakeClock, FakeDevicesDb, FakeExecutor, FakeMessage, FakeMqttClient, WorkdirTestCase, state_changed
+from sber_mqtt_handlers import SberMqttHandlers
+from traffic_recorder import TrafficRecorder, read_traffic, write_traffic, SOURCE_HA, SOURCE_SBER
+from web_socket_handler import WebSocketHandler
+
+HANDLER_OPTIONS = OPTIONS | {'ha-event_subscription': "all", 'ha-event_ignore': ["sensor.noise*"]}
+
+
+class TestTrafficRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "traffic.jsonl.gz")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_record_and_read(self):
+        recorder = TrafficRecorder(self.path, clock=self.clock)
+        received = []
+        callback = recorder.wrap_mqtt_callback(lambda client, userdata, msg: received.append(msg.topic))
+        recorder.start()
+        recorder.record_ha('{"type":"auth_ok"}')
+        self.clock.now += 0.25
+        callback(None, None, FakeMessage("sberdevices/v1/user/down/status_request", '{"devices":[]}'.encode("utf-8")))
+        recorder.stop()
+
+        self.assertEqual(received, ["sberdevices/v1/user/down/status_request"])
+        self.assertEqual(list(read_traffic(self.path)), [
+            (0, SOURCE_HA, None, '{"type":"auth_ok"}'),
+            (250, SOURCE_SBER, "sberdevices/v1/user/down/status_request", '{"devices":[]}'),
+        ])
+        self.assertEqual(recorder.stats()["recorded"], 2)
+        self.assertFalse(recorder.stats()["recording"])
+
+    def test_size_limit(self):
+        recorder = TrafficRecorder(self.path, max_bytes=100, clock=self.clock)
+        recorder.start()
+        for i in range(10):
+            recorder.record_ha(f'{{"id":{i},"type":"result"}}')
+        recorder.stop()
+        records = list(read_traffic(self.path))
+        self.assertTrue(recorder.limit_reached)
+        self.assertEqual(recorder.recorded, len(records))
+        self.assertEqual(recorder.recorded + recorder.dropped, 10)
+        self.assertLessEqual(recorder.written_bytes, 100)
+
+    def test_not_started(self):
+        recorder = TrafficRecorder(self.path, clock=self.clock)
+        recorder.record_ha("frame")
+        recorder.stop()
+        self.assertEqual(recorder.stats()["recorded"], 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_plain_file(self):
+        path = os.path.join(self.tmp_dir.name, "traffic.jsonl")
+        write_traffic(path, [(1.5, SOURCE_HA, None, "кадр")])
+        self.assertEqual(list(read_traffic(path)), [(1.5, SOURCE_HA, None, "кадр")])
+
+
+class TestWebSocketRecording(WorkdirTestCase):
+    def test_skipped_frames_are_recorded(self):
+        recorder = TrafficRecorder("traffic.jsonl.gz", clock=FakeClock())
+        handler = WebSocketHandler(FakeDevicesDb(), None, None, HANDLER_OPTIONS, recorder=recorder)
+        frame = state_changed("sensor.noise_level")
+        recorder.start()
+        handler.on_message(None, frame)
+        recorder.stop()
+        self.assertEqual(handler.frames_skipped, 1)
+        self.assertEqual([record[3] for record in read_traffic("traffic.jsonl.gz")], [frame])
+
+
+class TestSberMqttHandlers(unittest.TestCase):
+    def setUp(self):
+        self.mqttc = FakeMqttClient()
+        self.executor = FakeExecutor()
+        self.handlers = SberMqttHandlers(FakeDevicesDb(), None, self.executor, "sberdevices/v1/user")
+        self.callbacks = self.handlers.callbacks()
+
+    def call(self, suffix, payload):
+        topic = "sberdevices/v1/user/down/" + suffix
+        self.callbacks[topic](self.mqttc, None, FakeMessage(topic, payload.encode("utf-8")))
+
+    def test_status_request(self):
+        self.call("status_request", '{"devices":["light.room"]}')
+        self.call("status_request", '{"devices":[""]}')
+        self.assertEqual(self.mqttc.published, [
+            ("sberdevices/v1/user/up/status", '{"devices": ["light.room"]}'),
+            ("sberdevices/v1/user/up/status", '{"devices": []}'),
+        ])
+        self.assertEqual(self.handlers.status_requests.value, 2)
+
+    def test_commands_and_config(self):
+        self.call("commands", '{"devices":{"light.a":{"states":[]},"light.b":{"states":[]}}}')
+        self.assertEqual(self.executor.submitted, ["light.a", "light.b"])
+        self.assertEqual(self.handlers.commands_received.value, 2)
+        # Без этапов запуска конфигурация отправляется сразу
+        self.call("config_request", "")
+        self.assertEqual(self.mqttc.published, [("sberdevices/v1/user/up/config", "config")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import json
+import unittest
+
+from fakes.common import OPTIONS, FakeDevicesDb, FakeEntity, FakePublisher, WorkdirTestCase, state_changed
+from web_socket_handler import WebSocketHandler
+from ws_frame import peek_frame, FrameHeader
+
+HANDLER_OPTIONS = OPTIONS | {'ha-event_subscription': "all"}
+GROUP_ATTRIBUTES = {"entity_id": ["light.a", "light.b"]}
+
+
+class TestPeekFrame(unittest.TestCase):
+    def test_state_changed(self):
+        self.assertEqual(peek_frame(state_changed("light.group", GROUP_ATTRIBUTES)), FrameHeader("event", "state_changed", "light.group"))
+
+    def test_result_is_not_scanned(self):
+        result = json.dumps({"id": 5, "type": "result", "success": True, "result": [{"entity_id": "sensor.x"}]})
+        self.assertEqual(peek_frame(result), FrameHeader("result", None, None))
+
+    def test_trigger_event(self):
+        message = json.dumps({"id": 7, "type": "event", "event": {"variables": {"trigger": {
+            "platform": "state", "entity_id": "light.a", "from_state": None, "to_state": None}}}})
+        self.assertEqual(peek_frame(message), FrameHeader("event", None, "light.a"))
+
+    def test_unparsable(self):
+        self.assertEqual(peek_frame("garbage"), FrameHeader(None, None, None))
+
+
+class TestHandlerPreparse(WorkdirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = FakeEntity()
+        self.handler = WebSocketHandler(FakeDevicesDb({"light.group": self.group}), None, None, HANDLER_OPTIONS, FakePublisher())
+
+    def test_unknown_entity_is_not_decoded(self):
+        self.handler.on_message(None, state_changed("sensor.power_meter"))
+        self.handler.on_message(None, state_changed("light.group", GROUP_ATTRIBUTES))
+        self.assertEqual(self.handler.frame_stats(), {"decoded": 1, "skipped": 1})
+        self.assertEqual(len(self.group.states), 1)
+
+    def test_other_event_types_are_not_decoded(self):
+        message = json.dumps({"id": 1, "type": "event", "event": {"event_type": "call_service", "data": {}}})
+        self.handler.on_message(None, message)
+        self.assertEqual(self.handler.frame_stats()["skipped"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()